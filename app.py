@@ -1,13 +1,101 @@
+import os
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from text_processing_251029 import router
+from reference_cache import reference_cache
+from reference_snapshot import get_snapshot
+from mongo_client import get_client, close_client, ping
+from db_to_dataframe import check_reference_indexes
+from llm_concurrency import concurrency_snapshot
+from output_sink import get_sink, close_sink
+from result_store import get_result_store
+from single_flight import single_flight_stats
+from metrics import render as render_metrics
+from job_queue import router as job_router, start_workers, stop_workers
 
-app = FastAPI(title="Text Processing Pipeline Demo API", version="1.0.0")
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 啟動時開啟參考資料快照（若有設定）、建立共用 MongoDB 連線池並檢查參考表索引、啟動 job worker，
+    # 關閉時停止 worker、寫完待輸出的結果並釋放
+    get_snapshot()
+    if os.getenv('MONGODB_URI', ''):
+        get_client()
+        try:
+            check_reference_indexes()
+        except Exception as e:
+            logger.warning(f"索引檢查失敗: {e}")
+    start_workers()
+    yield
+    stop_workers()
+    close_sink()
+    close_client()
+
+
+app = FastAPI(title="Text Processing Pipeline Demo API", version="1.0.0", lifespan=lifespan)
 app.include_router(router)
+app.include_router(job_router)
 
 @app.get("/")
 async def root():
     return {"message": "Text Processing Pipeline Demo API is running"}
 
+# 相依服務健康檢查（MongoDB ping）
+@app.get("/health")
+def health():
+    return {"mongodb": ping()}
+
+# 參考資料快取命中統計與目前使用的快照版本
+@app.get("/cache/reference")
+async def reference_cache_stats():
+    snapshot = get_snapshot()
+    return {**reference_cache.stats(), 'snapshot': snapshot.info() if snapshot else None}
+
+# 清除參考資料快取（可指定 table：item_meta / item_group_map / diag / summary）
+@app.post("/cache/reference/invalidate")
+async def reference_cache_invalidate(table: Optional[str] = None):
+    reference_cache.invalidate(table)
+    return reference_cache.stats()
+
+# 報告 result store 筆數與命中統計（RESULT_STORE_ENABLED=0 時為 null）
+@app.get("/cache/results")
+async def result_store_stats():
+    store = get_result_store()
+    return store.stats() if store else None
+
+# 清除 result store（例如 MongoDB 參考表更新但未遞增 REFERENCE_DATA_VERSION 時）
+@app.post("/cache/results/invalidate")
+async def result_store_invalidate():
+    store = get_result_store()
+    if store:
+        store.clear()
+    return store.stats() if store else None
+
+# single-flight 合併統計（reference 查詢 / LLM 改寫：執行次數、合併次數與目前 in-flight 數）
+@app.get("/singleflight")
+async def single_flight():
+    return single_flight_stats()
+
+# LLM 自適應並行控制：各部署目前上限與近期調整紀錄
+@app.get("/llm/concurrency")
+async def llm_concurrency():
+    return concurrency_snapshot()
+
+# 背景輸出的設定與寫出/捨棄/失敗計數
+@app.get("/output/sink")
+async def output_sink_stats():
+    return get_sink().stats()
+
+# Prometheus 指標（pipeline 各段、MongoDB 查詢與 LLM 呼叫）
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="127.0.0.1", port=8000)
@@ -0,0 +1,218 @@
+"""
+離線批次處理（JSONL，每行一個 record）：
+- 依 --chunk-size 分塊讀取輸入檔，各 chunk 交由 process pool 的 worker 執行
+  db_to_dataframe -> postprocess_multilang -> text_processing
+- 每個 chunk 完成後由 worker 寫出 chunk_XXXXXX.jsonl（先寫暫存檔再 rename），輸出檔存在即視為已完成；
+  中斷後以相同參數重跑，會略過已完成的 chunk（checkpoint 記錄於輸出目錄的 manifest.json）
+- chunk 處理失敗時改為逐筆處理，只有出錯的 record 輸出 {record_id, error}；
+  出錯的 record 另記錄於 chunk_XXXXXX.failed.jsonl，重跑時只重試這些 record 並取代輸出檔中對應的行
+- LLM_RPM_LIMIT / LLM_TPM_LIMIT 為整個批次的上限，平均分配給各 worker
+
+用法：python batch_runner.py INPUT.jsonl --output-dir DIR [--chunk-size N] [--workers N] [--restart]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Dict, Iterator, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = 'manifest.json'
+
+
+def iter_chunks(path: str, chunk_size: int) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+    """
+    逐行讀取 JSONL，每 chunk_size 筆 record 產生一個 (chunk 序號, records)；一行為 list 時視為多筆 record
+    """
+    chunk, index = [], 0
+    with open(path, encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                payload = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path} 第 {line_no} 行不是合法 JSON: {e}")
+            chunk.extend(payload if isinstance(payload, list) else [payload])
+            while len(chunk) >= chunk_size:
+                yield index, chunk[:chunk_size]
+                chunk, index = chunk[chunk_size:], index + 1
+    if chunk:
+        yield index, chunk
+
+
+def chunk_path(output_dir: str, index: int) -> str:
+    return os.path.join(output_dir, f'chunk_{index:06d}.jsonl')
+
+
+def failed_path(output_dir: str, index: int) -> str:
+    return os.path.join(output_dir, f'chunk_{index:06d}.failed.jsonl')
+
+
+def write_lines(path: str, lines: List[str]):
+    # 先寫暫存檔再 rename，中斷時不留下不完整的檔案
+    with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+        f.writelines(lines)
+    os.replace(f'{path}.tmp', path)
+
+
+def load_manifest(output_dir: str, input_path: str, chunk_size: int, restart: bool) -> Dict[str, Any]:
+    """
+    建立或檢查 checkpoint：輸入檔或 chunk 大小與上次不同時無法接續（需 --restart 重新開始）
+    """
+    stat = os.stat(input_path)
+    manifest = {'input': os.path.abspath(input_path), 'size': stat.st_size, 'mtime': stat.st_mtime, 'chunk_size': chunk_size}
+    path = os.path.join(output_dir, MANIFEST_FILE)
+
+    if restart and os.path.isdir(output_dir):
+        shutil.rmtree(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            previous = json.load(f)
+        if previous != manifest:
+            raise ValueError(f"{output_dir} 的 checkpoint 對應不同的輸入檔或 chunk 大小，請改用其他輸出目錄或加上 --restart")
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def init_worker(workers: int):
+    """
+    worker 啟動時將整體的 LLM 速率上限平均分配（每個 process 有各自的 limiter）
+    """
+    for key in ('LLM_RPM_LIMIT', 'LLM_TPM_LIMIT'):
+        limit = float(os.getenv(key, '0'))
+        if limit:
+            os.environ[key] = str(limit / workers)
+
+
+def process_chunk(records: List[Dict[str, Any]]) -> List[str]:
+    """
+    : returns: 各 record 的結果行（與 records 順序相同）
+    """
+    from text_processing_251029 import process_window
+
+    lines = process_window(records)
+    if len(records) > 1 and any('error' in json.loads(line) for line in lines):
+        # 整個 chunk 失敗時改為逐筆處理，只讓出錯的 record 輸出 error
+        lines = [line for record in records for line in process_window([record])]
+    return lines
+
+
+def write_chunk(output_dir: str, index: int, lines: List[str], failed: List[Dict[str, Any]]):
+    """
+    寫出 chunk 的結果；failed 為 {seq, record}（出錯的 record 與其在 chunk 中的位置），重跑時重試
+    failed 檔先於輸出檔寫入：兩者之間中斷時輸出檔不存在，重跑時整個 chunk 重新處理
+    """
+    path = failed_path(output_dir, index)
+    if failed:
+        write_lines(path, [json.dumps(entry, ensure_ascii=False) + '\n' for entry in failed])
+    elif os.path.exists(path):
+        os.remove(path)
+    write_lines(chunk_path(output_dir, index), lines)
+
+
+def run_chunk(output_dir: str, index: int, records: List[Dict[str, Any]]) -> Tuple[int, int, int, float]:
+    """
+    處理一個 chunk 並寫出結果
+    : returns: (chunk 序號, record 數, 失敗數, 秒數)
+    """
+    start = time.monotonic()
+    lines = process_chunk(records)
+    failed = [{'seq': seq, 'record': record} for seq, (record, line) in enumerate(zip(records, lines))
+              if 'error' in json.loads(line)]
+    write_chunk(output_dir, index, lines, failed)
+    return index, len(records), len(failed), time.monotonic() - start
+
+
+def retry_chunk(output_dir: str, index: int) -> Tuple[int, int, int, float]:
+    """
+    重試已完成 chunk 中出錯的 record，以新結果取代輸出檔中對應的行
+    : returns: (chunk 序號, 重試的 record 數, 仍失敗數, 秒數)
+    """
+    start = time.monotonic()
+    with open(failed_path(output_dir, index), encoding='utf-8') as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    with open(chunk_path(output_dir, index), encoding='utf-8') as f:
+        lines = f.readlines()
+
+    retried = process_chunk([entry['record'] for entry in entries])
+    failed = []
+    for entry, line in zip(entries, retried):
+        lines[entry['seq']] = line
+        if 'error' in json.loads(line):
+            failed.append(entry)
+    write_chunk(output_dir, index, lines, failed)
+    return index, len(entries), len(failed), time.monotonic() - start
+
+
+def run_batch(input_path: str, output_dir: str, chunk_size: int = 500, workers: int = 0, restart: bool = False) -> Dict[str, int]:
+    """
+    : param workers: process 數，0 表示 CPU 核心數
+    : returns: 本次處理與略過的 chunk / record 統計
+    """
+    workers = workers or os.cpu_count() or 1
+    load_manifest(output_dir, input_path, chunk_size, restart)
+
+    stats = {'chunks': 0, 'records': 0, 'errors': 0, 'skipped_chunks': 0, 'retried_chunks': 0}
+    started = time.monotonic()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(workers,)) as executor:
+        pending = set()
+
+        def collect(done):
+            for future in done:
+                index, count, errors, seconds = future.result()
+                stats['chunks'] += 1
+                stats['records'] += count
+                stats['errors'] += errors
+                elapsed = time.monotonic() - started
+                logger.info(f"chunk {index} 完成：{count} 筆（失敗 {errors}），{seconds:.1f} 秒；"
+                            f"累計 {stats['records']} 筆，{stats['records'] / elapsed:.1f} 筆/秒")
+
+        for index, records in iter_chunks(input_path, chunk_size):
+            task, args = run_chunk, (output_dir, index, records)
+            if os.path.exists(chunk_path(output_dir, index)):
+                if not os.path.exists(failed_path(output_dir, index)):
+                    stats['skipped_chunks'] += 1
+                    continue
+                # 已完成但有出錯的 record：只重試這些 record
+                stats['retried_chunks'] += 1
+                task, args = retry_chunk, (output_dir, index)
+            # 最多同時保留 2 * workers 個 chunk，避免一次讀入整個檔案
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(executor.submit(task, *args))
+
+        done, _ = wait(pending)
+        collect(done)
+
+    logger.info(f"批次完成：處理 {stats['chunks']} 個 chunk / {stats['records']} 筆（失敗 {stats['errors']}），"
+                f"略過已完成 {stats['skipped_chunks']} 個 chunk，重試 {stats['retried_chunks']} 個 chunk 中出錯的 record")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='離線批次處理 JSONL')
+    parser.add_argument('input', help='JSONL 輸入檔，每行一個 record')
+    parser.add_argument('--output-dir', default='./output_03_batch')
+    parser.add_argument('--chunk-size', type=int, default=500, help='每個 chunk 的 record 數')
+    parser.add_argument('--workers', type=int, default=0, help='process 數，預設為 CPU 核心數')
+    parser.add_argument('--restart', action='store_true', help='清除既有輸出與 checkpoint，重新開始')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    stats = run_batch(args.input, args.output_dir, args.chunk_size, args.workers, args.restart)
+    sys.exit(1 if stats['errors'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,382 @@
+"""
+Pipeline 分段效能測試：
+- 以 sample_request.json（或指定的 JSON / JSONL 範本）的欄位形狀產生合成 request：
+  可調整 record 數、每筆 item 數、每個 item 的 finding 數、語系比例與 SUMMARY 重複率
+- 分別計時 db_to_dataframe、postprocess_multilang、text_processing 與完整 /process 往返（TestClient）
+- 參考資料來源：fallback（離線 demo 資料）/ mongomock（依產生的 code 建立參考表，需安裝 mongomock）
+- LLM：mock（未設定金鑰時的內建 mock）/ http（本機模擬 Azure OpenAI 端點，可設定延遲與 429 比例）
+- 結果輸出為 JSON（含 commit 與設定），可用 --compare 與先前結果比較各段中位數
+
+用法：python benchmark.py [--records N] [--backend fallback mongomock] [--llm mock http] [--output FILE] [--compare FILE]
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import platform
+import argparse
+import threading
+import tempfile
+import subprocess
+import statistics
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('fallback', 'mongomock')
+LLM_MODES = ('mock', 'http')
+STAGES = ('db_to_dataframe', 'postprocess_multilang', 'text_processing', 'process_api')
+
+# mongomock 模式使用的庫/表名稱
+MOCK_MONGO_ENV = {
+    'MONGODB_URI': 'mongodb://benchmark', 'MONGODB_DB_MAIN': 'main', 'MONGODB_DB_AUX': 'aux',
+    'MONGODB_COL_ITEM_META': 'item_meta', 'MONGODB_COL_ITEM_GROUP_MAP': 'item_group_map',
+    'MONGODB_COL_DIAG': 'diag', 'MONGODB_COL_SUMMARY': 'summary',
+}
+
+
+def load_template(path: str) -> Dict[str, Any]:
+    """
+    讀取範本 record（JSON 取第一筆；JSONL 取第一行）
+    """
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            payload = json.loads(next(line for line in f if line.strip()))
+        else:
+            payload = json.load(f)
+    return payload[0] if isinstance(payload, list) else payload
+
+
+def parse_langu_mix(value: str) -> Dict[str, float]:
+    """
+    '1:0.7,2:0.3' -> {'1': 0.7, '2': 0.3}
+    """
+    mix = {}
+    for part in value.split(','):
+        langu_no, _, weight = part.partition(':')
+        mix[langu_no.strip()] = float(weight or 1)
+    return mix
+
+
+def make_requests(template: Dict[str, Any], records: int, items: int, findings: int, langu_mix: Dict[str, float],
+                  summary_repeat: float, orgs: int = 1, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    依範本形狀產生合成 request
+    : param items / findings: 每筆 record 的 item 數、每個 item 的 finding 數
+    : param summary_repeat: finding 重用既有 DIAG_CODE（即重複 SUMMARY）的機率
+    : param orgs: ORG_ID 種類數
+    """
+    rng = random.Random(seed)
+    item_template = template['ITEMS'][0]
+    # SUMMARY_CODE 由 diag 表對應（input 帶入時會與 diag 表欄位衝突），不放入 finding
+    finding_template = {k: v for k, v in item_template['FINDINGS'][0].items() if k != 'SUMMARY_CODE'}
+    langus, weights = list(langu_mix), list(langu_mix.values())
+
+    diag_count = 0
+    requests = []
+    for i in range(records):
+        record_items = []
+        for j in range(items):
+            record_findings = []
+            for _ in range(findings):
+                if diag_count and rng.random() < summary_repeat:
+                    diag_no = rng.randrange(diag_count)
+                else:
+                    diag_no, diag_count = diag_count, diag_count + 1
+                record_findings.append({
+                    **finding_template,
+                    'DIAG_CODE': f'D{diag_no:06d}',
+                    'COMMENT': f"{finding_template.get('COMMENT', '')} {i}-{j}-{len(record_findings)}",
+                })
+            record_items.append({**item_template, 'ITEM_CODE': f'I{rng.randrange(items * 4):04d}', 'FINDINGS': record_findings})
+        requests.append({
+            **template,
+            'RECORD_ID': f'R{i:06d}',
+            'LANG_NO': rng.choices(langus, weights)[0],
+            'ORG_ID': f'ORG_{i % orgs}',
+            'ITEMS': record_items,
+        })
+    return requests
+
+
+def seed_mongomock(api_requests: List[Dict[str, Any]]):
+    """
+    建立 mongomock client 並依 request 中的 code 寫入參考表，設為共用 MongoDB client
+    """
+    import mongomock
+    import mongo_client
+
+    client = mongomock.MongoClient()
+    main_db, aux_db = client[MOCK_MONGO_ENV['MONGODB_DB_MAIN']], client[MOCK_MONGO_ENV['MONGODB_DB_AUX']]
+    items = {(item['ITEM_CODE'], r['ORG_ID']) for r in api_requests for item in r['ITEMS']}
+    diags = {f['DIAG_CODE'] for r in api_requests for item in r['ITEMS'] for f in item['FINDINGS']}
+    # diag / summary 僅依 code merge，每個 code 只建一筆
+    org = api_requests[0]['ORG_ID']
+
+    main_db[MOCK_MONGO_ENV['MONGODB_COL_ITEM_META']].insert_many([
+        {'ITEM_CODE': code, 'ORG_ID': item_org, 'TCNAME': f'項目 {code}', 'ENNAME': f'Item {code}',
+         'JPNAME': f'項目 {code}', 'SCNAME': f'项目 {code}'} for code, item_org in sorted(items)])
+    aux_db[MOCK_MONGO_ENV['MONGODB_COL_ITEM_GROUP_MAP']].insert_many([
+        {'ITEM_CODE': code, 'GROUPNO': int(code[1:]) % 5, 'TCNAME_GROUP': f'分類 {int(code[1:]) % 5}',
+         'ENNAME_GROUP': f'Group {int(code[1:]) % 5}', 'JPNAME_GROUP': f'分類 {int(code[1:]) % 5}',
+         'SCNAME_GROUP': f'分类 {int(code[1:]) % 5}'} for code in sorted({code for code, _ in items})])
+    main_db[MOCK_MONGO_ENV['MONGODB_COL_DIAG']].insert_many([
+        {'DIAG_CODE': code, 'SUMMARY_CODE': f'S{code[1:]}', 'ENNAME': f'Finding {code}', 'JPNAME': f'所見 {code}',
+         'SCNAME': f'所见 {code}', 'ORG_ID': org} for code in sorted(diags)])
+    aux_db[MOCK_MONGO_ENV['MONGODB_COL_SUMMARY']].insert_many([
+        {'SUMMARY_CODE': f'S{code[1:]}', 'TCNAME': f'建議追蹤 {code}（三個月）', 'ENNAME': f'Follow up {code} in 3 months.',
+         'JPNAME': f'{code} を3か月後に再検査', 'SCNAME': f'建议追踪 {code}（三个月）', 'ORG_ID': org}
+        for code in sorted(diags)])
+
+    mongo_client.close_client()
+    mongo_client._client = client
+
+
+class MockLLMServer:
+    """
+    本機模擬 Azure OpenAI chat completions：固定延遲、依比例回傳 429（含 try again 秒數）
+    """
+
+    def __init__(self, latency: float = 0.0, rate_429: float = 0.0, retry_after: float = 0.05, seed: int = 0):
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.calls = 0
+        self.throttled = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def start(self) -> str:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with server._lock:
+                    server.calls += 1
+                    throttle = server._rng.random() < server.rate_429
+                    server.throttled += throttle
+                if server.latency:
+                    time.sleep(server.latency)
+                if throttle:
+                    self._send(429, {'error': {'code': '429', 'message': f'Rate limit. Please try again in {server.retry_after}s.'}})
+                    return
+                text = body['messages'][-1]['content']
+                start = text.find('["')
+                # pack 模式輸入為 JSON 陣列，依相同數量回傳
+                content = json.dumps([f'改寫：{s}' for s in json.loads(text[start:])], ensure_ascii=False) \
+                    if start >= 0 else f'改寫：{text.split("：")[-1]}'
+                self._send(200, {
+                    'id': 'benchmark', 'object': 'chat.completion', 'created': 0, 'model': body.get('model', ''),
+                    'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': content}}],
+                    'usage': {'prompt_tokens': len(text), 'completion_tokens': len(content), 'total_tokens': len(text) + len(content)},
+                })
+
+            def _send(self, status: int, payload: Dict[str, Any]):
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return f'http://127.0.0.1:{self._server.server_address[1]}'
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        'n': len(ordered),
+        'min': round(ordered[0], 6),
+        'median': round(statistics.median(ordered), 6),
+        'mean': round(statistics.fmean(ordered), 6),
+        'p95': round(ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))], 6),
+        'max': round(ordered[-1], 6),
+    }
+
+
+def measure(func: Callable[[], Any], repeat: int, warmup: int) -> Dict[str, float]:
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def run_scenario(api_requests: List[Dict[str, Any]], backend: str, llm: str, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """
+    於指定參考資料來源與 LLM 模式下計時各段
+    """
+    from reference_cache import reference_cache
+    from db_to_dataframe_251029 import db_to_dataframe
+    from data_preprocessing_251029 import postprocess_multilang
+    from text_processing_251029 import text_processing
+
+    for key in MOCK_MONGO_ENV:
+        os.environ.pop(key, None)
+    for key in ('AZURE_OPENAI_ENDPOINT', 'AZURE_OPENAI_API_KEY'):
+        os.environ.pop(key, None)
+    if backend == 'mongomock':
+        os.environ.update(MOCK_MONGO_ENV)
+        seed_mongomock(api_requests)
+    reference_cache.invalidate()
+
+    server = None
+    if llm == 'http':
+        server = MockLLMServer(args.llm_latency, args.llm_429_rate, seed=args.seed)
+        os.environ['AZURE_OPENAI_ENDPOINT'] = server.start()
+        os.environ['AZURE_OPENAI_API_KEY'] = 'benchmark'
+
+    try:
+        final_df = db_to_dataframe(api_requests)
+        preprocessed_df = postprocess_multilang(final_df)
+        stages = {
+            'db_to_dataframe': lambda: db_to_dataframe(api_requests),
+            'postprocess_multilang': lambda: postprocess_multilang(final_df),
+            'text_processing': lambda: text_processing(preprocessed_df, None, api_requests),
+        }
+        if 'process_api' in args.stages:
+            from fastapi.testclient import TestClient
+            from app import app
+
+            def round_trip():
+                response = client.post('/process', json=api_requests)
+                response.raise_for_status()
+
+            client = TestClient(app)
+            stages['process_api'] = round_trip
+
+        results = []
+        for stage in args.stages:
+            logger.info(f"{backend} / {llm} / {stage}")
+            calls, throttled = (server.calls, server.throttled) if server else (0, 0)
+            row = {
+                'backend': backend, 'llm': llm, 'stage': stage,
+                'rows': len(preprocessed_df) if stage != 'db_to_dataframe' else len(final_df),
+                **measure(stages[stage], args.repeat, args.warmup),
+            }
+            if server is not None:
+                # 含 warmup 在內，本段實際送出的 LLM 請求數與被 429 的次數
+                row['llm_calls'] = server.calls - calls
+                row['llm_throttled'] = server.throttled - throttled
+            results.append(row)
+        return results
+    finally:
+        if server is not None:
+            server.stop()
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(current: Dict[str, Any], baseline_path: str):
+    """
+    列出各段中位數相對於 baseline 的倍數（>1 表示變慢）
+    """
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    previous = {(r['backend'], r['llm'], r['stage']): r for r in baseline['results']}
+    print(f"baseline {baseline.get('commit')} -> current {current.get('commit')}")
+    for row in current['results']:
+        old = previous.get((row['backend'], row['llm'], row['stage']))
+        ratio = f"{row['median'] / old['median']:.2f}x" if old and old['median'] else '-'
+        print(f"{row['backend']:<10} {row['llm']:<5} {row['stage']:<22} {row['median']:>10.4f}s  {ratio}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pipeline 分段效能測試')
+    parser.add_argument('--template', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sample_request.json'),
+                        help='範本 record（JSON 或 JSONL）')
+    parser.add_argument('--records', type=int, default=200)
+    parser.add_argument('--items', type=int, default=8, help='每筆 record 的 item 數')
+    parser.add_argument('--findings', type=int, default=3, help='每個 item 的 finding 數')
+    parser.add_argument('--langu-mix', default='1:0.6,2:0.2,3:0.1,4:0.1', help='LANG_NO:比例，逗號分隔')
+    parser.add_argument('--summary-repeat', type=float, default=0.8, help='finding 重複既有 SUMMARY 的機率')
+    parser.add_argument('--orgs', type=int, default=1, help='ORG_ID 種類數')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--backend', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument('--llm', nargs='+', choices=LLM_MODES, default=['mock'])
+    parser.add_argument('--llm-latency', type=float, default=0.05, help='http 模式每次呼叫的延遲秒數')
+    parser.add_argument('--llm-429-rate', type=float, default=0.0, help='http 模式回傳 429 的比例')
+    parser.add_argument('--llm-cache', action='store_true', help='啟用 LLM 改寫快取（預設關閉，每次皆實際呼叫）')
+    parser.add_argument('--result-store', action='store_true', help='啟用報告 result store（預設關閉，每次皆重新產生報告）')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--output', help='結果 JSON 路徑（未提供時輸出至 stdout）')
+    parser.add_argument('--compare', help='與先前的結果 JSON 比較')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if not args.llm_cache:
+        os.environ['LLM_CACHE_ENABLED'] = '0'
+    # result store 預設關閉（否則 warmup 後的 /process 皆由 result store 取回）；啟用時寫入暫存目錄，不使用 ./cache
+    # （暫存目錄只存放本次產生的參考資料對應的報告，MongoDB 模式下以固定的 REFERENCE_DATA_VERSION 啟用）
+    if args.result_store:
+        os.environ['RESULT_STORE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='benchmark_'), 'result_store.sqlite3')
+        os.environ.setdefault('REFERENCE_DATA_VERSION', 'benchmark')
+    else:
+        os.environ['RESULT_STORE_ENABLED'] = '0'
+    # 不寫出 /process 的輸出檔
+    os.environ.setdefault('OUTPUT_SINK', 'none')
+
+    config = {key: value for key, value in vars(args).items() if key not in ('output', 'compare')}
+    api_requests = make_requests(load_template(args.template), args.records, args.items, args.findings,
+                                 parse_langu_mix(args.langu_mix), args.summary_repeat, args.orgs, args.seed)
+
+    results = []
+    for backend in args.backend:
+        for llm in args.llm:
+            results.extend(run_scenario(api_requests, backend, llm, args))
+
+    import numpy as np
+    import pandas as pd
+    from dataframe_engine import get_engine
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'engine': get_engine(),
+        'cpu_count': os.cpu_count(),
+        'config': config,
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,8 +3,12 @@ Demo 版：
 - 保留資料清洗與缺值處理邏輯
 - 為符合保密協議，已移除任何可對應特定業務/系統/代碼之規則
 """
+import re
+import numpy as np
 import pandas as pd
-from typing import Dict
+from typing import Dict, Optional
+from utils import log_execution_time
+from dataframe_engine import get_engine, to_polars, pl
 
 # 各語系預設對應表：SUMMARY 或 GROUP 缺值時，依語言填入預設值
 LANGU_DEFAULT_MAP = {
@@ -19,6 +23,96 @@ SUBSET_2_KEEP = ['ITEM_CODE', 'RECORD_ID', 'LANG_NO', 'ORG_ID',
                  'TCNAME_SUMMARY', 'ENNAME_SUMMARY', 'JPNAME_SUMMARY', 'SCNAME_SUMMARY']
 
 
+# 全形標點轉半形對照表
+FULL_TO_HALF = {
+    '（': '(', '）': ')',
+    '【': '[', '】': ']',
+    '：': ':', '；': ';',
+    '，': ',', '。': '.',
+    '！': '!', '？': '?',
+    '“': '"', '”': '"',
+    '‘': "'", '’': "'",
+    '、': ',', '　': ' ',
+    '～': '~', '％': '%', '＋': '+', '－': '-', '＝': '=', '＠': '@'
+}
+
+
+class TextNormalizer:
+    """
+    文字欄位正規化：單次走訪完成移除換行、（選用）全形轉半形與括號前後空白，
+    欄位內以 factorize 只處理相異值，並跨呼叫快取重複字串的結果
+    """
+    # pandas str dtype 的 .str.replace 以 pyarrow（RE2）執行，\s 僅含 ASCII 空白；object dtype 則為 Python re
+    PAREN_SPACE = re.compile(r'\s*([()])\s*')
+    PAREN_SPACE_ASCII = re.compile(r'[\t\n\f\r ]*([()])[\t\n\f\r ]*')
+
+    def __init__(self, full_to_half: bool = False, max_cache: int = 200000):
+        """
+        : param full_to_half: 是否轉換全形標點並移除括號前後空白（COMMENT 使用）
+        : param max_cache: 快取字串數上限，超過時清空
+        """
+        table = {'\r': None, '\n': None}
+        if full_to_half:
+            table.update(FULL_TO_HALF)
+        self._table = str.maketrans(table)
+        self.full_to_half = full_to_half
+        self.max_cache = max_cache
+        self._caches: Dict[bool, Dict[str, str]] = {False: {}, True: {}}
+
+    def normalize(self, text: str, ascii_space: bool = False) -> str:
+        cache = self._caches[ascii_space]
+        result = cache.get(text)
+        if result is None:
+            result = text.translate(self._table)
+            if self.full_to_half:
+                pattern = self.PAREN_SPACE_ASCII if ascii_space else self.PAREN_SPACE
+                result = pattern.sub(r'\1', result)
+            if len(cache) >= self.max_cache:
+                cache.clear()
+            cache[text] = result
+        return result
+
+    def apply(self, series: pd.Series, default: Optional[str] = None) -> pd.Series:
+        """
+        : param series: 欲正規化的欄位，缺值視為空字串
+        : param default: 正規化後為空字串時填入的預設值
+        """
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            return self._apply_categorical(series, default)
+
+        ascii_space = isinstance(series.dtype, pd.StringDtype)
+        codes, uniques = pd.factorize(series)
+        normalized = [self.normalize(v if isinstance(v, str) else str(v), ascii_space) for v in uniques]
+        if default is not None:
+            normalized = [v if v != '' else default for v in normalized]
+
+        # codes 為 -1 者（缺值）對應最後一個元素
+        lookup = np.array(normalized + [default if default is not None else ''], dtype=object)
+        return pd.Series(lookup[codes], index=series.index, name=series.name)
+
+    def _apply_categorical(self, series: pd.Series, default: Optional[str] = None) -> pd.Series:
+        """
+        categorical 欄位（compact 模式）只正規化 categories，結果仍為 categorical；
+        正規化後相同的 category 合併，categories 保持排序，使 sort_values 結果與字串欄位相同
+        """
+        categories = series.cat.categories
+        ascii_space = isinstance(categories.dtype, pd.StringDtype)
+        normalized = [self.normalize(v if isinstance(v, str) else str(v), ascii_space) for v in categories]
+        normalized.append('')       # codes 為 -1 者（缺值）
+        if default is not None:
+            normalized = [v if v != '' else default for v in normalized]
+
+        new_categories = sorted(set(normalized))
+        position = {v: i for i, v in enumerate(new_categories)}
+        lookup = np.array([position[v] for v in normalized], dtype=np.int32)
+        codes = lookup[series.cat.codes.to_numpy()]
+        return pd.Series(pd.Categorical.from_codes(codes, categories=new_categories), index=series.index, name=series.name)
+
+
+COMMENT_NORMALIZER = TextNormalizer(full_to_half=True)
+NAME_NORMALIZER = TextNormalizer()
+
+
 # 讀取主表，移除重複的row
 def get_unique_rows(final_df: pd.DataFrame) -> pd.DataFrame:
     # 缺值補空字串
@@ -31,33 +125,25 @@ def get_unique_rows(final_df: pd.DataFrame) -> pd.DataFrame:
 
 
 # 整理 COMMENT、SUMMARY、GROUP、ITEM 欄位內的空行與空值
+# 依語系裁切過的 final_df 只處理存在的欄位
+@log_execution_time
 def postprocess_multilang(final_df: pd.DataFrame) -> pd.DataFrame:
+    if get_engine(final_df) == 'polars':
+        return _postprocess_multilang_polars(final_df)
 
-    # COMMENT 移除換行、空行符號、轉為 str
-    final_df['COMMENT'] = (
-        final_df['COMMENT']
-        .fillna('')
-        .str.replace(r'\r|\n', '', regex=True)
-        .str.translate(str.maketrans({
-            '（': '(', '）': ')',
-            '【': '[', '】': ']',
-            '：': ':', '；': ';',
-            '，': ',', '。': '.',
-            '！': '!', '？': '?',
-            '“': '"', '”': '"',
-            '‘': "'", '’': "'",
-            '、': ',', '　': ' ',
-            '～': '~', '％': '%', '＋': '+', '－': '-', '＝': '=', '＠': '@'
-        }))
-        .str.replace(r'\s*\(\s*', '(', regex=True)
-        .str.replace(r'\s*\)\s*', ')', regex=True)
-        .astype(str)
-    )
+    # COMMENT（含各語系 COMMENT）移除換行、空行符號、全形轉半形、括號前後空白
+    for comment in ['COMMENT', 'ENNAME_COMMENT', 'JPNAME_COMMENT', 'SCNAME_COMMENT']:
+        if comment in final_df.columns:
+            final_df[comment] = COMMENT_NORMALIZER.apply(final_df[comment])
+
+    # ITEM 移除換行、空行符號
+    for item in ['TCNAME_ITEM', 'ENNAME_ITEM', 'JPNAME_ITEM', 'SCNAME_ITEM']:
+        if item in final_df.columns:
+            final_df[item] = NAME_NORMALIZER.apply(final_df[item])
 
     # SUMMARY 移除換行、空行符號、空值填入 LANGU_DEFAULT_MAP 預設值
     for i, summary in enumerate(['TCNAME_SUMMARY', 'ENNAME_SUMMARY', 'JPNAME_SUMMARY', 'SCNAME_SUMMARY']):
-        final_df[summary] = final_df[summary].fillna('').str.replace(r'\r|\n', '', regex=True)
-        final_df[summary] = final_df[summary].replace('', LANGU_DEFAULT_MAP[str(i+1)][summary])
+        final_df[summary] = NAME_NORMALIZER.apply(final_df[summary], LANGU_DEFAULT_MAP[str(i+1)][summary])
 
     # GROUPNO '其他' 更改排序於最後顯示
     max_groupno = final_df['GROUPNO'].max()
@@ -66,8 +152,8 @@ def postprocess_multilang(final_df: pd.DataFrame) -> pd.DataFrame:
 
     # GROUP 移除換行、空行符號、空值填入 LANGU_DEFAULT_MAP 預設值
     for i, group in enumerate(['TCNAME_GROUP', 'ENNAME_GROUP', 'JPNAME_GROUP', 'SCNAME_GROUP']):
-        final_df[group] = final_df[group].fillna('').str.replace(r'\r|\n', '', regex=True)
-        final_df[group] = final_df[group].replace('', LANGU_DEFAULT_MAP[str(i+1)][group])
+        if group in final_df.columns:
+            final_df[group] = NAME_NORMALIZER.apply(final_df[group], LANGU_DEFAULT_MAP[str(i+1)][group])
 
     df_unique = get_unique_rows(final_df)
 
@@ -75,3 +161,56 @@ def postprocess_multilang(final_df: pd.DataFrame) -> pd.DataFrame:
     df_unique.sort_values(by=['RECORD_ID', 'GROUPNO', 'TCNAME_ITEM'], inplace=True, kind='mergesort')
 
     return df_unique
+
+
+# Polars 版的正規化 expression：與 TextNormalizer 相同（字串欄位為 RE2 語意，括號前後只移除 ASCII 空白）
+def _normalize_expr(col: str, full_to_half: bool = False, default: Optional[str] = None) -> 'pl.Expr':
+    table = {'\r': '', '\n': ''}
+    if full_to_half:
+        table.update(FULL_TO_HALF)
+
+    expr = pl.col(col).cast(pl.String).str.replace_many(list(table), list(table.values()))
+    if full_to_half:
+        expr = expr.str.replace_all(TextNormalizer.PAREN_SPACE_ASCII.pattern, '$1')
+    expr = expr.fill_null('')
+    if default is not None:
+        expr = pl.when(expr == '').then(pl.lit(default)).otherwise(expr)
+    return expr.alias(col)
+
+
+# postprocess_multilang 的 Polars lazy 版本：正規化、GROUPNO、去重與排序於同一個 plan 執行
+def _postprocess_multilang_polars(final_df: pd.DataFrame) -> pd.DataFrame:
+    categorical = [col for col, dtype in final_df.dtypes.items() if isinstance(dtype, pd.CategoricalDtype)]
+    lf = to_polars(final_df)
+    columns = lf.collect_schema().names()
+
+    exprs = [_normalize_expr(col, full_to_half=True)
+             for col in ['COMMENT', 'ENNAME_COMMENT', 'JPNAME_COMMENT', 'SCNAME_COMMENT'] if col in columns]
+    exprs += [_normalize_expr(col) for col in ['TCNAME_ITEM', 'ENNAME_ITEM', 'JPNAME_ITEM', 'SCNAME_ITEM'] if col in columns]
+    for i, summary in enumerate(['TCNAME_SUMMARY', 'ENNAME_SUMMARY', 'JPNAME_SUMMARY', 'SCNAME_SUMMARY']):
+        exprs.append(_normalize_expr(summary, default=LANGU_DEFAULT_MAP[str(i+1)][summary]))
+    for i, group in enumerate(['TCNAME_GROUP', 'ENNAME_GROUP', 'JPNAME_GROUP', 'SCNAME_GROUP']):
+        if group in columns:
+            exprs.append(_normalize_expr(group, default=LANGU_DEFAULT_MAP[str(i+1)][group]))
+
+    # GROUPNO '其他' 更改排序於最後顯示
+    other_groupno = pl.col('GROUPNO').max() + 1
+    exprs.append(
+        pl.when(pl.col('GROUPNO') == 0).then(other_groupno).otherwise(pl.col('GROUPNO'))
+        .fill_null(other_groupno).cast(pl.Int64).alias('GROUPNO')
+    )
+
+    # 依 SUBSET_2_KEEP（缺值視為空字串）保留第一次出現的 row，缺值補空字串後排序
+    dedup_key = pl.struct([pl.col(col).cast(pl.String).fill_null('') for col in SUBSET_2_KEEP])
+    df_unique = (
+        lf.with_columns(exprs)
+        .filter(dedup_key.is_first_distinct())
+        .with_columns(pl.col(pl.String).fill_null(''))
+        .sort(['RECORD_ID', 'GROUPNO', 'TCNAME_ITEM'], maintain_order=True)
+        .collect()
+        .to_pandas()
+    )
+
+    for col in categorical:
+        df_unique[col] = df_unique[col].astype('category')
+    return df_unique
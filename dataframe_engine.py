@@ -0,0 +1,99 @@
+"""
+DataFrame 執行引擎（DATAFRAME_ENGINE=pandas / polars）：
+- pandas：原本的 eager 流程（預設）
+- polars：db_to_dataframe 的 merge、postprocess_multilang 的字串正規化/去重/排序，以及 render_reports 的分組編號
+  改以 Polars lazy plan 執行（join 與字串 kernel 皆為多執行緒）；各 stage 的輸入輸出仍為 pandas DataFrame，函式簽名不變
+- polars 為選用套件，未安裝時記錄警告並退回 pandas
+- 欄位混合 int / str 等型別時（Arrow 無法表示，且轉為字串會使 1 與 '1' 視為相同），該 stage 以 pandas 執行
+"""
+import os
+import logging
+from typing import List, Sequence, Tuple
+import numpy as np
+import pandas as pd
+
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+logger = logging.getLogger(__name__)
+
+ENGINES = ('pandas', 'polars')
+
+_warned = False
+
+
+def mixed_type_columns(df: pd.DataFrame) -> List[str]:
+    """
+    值的型別不一致（如 int 與 str）的 object 欄位；int 與 float 混合可轉為 float，不列入
+    """
+    return [col for col, dtype in df.dtypes.items()
+            if dtype == object and pd.api.types.infer_dtype(df[col], skipna=True) in ('mixed', 'mixed-integer')]
+
+
+def get_engine(*frames: pd.DataFrame) -> str:
+    """
+    目前使用的引擎；設定值無效或 polars 未安裝時回傳 pandas
+    : param frames: 該 stage 的輸入；任一個有混合型別欄位時回傳 pandas
+    """
+    global _warned
+    engine = os.getenv('DATAFRAME_ENGINE', 'pandas').strip().lower()
+    if engine not in ENGINES:
+        engine = 'pandas'
+    if engine == 'polars' and pl is None:
+        if not _warned:
+            logger.warning("DATAFRAME_ENGINE=polars 但未安裝 polars，改用 pandas")
+            _warned = True
+        engine = 'pandas'
+    if engine == 'polars':
+        for df in frames:
+            mixed = mixed_type_columns(df)
+            if mixed:
+                logger.debug(f"欄位 {mixed} 混合不同型別的值，改用 pandas")
+                return 'pandas'
+    return engine
+
+
+def to_polars(df: pd.DataFrame) -> 'pl.LazyFrame':
+    """
+    pandas -> Polars LazyFrame；categorical 欄位（compact 模式）轉回字串
+    """
+    categorical = [col for col, dtype in df.dtypes.items() if isinstance(dtype, pd.CategoricalDtype)]
+    if categorical:
+        df = df.astype({col: object for col in categorical})
+    return pl.from_pandas(df).lazy()
+
+
+def merge_left(left: 'pl.LazyFrame', right: 'pl.LazyFrame', on: Sequence[str],
+               suffixes: Tuple[str, str] = ('_x', '_y')) -> 'pl.LazyFrame':
+    """
+    與 pandas merge(how='left') 相同語意的 left join：
+    保持左表順序（多筆命中時依右表順序），非 key 的重名欄位兩側皆加上 suffixes
+    """
+    on = list(on)
+    left_schema = left.collect_schema()
+    right_schema = right.collect_schema()
+
+    overlap = [col for col in left_schema.names() if col in right_schema and col not in on]
+    if overlap:
+        left = left.rename({col: f'{col}{suffixes[0]}' for col in overlap})
+        right = right.rename({col: f'{col}{suffixes[1]}' for col in overlap})
+
+    # 右表為空或型別推斷不同時，key 型別對齊左表
+    right = right.with_columns([pl.col(col).cast(left_schema[col]) for col in on if right_schema[col] != left_schema[col]])
+    return left.join(right, on=on, how='left', maintain_order='left_right', coalesce=True)
+
+
+def first_seen_ids(df: pd.DataFrame, key_sets: List[List[str]]) -> List[np.ndarray]:
+    """
+    等同 df.groupby(keys, sort=False, dropna=False).ngroup()：依各 key 組合首次出現順序編號
+    : param key_sets: 多組 key 欄位，於同一個 lazy plan 中平行計算
+    """
+    columns = list(dict.fromkeys(col for keys in key_sets for col in keys))
+    lf = to_polars(df[columns].reset_index(drop=True)).with_row_index('_row')
+    ids = lf.select([
+        (pl.col('_row').min().over(keys).rank('dense') - 1).cast(pl.Int64).alias(f'_id{i}')
+        for i, keys in enumerate(key_sets)
+    ]).collect()
+    return [ids[f'_id{i}'].to_numpy() for i in range(len(key_sets))]
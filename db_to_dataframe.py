@@ -1,9 +1,17 @@
 from utils import log_execution_time
-from typing import List, Dict, Any
+from metrics import timed_query
+from reference_cache import reference_cache
+from mongo_client import get_client
+from dataframe_engine import get_engine, merge_left, to_polars, pl
+from reference_snapshot import get_snapshot, write_snapshot
+from typing import List, Dict, Any, Optional
 import pandas as pd
-import pymongo
+import logging
+import math
 import os
 
+logger = logging.getLogger(__name__)
+
 SUBSET = [
     'RECORD_ID', 'ORG_ID', 'LANG_NO', 'DIAG_CODE',
     'GROUPNO', 'TCNAME_GROUP', 'ENNAME_GROUP', 'JPNAME_GROUP', 'SCNAME_GROUP',
@@ -12,9 +20,243 @@ SUBSET = [
     'TCNAME_SUMMARY', 'ENNAME_SUMMARY', 'JPNAME_SUMMARY', 'SCNAME_SUMMARY'
 ]
 
+# 各語系在參考表中的欄位字首，以及只有該語系輸出才會用到的 SUBSET 欄位
+LANGU_PREFIX = {'1': 'TCNAME', '2': 'ENNAME', '3': 'JPNAME', '4': 'SCNAME'}
+LANGU_COLUMNS = {
+    '1': ['TCNAME_GROUP', 'TCNAME_ITEM', 'COMMENT', 'TCNAME_SUMMARY'],
+    '2': ['ENNAME_GROUP', 'ENNAME_ITEM', 'ENNAME_COMMENT', 'ENNAME_SUMMARY'],
+    '3': ['JPNAME_GROUP', 'JPNAME_ITEM', 'JPNAME_COMMENT', 'JPNAME_SUMMARY'],
+    '4': ['SCNAME_GROUP', 'SCNAME_ITEM', 'SCNAME_COMMENT', 'SCNAME_SUMMARY'],
+}
+# 不論語系皆保留：TCNAME_ITEM 為排序 key，各語系 SUMMARY 為去重 key（保留才能維持原本的去重結果）
+ALWAYS_KEEP = ['TCNAME_ITEM', 'TCNAME_SUMMARY', 'ENNAME_SUMMARY', 'JPNAME_SUMMARY', 'SCNAME_SUMMARY']
+
+ITEM_META_PROJECTION = {"ITEM_CODE": 1, "TCNAME": 1, "SCNAME": 1, "JPNAME": 1, "ENNAME": 1, "ORG_ID": 1, "_id": 0}
+DIAG_PROJECTION = {"DIAG_CODE": 1, "SUMMARY_CODE": 1,
+                   "SCNAME": 1, "ENNAME": 1, "JPNAME": 1,
+                   "ORG_ID": 1, "_id": 0}
+SUMMARY_PROJECTION = {"SUMMARY_CODE": 1, "TCNAME": 1, "SCNAME": 1, "JPNAME": 1, "ENNAME": 1, "ORG_ID": 1, "_id": 0}
+
+# compact 模式（COMPACT_DTYPES=1）轉為 categorical 的低基數欄位
+COMPACT_COLUMNS = [
+    'RECORD_ID', 'LANG_NO', 'ORG_ID',
+    'TCNAME_GROUP', 'ENNAME_GROUP', 'JPNAME_GROUP', 'SCNAME_GROUP',
+    'TCNAME_ITEM', 'ENNAME_ITEM', 'JPNAME_ITEM', 'SCNAME_ITEM',
+    'TCNAME_SUMMARY', 'ENNAME_SUMMARY', 'JPNAME_SUMMARY', 'SCNAME_SUMMARY'
+]
+
+# 各參考表查詢所需的索引（key 前綴）
+REQUIRED_INDEXES = {
+    'col_item_meta': ['ITEM_CODE', 'ORG_ID'],
+    'col_item_group_map': ['ITEM_CODE'],
+    'col_diag': ['DIAG_CODE'],
+    'col_summary': ['SUMMARY_CODE'],
+}
+
+
+def get_mongo_config() -> Dict[str, str]:
+    """
+    由環境變數讀取 MongoDB 連線/庫/表名稱；任一項為空字串時 db_to_dataframe 使用 fallback
+    """
+    return {
+        'mongo_uri': os.getenv('MONGODB_URI', ''),
+        'main_db_name': os.getenv('MONGODB_DB_MAIN', ''),
+        'aux_db_name': os.getenv('MONGODB_DB_AUX', ''),
+        'col_item_meta': os.getenv('MONGODB_COL_ITEM_META', ''),
+        'col_item_group_map': os.getenv('MONGODB_COL_ITEM_GROUP_MAP', ''),
+        'col_diag': os.getenv('MONGODB_COL_DIAG', ''),
+        'col_summary': os.getenv('MONGODB_COL_SUMMARY', ''),
+    }
+
+
+def reference_data_version() -> Optional[str]:
+    """
+    目前參考資料來源與版本（result store 指紋的一部分）：
+    快照為其版本名稱；MongoDB 為庫/表名稱加上 REFERENCE_DATA_VERSION（參考表更新後需遞增）；否則為 fallback
+    : returns: 使用 MongoDB 但未設定 REFERENCE_DATA_VERSION 時為 None（無法得知參考表是否已更新，不使用 result store）
+    """
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return f'snapshot:{snapshot.version}'
+    mongo_config = get_mongo_config()
+    if all(mongo_config.values()):
+        version = os.getenv('REFERENCE_DATA_VERSION', '')
+        if not version:
+            return None
+        names = [value for key, value in mongo_config.items() if key != 'mongo_uri']
+        return f"mongo:{'/'.join(names)}:{version}"
+    return 'fallback'
+
+
+def request_languages(api_request: List[Dict[str, Any]]) -> List[str]:
+    """
+    request 中出現的 LANG_NO；LANGU_PROJECTION=0 或含未知語系時回傳全部語系（不做欄位裁切）
+    """
+    langus = {str(record.get('LANG_NO', '')).strip() for record in api_request}
+    if os.getenv('LANGU_PROJECTION', '1') == '0' or not langus <= set(LANGU_PREFIX):
+        return list(LANGU_PREFIX)
+    return sorted(langus)
+
+
+def subset_columns(langus: List[str]) -> List[str]:
+    """
+    依語系裁切後的 SUBSET 欄位（保持 SUBSET 順序）
+    """
+    dropped = {col for langu_no, cols in LANGU_COLUMNS.items() if langu_no not in langus for col in cols}
+    return [col for col in SUBSET if col not in dropped or col in ALWAYS_KEEP]
+
+
+def langu_projection(projection: Dict[str, int], langus: List[str]) -> Dict[str, int]:
+    """
+    移除 projection 中未使用語系的名稱欄位（TCNAME 為排序 key，一律保留）
+    """
+    unused = {LANGU_PREFIX[langu_no] for langu_no in LANGU_PREFIX if langu_no not in langus and langu_no != '1'}
+    return {k: v for k, v in projection.items() if k not in unused}
+
+
+def compact_dtypes(df: pd.DataFrame, columns: List[str] = COMPACT_COLUMNS) -> pd.DataFrame:
+    """
+    將 columns 中存在的欄位轉為 categorical（每列只存整數 code，categories 依字串排序）
+    缺值（left join 未對應的 code）先補空字串，與非 compact 模式於去重時補值的結果相同，
+    且之後的 fillna('') 不會因 '' 不在 categories 中而失敗
+    """
+    for col in columns:
+        if col not in df.columns:
+            continue
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            if not series.isna().any():
+                continue
+            series = series.astype(object)
+        df[col] = series.fillna('').astype('category')
+    return df
+
+
+def diag_lookup_pipeline(diag_codes: List[str], col_summary: str,
+                         diag_projection: Dict[str, int] = DIAG_PROJECTION) -> List[Dict[str, Any]]:
+    """
+    diag 以 $lookup 併入 summary 的 aggregate pipeline（兩表須在同一資料庫）
+    summary 保留 _id 以便在多個 DIAG_CODE 共用同一 SUMMARY_CODE 時去重
+    """
+    summary_fields = {f"SUMMARY.{k}": 1 for k in SUMMARY_PROJECTION if k != '_id'}
+    return [
+        {"$match": {"DIAG_CODE": {"$in": diag_codes}}},
+        {"$lookup": {"from": col_summary, "localField": "SUMMARY_CODE",
+                     "foreignField": "SUMMARY_CODE", "as": "SUMMARY"}},
+        {"$project": {**{k: v for k, v in diag_projection.items() if k != '_id'},
+                      **summary_fields, "SUMMARY._id": 1, "_id": 0}},
+    ]
+
+
+def check_reference_indexes() -> List[str]:
+    """
+    檢查參考表是否具備查詢所需索引，回傳缺少的索引描述（未設定 MongoDB 時回傳空列表）
+    """
+    mongo_config = get_mongo_config()
+    if not all(mongo_config.values()):
+        return []
+
+    client = get_client()
+    db_of = {
+        'col_item_meta': mongo_config['main_db_name'],
+        'col_item_group_map': mongo_config['aux_db_name'],
+        'col_diag': mongo_config['main_db_name'],
+        'col_summary': mongo_config['aux_db_name'],
+    }
+
+    missing = []
+    for col_key, fields in REQUIRED_INDEXES.items():
+        collection = client[db_of[col_key]][mongo_config[col_key]]
+        index_keys = [[k for k, _ in info['key']] for info in collection.index_information().values()]
+        if not any(keys[:len(fields)] == fields for keys in index_keys):
+            missing.append(f"{collection.database.name}.{collection.name}: ({', '.join(fields)})")
+
+    for description in missing:
+        logger.warning(f"缺少索引 {description}")
+    return missing
+
+
+def export_reference_snapshot(root: str, keep: int = 2) -> str:
+    """
+    由 MongoDB 整表匯出四張參考表（所有語系欄位）為 Arrow 快照，並原子切換為最新版本
+    : returns: 新版本名稱
+    """
+    mongo_config = get_mongo_config()
+    if not all(mongo_config.values()):
+        raise RuntimeError("未設定 MongoDB 連線資訊，無法匯出參考資料快照")
+
+    client = get_client()
+    db_main = client[mongo_config['main_db_name']]
+    db_aux = client[mongo_config['aux_db_name']]
+    tables = {
+        'item_meta': ('ITEM_CODE', list(db_main[mongo_config['col_item_meta']].find({}, ITEM_META_PROJECTION))),
+        'item_group_map': ('ITEM_CODE', list(db_aux[mongo_config['col_item_group_map']].find({}, {"_id": 0}))),
+        'diag': ('DIAG_CODE', list(db_main[mongo_config['col_diag']].find({}, DIAG_PROJECTION))),
+        'summary': ('SUMMARY_CODE', list(db_aux[mongo_config['col_summary']].find({}, SUMMARY_PROJECTION))),
+    }
+    return write_snapshot(root, tables, keep=keep)
+
+
+def _is_blank(value: Any) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value)) or str(value).strip() == ''
+
+
+def flatten_request(api_request: List[Dict[str, Any]]) -> pd.DataFrame:
+    """
+    將 record -> ITEMS -> FINDINGS 展開為每個 finding 一列（等同 json_normalize + explode + apply(pd.Series)）。
+    單次走訪 JSON，直接寫入各欄位的 list，COMMENT 為空者在走訪時即略過。
+
+    欄位順序：ITEM 欄位、RECORD_ID / LANG_NO / ORG_ID、FINDING 欄位；index 與原展開結果的列號一致。
+    """
+    meta_keys = ['RECORD_ID', 'LANG_NO', 'ORG_ID']
+    item_cols: Dict[str, list] = {}
+    meta_cols: Dict[str, list] = {k: [] for k in meta_keys}
+    finding_cols: Dict[str, list] = {}
+    index = []
+    n = 0       # 已保留列數
+    pos = 0     # 展開後的列號（含被 drop 的列）
+
+    def append(cols: Dict[str, list], key: str, value: Any):
+        col = cols.get(key)
+        if col is None:
+            col = cols[key] = [math.nan] * n
+        col.append(value)
+
+    def pad(cols: Dict[str, list]):
+        for col in cols.values():
+            if len(col) < n:
+                col.append(math.nan)
+
+    for record in api_request:
+        meta_values = [record[k] for k in meta_keys]
+        for item in record['ITEMS']:
+            findings = item.get('FINDINGS')
+            if not isinstance(findings, list) or not findings:
+                pos += 1
+                continue
+
+            for finding in findings:
+                pos += 1
+                if not isinstance(finding, dict) or _is_blank(finding.get('COMMENT')):
+                    continue
+
+                for key, value in item.items():
+                    if key != 'FINDINGS':
+                        append(item_cols, key, value)
+                for key, value in zip(meta_keys, meta_values):
+                    meta_cols[key].append(value)
+                for key, value in finding.items():
+                    append(finding_cols, key, value)
+                index.append(pos - 1)
+                n += 1
+                pad(item_cols)
+                pad(finding_cols)
+
+    return pd.DataFrame({**item_cols, **meta_cols, **finding_cols}, index=index)
+
 
 @log_execution_time
-def db_to_dataframe(api_request: List[Dict[str, Any]]) -> pd.DataFrame:
+def db_to_dataframe(api_request: List[Dict[str, Any]], langus: Optional[List[str]] = None) -> pd.DataFrame:
     """
     Demo 版：將 API 輸入的 JSON 資料轉換為 DataFrame，並以 pymongo 示範擴充查詢（連線資訊以環境變數提供）。
 
@@ -24,39 +266,37 @@ def db_to_dataframe(api_request: List[Dict[str, Any]]) -> pd.DataFrame:
 
     Args:
         api_request: 包含多個 record 的列表，每個 record 包含 items 和 findings 資訊。
+        langus: 需輸出的語系；未提供時依 request 中的 LANG_NO 決定。僅查詢並保留這些語系的名稱欄位。
 
     Returns:
-        pd.DataFrame: 擴充後的資料框（示範用欄位）。
+        pd.DataFrame: 擴充後的資料框（示範用欄位，依語系裁切）。
     """
+    if langus is None:
+        langus = request_languages(api_request)
+    # 快取命名空間含語系，避免不同 projection 的資料互相命中
+    langu_key = ''.join(sorted(langus))
 
-    # 1 展開 input（保留原本 json_normalize + explode 的管線風格）
-    df_raw = pd.json_normalize(api_request, record_path='ITEMS', meta=['RECORD_ID', 'LANG_NO', 'ORG_ID'])
-    df_exploded = df_raw.explode('FINDINGS').reset_index(drop=True)
-    df_base = pd.concat([
-        df_exploded.drop('FINDINGS', axis=1),
-        df_exploded['FINDINGS'].apply(pd.Series)
-    ], axis=1)
-
-    # drop COMMENT 為 "" 的 row
-    df_base['COMMENT_clean'] = df_base['COMMENT'].fillna('').astype(str).str.strip()
-    rows_to_drop = (df_base['COMMENT_clean'] == '')
-    df_base = df_base[~rows_to_drop].copy()
-    df_base = df_base.drop(columns=['COMMENT_clean'])
+    # 1 展開 input，並 drop COMMENT 為 "" 的 row
+    df_base = flatten_request(api_request)
 
     # 2 連 MongoDB（連線/庫/表名稱一律由環境變數提供）
-    mongo_uri = os.getenv('MONGODB_URI', '')
-    main_db_name = os.getenv('MONGODB_DB_MAIN', '')
-    aux_db_name = os.getenv('MONGODB_DB_AUX', '')
+    mongo_config = get_mongo_config()
+    main_db_name = mongo_config['main_db_name']
+    aux_db_name = mongo_config['aux_db_name']
 
-    col_item_meta = os.getenv('MONGODB_COL_ITEM_META', '')
-    col_item_group_map = os.getenv('MONGODB_COL_ITEM_GROUP_MAP', '')
-    col_diag = os.getenv('MONGODB_COL_DIAG', '')
-    col_summary = os.getenv('MONGODB_COL_SUMMARY', '')
+    col_item_meta = mongo_config['col_item_meta']
+    col_item_group_map = mongo_config['col_item_group_map']
+    col_diag = mongo_config['col_diag']
+    col_summary = mongo_config['col_summary']
 
-    # 若缺少任何一項設定，就改用 fallback（避免硬編任何內部資訊）
-    use_fallback = not all([mongo_uri, main_db_name, aux_db_name, col_item_meta, col_item_group_map, col_diag, col_summary])
+    # 設定 REF_SNAPSHOT_DIR 且已有快照時，參考資料改由 memory-mapped 快照查詢（不需連 MongoDB）
+    snapshot = get_snapshot()
+
+    # 若缺少任何一項設定（且無快照），就改用 fallback（避免硬編任何內部資訊）
+    use_fallback = not all(mongo_config.values()) and snapshot is None
 
     unique_items_list = df_base.ITEM_CODE.astype(str).str.strip().unique().tolist()
+    unique_diags_list = df_base.DIAG_CODE.astype(str).str.strip().unique().tolist()
 
     if use_fallback:
         # ---- Demo fallback datasets ----
@@ -84,7 +324,7 @@ def db_to_dataframe(api_request: List[Dict[str, Any]]) -> pd.DataFrame:
             'ENNAME_COMMENT': '',
             'JPNAME_COMMENT': '',
             'SCNAME_COMMENT': ''
-        } for code in df_base.DIAG_CODE.astype(str).str.strip().unique().tolist()])
+        } for code in unique_diags_list])
 
         summary_tbl = pd.DataFrame([{
             'SUMMARY_CODE': str(code).strip(),
@@ -94,47 +334,99 @@ def db_to_dataframe(api_request: List[Dict[str, Any]]) -> pd.DataFrame:
             'JPNAME_SUMMARY': ''
         } for code in diag_tbl.SUMMARY_CODE.unique().tolist()])
 
+    elif snapshot is not None:
+        # 欄位裁切與 MongoDB projection 相同
+        item_meta = snapshot.lookup('item_meta', unique_items_list, [k for k in langu_projection(ITEM_META_PROJECTION, langus) if k != '_id'])
+        item_meta.rename(columns={'TCNAME': 'TCNAME_ITEM',
+                                  'JPNAME': 'JPNAME_ITEM',
+                                  'ENNAME': 'ENNAME_ITEM',
+                                  'SCNAME': 'SCNAME_ITEM'}, inplace=True)
+
+        unused = {col for langu_no, prefix in LANGU_PREFIX.items() if langu_no not in langus for col in (prefix, f'{prefix}_GROUP')}
+        item_group_map = snapshot.lookup('item_group_map', unique_items_list,
+                                         [col for col in snapshot.columns('item_group_map') if col not in unused])
+
+        diag_columns = [k for k in langu_projection(DIAG_PROJECTION, langus) if k != '_id']
+        diag_tbl = snapshot.lookup('diag', unique_diags_list, diag_columns).reindex(columns=diag_columns)
+        unique_summaries_list = diag_tbl['SUMMARY_CODE'].dropna().astype(str).str.strip().tolist()
+        diag_tbl.rename(columns={'JPNAME': 'JPNAME_COMMENT',
+                                 'ENNAME': 'ENNAME_COMMENT',
+                                 'SCNAME': 'SCNAME_COMMENT'}, inplace=True)
+
+        summary_columns = [k for k in SUMMARY_PROJECTION if k != '_id']
+        summary_tbl = snapshot.lookup('summary', unique_summaries_list, summary_columns).reindex(columns=summary_columns)
+        summary_tbl.rename(columns={'TCNAME': 'TCNAME_SUMMARY',
+                                    'JPNAME': 'JPNAME_SUMMARY',
+                                    'ENNAME': 'ENNAME_SUMMARY',
+                                    'SCNAME': 'SCNAME_SUMMARY'}, inplace=True)
+
     else:
-        client = pymongo.MongoClient(mongo_uri)
+        client = get_client()
         DB_MAIN = client[main_db_name]
         DB_AUX = client[aux_db_name]
 
         # FOR: 查 ITEM_NAME（多語系顯示名稱）
-        item_meta_cur = DB_MAIN[col_item_meta].find(
-            {"ITEM_CODE": {"$in": unique_items_list}},
-            {"ITEM_CODE": 1, "TCNAME": 1, "SCNAME": 1, "JPNAME": 1, "ENNAME": 1, "ORG_ID": 1, "_id": 0}
+        item_meta_projection = langu_projection(ITEM_META_PROJECTION, langus)
+        item_meta_rows = reference_cache.get_rows(
+            f'item_meta:{langu_key}', 'ITEM_CODE', unique_items_list,
+            lambda codes: timed_query(col_item_meta, 'find', lambda: list(DB_MAIN[col_item_meta].find({"ITEM_CODE": {"$in": codes}}, item_meta_projection)))
         )
-        item_meta = pd.DataFrame(list(item_meta_cur))
+        item_meta = pd.DataFrame(item_meta_rows)
         item_meta.rename(columns={'TCNAME': 'TCNAME_ITEM',
                                   'JPNAME': 'JPNAME_ITEM',
                                   'ENNAME': 'ENNAME_ITEM',
                                   'SCNAME': 'SCNAME_ITEM'}, inplace=True)
 
-        # FOR: 查 GROUPNO、GROUP_NAME
-        item_group_map_cur = DB_AUX[col_item_group_map].find(
-            {"ITEM_CODE": {"$in": unique_items_list}},
-            {"_id": 0}
+        # FOR: 查 GROUPNO、GROUP_NAME（排除未使用語系的名稱欄位）
+        item_group_map_projection = {"_id": 0}
+        for langu_no, prefix in LANGU_PREFIX.items():
+            if langu_no not in langus:
+                item_group_map_projection.update({prefix: 0, f'{prefix}_GROUP': 0})
+        item_group_map_rows = reference_cache.get_rows(
+            f'item_group_map:{langu_key}', 'ITEM_CODE', unique_items_list,
+            lambda codes: timed_query(col_item_group_map, 'find', lambda: list(DB_AUX[col_item_group_map].find({"ITEM_CODE": {"$in": codes}}, item_group_map_projection)))
         )
-        item_group_map = pd.DataFrame(list(item_group_map_cur))
-
-        # FOR: 查 SUMMARY_CODE
-        diag_cur = DB_MAIN[col_diag].find(
-            {},
-            {"DIAG_CODE": 1, "SUMMARY_CODE": 1,
-             "SCNAME": 1, "ENNAME": 1, "JPNAME": 1,
-             "ORG_ID": 1, "_id": 0}
-        )
-        diag_tbl = pd.DataFrame(list(diag_cur))
+        item_group_map = pd.DataFrame(item_group_map_rows)
+
+        # FOR: 查 SUMMARY_CODE（僅查本次 request 出現的 DIAG_CODE）
+        # lookup 模式：diag 與 summary 於同一次 aggregate 以 $lookup 取回，summary 結果暫存供下方直接使用
+        use_lookup = os.getenv('MONGODB_QUERY_MODE', 'find') == 'lookup'
+        if use_lookup and main_db_name != aux_db_name:
+            logger.warning("$lookup 需 diag 與 summary 位於同一資料庫，改用 find 模式")
+            use_lookup = False
+        prefetched_summary: Dict[str, Dict[Any, Dict[str, Any]]] = {}
+        diag_projection = langu_projection(DIAG_PROJECTION, langus)
+
+        def load_diag(codes: List[str]) -> List[Dict[str, Any]]:
+            if not use_lookup:
+                return timed_query(col_diag, 'find', lambda: list(DB_MAIN[col_diag].find({"DIAG_CODE": {"$in": codes}}, diag_projection)))
+
+            rows = []
+            docs = timed_query(col_diag, 'aggregate', lambda: list(DB_MAIN[col_diag].aggregate(diag_lookup_pipeline(codes, col_summary, diag_projection))))
+            for doc in docs:
+                summary_docs = prefetched_summary.setdefault(str(doc.get('SUMMARY_CODE', '')).strip(), {})
+                for summary_doc in doc.pop('SUMMARY', []):
+                    summary_docs[summary_doc.pop('_id')] = summary_doc
+                rows.append(doc)
+            return rows
+
+        diag_rows = reference_cache.get_rows(f'diag:{langu_key}', 'DIAG_CODE', unique_diags_list, load_diag)
+        diag_tbl = pd.DataFrame(diag_rows, columns=[k for k in diag_projection if k != '_id'])
         diag_tbl.rename(columns={'JPNAME': 'JPNAME_COMMENT',
                                  'ENNAME': 'ENNAME_COMMENT',
                                  'SCNAME': 'SCNAME_COMMENT'}, inplace=True)
 
-        # FOR: 查 SUMMARY_NAME
-        summary_cur = DB_AUX[col_summary].find(
-            {},
-            {"SUMMARY_CODE": 1, "TCNAME": 1, "SCNAME": 1, "JPNAME": 1, "ENNAME": 1, "ORG_ID": 1, "_id": 0}
-        )
-        summary_tbl = pd.DataFrame(list(summary_cur))
+        # FOR: 查 SUMMARY_NAME（僅查 diag 對應到的 SUMMARY_CODE）
+        def load_summary(codes: List[str]) -> List[Dict[str, Any]]:
+            rows = [doc for code in codes if code in prefetched_summary for doc in prefetched_summary[code].values()]
+            remaining = [code for code in codes if code not in prefetched_summary]
+            if remaining:
+                rows += timed_query(col_summary, 'find', lambda: list(DB_AUX[col_summary].find({"SUMMARY_CODE": {"$in": remaining}}, SUMMARY_PROJECTION)))
+            return rows
+
+        unique_summaries_list = [str(row['SUMMARY_CODE']).strip() for row in diag_rows if row.get('SUMMARY_CODE') is not None]
+        summary_rows = reference_cache.get_rows('summary', 'SUMMARY_CODE', unique_summaries_list, load_summary)
+        summary_tbl = pd.DataFrame(summary_rows, columns=[k for k in SUMMARY_PROJECTION if k != '_id'])
         summary_tbl.rename(columns={'TCNAME': 'TCNAME_SUMMARY',
                                     'JPNAME': 'JPNAME_SUMMARY',
                                     'ENNAME': 'ENNAME_SUMMARY',
@@ -161,6 +453,25 @@ def db_to_dataframe(api_request: List[Dict[str, Any]]) -> pd.DataFrame:
     if 'ORG_ID' in summary_tbl.columns:
         summary_tbl['ORG_ID'] = summary_tbl['ORG_ID'].astype(str).str.strip()
 
+    columns = subset_columns(langus)
+    compact = os.getenv('COMPACT_DTYPES', '0') == '1'
+
+    if get_engine(df_base, item_meta, item_group_map, diag_tbl, summary_tbl) == 'polars':
+        # 四次 left join 於同一個 lazy plan 執行，補齊必要欄位後一次轉回 pandas
+        lf = merge_left(to_polars(df_base), to_polars(item_meta), ['ITEM_CODE', 'ORG_ID'])
+        lf = merge_left(lf, to_polars(item_group_map), ['ITEM_CODE'], suffixes=('_ITEM', '_GROUP'))
+        lf = merge_left(lf, to_polars(diag_tbl), ['DIAG_CODE'])
+        lf = merge_left(lf, to_polars(summary_tbl), ['SUMMARY_CODE'])
+        merged_columns = lf.collect_schema().names()
+        final_df = lf.select([pl.col(col) if col in merged_columns else pl.lit('').alias(col) for col in columns]).collect().to_pandas()
+        return compact_dtypes(final_df) if compact else final_df
+
+    # compact 模式：merge 前先將非 key 的名稱欄位轉為 categorical，merge 時每列只複製整數 code
+    if compact:
+        name_columns = [col for col in COMPACT_COLUMNS if col != 'ORG_ID']
+        for tbl in (df_base, item_meta, item_group_map, summary_tbl):
+            compact_dtypes(tbl, name_columns)
+
     merged_item_name = df_base.merge(item_meta, on=['ITEM_CODE', 'ORG_ID'], how='left')
     merged_group = merged_item_name.merge(item_group_map, on='ITEM_CODE', how='left', suffixes=('_ITEM', '_GROUP'))
 
@@ -177,8 +488,12 @@ def db_to_dataframe(api_request: List[Dict[str, Any]]) -> pd.DataFrame:
         final_df = merged_for_summary.merge(summary_tbl, on=['SUMMARY_CODE'], how='left')
 
     # 保障必要欄位存在（避免 demo fallback 或實際表欄位略有不同）
-    for col in SUBSET:
+    for col in columns:
         if col not in final_df.columns:
             final_df[col] = ''
 
-    return final_df[SUBSET]
+    final_df = final_df[columns]
+    if compact:
+        final_df = compact_dtypes(final_df)
+
+    return final_df
@@ -0,0 +1,467 @@
+"""
+大批次的非同步 job（本機 SQLite queue）：
+- POST /jobs 寫入 queue 後立即回傳 job id；GET /jobs/{id} 查詢進度與結果（依 offset / limit 分頁）
+- 相同 payload（record JSON 的 hash）且尚未失敗/取消、無錯誤結果的 job 直接回傳既有 job id
+- worker 為獨立 process（JOB_WORKERS 個，預設以 spawn 啟動並降低 CPU 優先權），不與 /process 共用 GIL；
+  每次處理 JOB_WINDOW 筆 record，結果與進度於同一個 transaction 寫入，中斷後由已完成處的下一個 window 接續
+- 取消：queued 立即取消；running 於下一個 window 前停止（已完成的結果保留）
+- 重試：window 中有 record 處理失敗時改為逐筆處理，仍失敗的 record 依 JOB_MAX_ATTEMPTS 退避重試該 window，
+  最後一次仍失敗才寫入該 record 的 {record_id, error}（其餘 record 照常寫入）；
+  發生非預期錯誤時依 JOB_MAX_ATTEMPTS 退避重試，用盡次數後標記為 failed，可由 POST /jobs/{id}/retry 重新排入；
+  執行中以 timer 更新 heartbeat，超過 JOB_STALE_SEC 未更新的 running job（worker 異常結束）重新排入
+- LLM_RPM_LIMIT / LLM_TPM_LIMIT 中 JOB_LLM_SHARE 的比例分配給 worker，其餘保留給互動式請求
+
+獨立執行 worker：python job_queue.py worker [--workers N]
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import logging
+import argparse
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+from fastapi import APIRouter, Body, HTTPException
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# job 狀態
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = 'queued', 'running', 'succeeded', 'failed', 'cancelled'
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+def payload_hash(api_requests: List[Dict[str, Any]]) -> str:
+    payload = json.dumps(api_requests, ensure_ascii=False, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class JobQueue:
+
+    def __init__(self, path: str, max_attempts: int = 3, stale_seconds: float = 600):
+        """
+        : param path: SQLite 檔案路徑（API 與 worker process 共用）
+        : param max_attempts: 每個 window 的最多執行次數（record 失敗或非預期錯誤時退避重試）
+        : param stale_seconds: running job 超過此秒數未更新 heartbeat 時視為 worker 已中斷，重新排入
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self.stale_seconds = stale_seconds
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                ' id TEXT PRIMARY KEY, payload_hash TEXT, payload TEXT, status TEXT, total INTEGER, done INTEGER,'
+                ' errors INTEGER, attempts INTEGER, cancel_requested INTEGER, error TEXT,'
+                ' created_at REAL, available_at REAL, started_at REAL, finished_at REAL, heartbeat_at REAL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, available_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_hash ON jobs(payload_hash)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS job_results ('
+                ' job_id TEXT, seq INTEGER, line TEXT, PRIMARY KEY (job_id, seq))'
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # 每次操作各自連線（API thread 與多個 worker process 同時存取）
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute('PRAGMA synchronous=NORMAL')
+            yield conn
+        finally:
+            conn.close()
+
+    def submit(self, api_requests: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        : returns: {'job_id', 'status', 'deduplicated'}
+        """
+        digest = payload_hash(api_requests)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                f"SELECT id, status FROM jobs WHERE payload_hash = ? AND status NOT IN ('{FAILED}', '{CANCELLED}')"
+                ' AND errors = 0 ORDER BY created_at DESC LIMIT 1', (digest,)
+            ).fetchone()
+            if row is not None:
+                conn.execute('COMMIT')
+                return {'job_id': row[0], 'status': row[1], 'deduplicated': True}
+
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                'INSERT INTO jobs (id, payload_hash, payload, status, total, done, errors, attempts, cancel_requested,'
+                ' created_at, available_at) VALUES (?, ?, ?, ?, ?, 0, 0, 0, 0, ?, ?)',
+                (job_id, digest, json.dumps(api_requests, ensure_ascii=False), QUEUED, len(api_requests), now, now)
+            )
+            conn.execute('COMMIT')
+        return {'job_id': job_id, 'status': QUEUED, 'deduplicated': False}
+
+    def get(self, job_id: str, offset: int = 0, limit: int = 0) -> Optional[Dict[str, Any]]:
+        """
+        : param offset / limit: 回傳結果的範圍（依 record 順序）；limit 為 0 時不回傳結果
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT id, status, total, done, errors, attempts, cancel_requested, error,'
+                ' created_at, started_at, finished_at FROM jobs WHERE id = ?', (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            job = dict(zip(['job_id', 'status', 'total', 'done', 'errors', 'attempts', 'cancel_requested', 'error',
+                            'created_at', 'started_at', 'finished_at'], row))
+            job['cancel_requested'] = bool(job['cancel_requested'])
+            job['progress'] = round(job['done'] / job['total'], 4) if job['total'] else 1.0
+            if limit > 0:
+                lines = conn.execute(
+                    'SELECT line FROM job_results WHERE job_id = ? AND seq >= ? ORDER BY seq LIMIT ?',
+                    (job_id, offset, limit)
+                ).fetchall()
+                job['results'] = [json.loads(line) for line, in lines]
+        return job
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """
+        : returns: 取消後的狀態；job 不存在時為 None
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            status = row[0]
+            if status == QUEUED:
+                conn.execute('UPDATE jobs SET status = ?, finished_at = ? WHERE id = ?', (CANCELLED, now, job_id))
+                status = CANCELLED
+            elif status == RUNNING:
+                conn.execute('UPDATE jobs SET cancel_requested = 1 WHERE id = ?', (job_id,))
+            conn.execute('COMMIT')
+        return status
+
+    def retry(self, job_id: str) -> Optional[str]:
+        """
+        將失敗或取消的 job 重新排入（由已完成處接續）
+        : returns: 重新排入後的狀態；job 不存在時為 None
+        """
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is not None and row[0] in (FAILED, CANCELLED):
+                conn.execute(
+                    'UPDATE jobs SET status = ?, attempts = 0, cancel_requested = 0, error = NULL, finished_at = NULL,'
+                    ' available_at = ? WHERE id = ?', (QUEUED, time.time(), job_id)
+                )
+                row = (QUEUED,)
+            conn.execute('COMMIT')
+        return row[0] if row else None
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """
+        取出下一個可執行的 job 並標記為 running（heartbeat 逾時的 running job 先重新排入）
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(
+                'UPDATE jobs SET status = ?, available_at = ? WHERE status = ? AND heartbeat_at < ?',
+                (QUEUED, now, RUNNING, now - self.stale_seconds)
+            )
+            row = conn.execute(
+                'SELECT id, payload, done, attempts FROM jobs WHERE status = ? AND available_at <= ?'
+                ' ORDER BY created_at LIMIT 1', (QUEUED, now)
+            ).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            conn.execute(
+                'UPDATE jobs SET status = ?, attempts = attempts + 1, started_at = COALESCE(started_at, ?), heartbeat_at = ?'
+                ' WHERE id = ?', (RUNNING, now, now, row[0])
+            )
+            conn.execute('COMMIT')
+        return {'job_id': row[0], 'api_requests': json.loads(row[1]), 'done': row[2], 'attempts': row[3] + 1}
+
+    def record_window(self, job_id: str, start: int, lines: List[str]) -> bool:
+        """
+        寫入一個 window 的結果並更新進度
+        : returns: 是否已要求取消
+        """
+        errors = sum('error' in json.loads(line) for line in lines)
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany('INSERT OR REPLACE INTO job_results (job_id, seq, line) VALUES (?, ?, ?)',
+                             [(job_id, start + i, line.strip()) for i, line in enumerate(lines)])
+            # 次數改為計算下一個 window（目前這次執行視為其第 1 次）
+            conn.execute('UPDATE jobs SET done = ?, errors = errors + ?, attempts = 1, heartbeat_at = ? WHERE id = ?',
+                         (start + len(lines), errors, time.time(), job_id))
+            cancel_requested = conn.execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job_id,)).fetchone()[0]
+            conn.execute('COMMIT')
+        return bool(cancel_requested)
+
+    def heartbeat(self, job_id: str):
+        with self._connect() as conn:
+            conn.execute('UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = ?', (time.time(), job_id, RUNNING))
+
+    def finish(self, job_id: str, status: str, error: Optional[str] = None):
+        with self._connect() as conn:
+            conn.execute('UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?',
+                         (status, error, time.time(), job_id))
+
+    def release(self, job_id: str, error: Optional[str] = None, delay: float = 0, refund: bool = False):
+        """
+        將 running job 放回 queue（worker 停止或重試退避）
+        : param refund: 不計入執行次數（worker 正常停止時）
+        """
+        with self._connect() as conn:
+            conn.execute('UPDATE jobs SET status = ?, error = ?, available_at = ?, attempts = attempts - ? WHERE id = ?',
+                         (QUEUED, error, time.time() + delay, int(refund), job_id))
+
+    def stats(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            return dict(conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+
+
+def open_queue() -> JobQueue:
+    return JobQueue(
+        path=os.getenv('JOB_QUEUE_PATH', './cache/job_queue.sqlite3'),
+        max_attempts=int(os.getenv('JOB_MAX_ATTEMPTS', '3')),
+        stale_seconds=float(os.getenv('JOB_STALE_SEC', '600')),
+    )
+
+
+_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_queue() -> JobQueue:
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = open_queue()
+    return _queue
+
+
+class WindowError(Exception):
+    """
+    window 中有 record 處理失敗（process_window 以 error 行回傳）
+    """
+
+
+@contextmanager
+def keep_alive(queue: JobQueue, job_id: str) -> Iterator[None]:
+    """
+    執行期間每 stale_seconds / 3 秒更新 heartbeat，避免較慢的 window 被視為中斷而重複執行
+    """
+    done = threading.Event()
+
+    def beat():
+        while not done.wait(queue.stale_seconds / 3):
+            try:
+                queue.heartbeat(job_id)
+            except sqlite3.Error as e:
+                logger.warning(f"job {job_id} heartbeat 更新失敗: {e}")
+
+    thread = threading.Thread(target=beat, name=f'job-heartbeat-{job_id}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        done.set()
+        thread.join()
+
+
+def run_job(queue: JobQueue, job: Dict[str, Any], window: int, stop: Optional[Any] = None):
+    """
+    由 job['done'] 起逐 window 處理；取消或 worker 停止時於 window 之間結束
+    window 有錯誤時改為逐筆處理；仍失敗的 record 在最後一次執行前不寫入結果（整個 job 退避後由該 window 重試），
+    最後一次執行時寫入其 error 行並繼續下一個 window
+    """
+    from text_processing_251029 import process_window
+
+    job_id, api_requests = job['job_id'], job['api_requests']
+    attempts = job['attempts']
+    try:
+        with keep_alive(queue, job_id):
+            for start in range(job['done'], len(api_requests), window):
+                if stop is not None and stop.is_set():
+                    queue.release(job_id, refund=True)
+                    return
+                records = api_requests[start:start + window]
+                lines = process_window(records)
+                if len(records) > 1 and any('error' in json.loads(line) for line in lines):
+                    # 逐筆處理，只讓出錯的 record 輸出 error
+                    lines = [line for record in records for line in process_window([record])]
+                errors = [row['error'] for row in map(json.loads, lines) if 'error' in row]
+                if errors and attempts < queue.max_attempts:
+                    raise WindowError(f"第 {start} 筆起的 window 有 {len(errors)} 筆失敗: {errors[0]}")
+                if errors:
+                    logger.warning(f"job {job_id} 第 {start} 筆起的 window 有 {len(errors)} 筆 record 於 {attempts} 次執行皆失敗，"
+                                   f"寫入 error: {errors[0]}")
+                if queue.record_window(job_id, start, lines):
+                    queue.finish(job_id, CANCELLED)
+                    return
+                attempts = 1
+        queue.finish(job_id, SUCCEEDED)
+    except Exception as e:
+        logger.error(f"job {job_id} 第 {attempts} 次執行失敗: {e}")
+        if attempts >= queue.max_attempts:
+            queue.finish(job_id, FAILED, str(e))
+        else:
+            queue.release(job_id, str(e), delay=2 ** attempts)
+
+
+def worker_loop(stop: Any, workers: int = 1):
+    """
+    worker process 主迴圈：取出 job 執行，queue 為空時每 JOB_POLL_SEC 秒檢查一次
+    : param workers: worker 總數（分配 LLM 速率上限用）
+    """
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    nice = int(os.getenv('JOB_WORKER_NICE', '10'))
+    if nice and hasattr(os, 'nice'):
+        os.nice(nice)
+    share = float(os.getenv('JOB_LLM_SHARE', '0.5'))
+    for key in ('LLM_RPM_LIMIT', 'LLM_TPM_LIMIT'):
+        limit = float(os.getenv(key, '0'))
+        if limit:
+            os.environ[key] = str(limit * share / workers)
+
+    queue = open_queue()
+    window = max(1, int(os.getenv('JOB_WINDOW', '50')))
+    poll = float(os.getenv('JOB_POLL_SEC', '1'))
+    while not stop.is_set():
+        job = queue.claim()
+        if job is None:
+            stop.wait(poll)
+            continue
+        logger.info(f"開始執行 job {job['job_id']}（{job['done']}/{len(job['api_requests'])}，第 {job['attempts']} 次）")
+        run_job(queue, job, window, stop)
+
+
+_workers: List[multiprocessing.Process] = []
+_stop: Optional[Any] = None
+
+
+def start_workers(count: Optional[int] = None):
+    """
+    啟動 worker process（app 啟動時呼叫；JOB_WORKERS=0 時不啟動，job 由獨立的 worker 執行）
+    """
+    global _stop
+    count = int(os.getenv('JOB_WORKERS', '1')) if count is None else count
+    if count <= 0 or _workers:
+        return
+    context = multiprocessing.get_context(os.getenv('JOB_WORKER_START_METHOD', 'spawn'))
+    _stop = context.Event()
+    for i in range(count):
+        process = context.Process(target=worker_loop, args=(_stop, count), name=f'job-worker-{i}', daemon=True)
+        process.start()
+        _workers.append(process)
+    logger.info(f"已啟動 {count} 個 job worker")
+
+
+def stop_workers(timeout: float = 30):
+    """
+    通知 worker 於目前 window 完成後停止（執行中的 job 放回 queue）
+    """
+    if _stop is not None:
+        _stop.set()
+    for process in _workers:
+        process.join(timeout)
+        if process.is_alive():
+            process.terminate()
+    _workers.clear()
+
+
+REQUIRED_FIELDS = ('RECORD_ID', 'LANG_NO')
+
+
+def validate_record(record: Any) -> Optional[str]:
+    """
+    : returns: record 無法處理的原因；可處理時為 None
+    """
+    if not isinstance(record, dict):
+        return "不是 JSON object"
+    missing = [field for field in REQUIRED_FIELDS if record.get(field) in (None, '')]
+    if missing:
+        return f"缺少 {', '.join(missing)}"
+    return None
+
+
+@router.post("/jobs", status_code=202)
+def submit_job(api_requests: Any = Body(...)):
+    """
+    以 job 方式處理與 /process 相同的輸入，立即回傳 job_id；相同 payload 的進行中或已完成 job 直接回傳既有 job_id
+    任一 record 不是 object 或缺少 RECORD_ID / LANG_NO 時回傳 422（detail 為各筆的 {index, error}），不建立 job
+    """
+    api_requests = [api_requests] if isinstance(api_requests, dict) else api_requests
+    if not isinstance(api_requests, list) or not api_requests:
+        raise HTTPException(status_code=422, detail="需為 record 或 record list")
+    invalid = [{'index': index, 'error': error} for index, error in enumerate(map(validate_record, api_requests))
+               if error is not None]
+    if invalid:
+        raise HTTPException(status_code=422, detail=invalid)
+    return get_queue().submit(api_requests)
+
+
+@router.get("/jobs")
+def job_queue_stats():
+    """
+    各狀態的 job 數與本 process 啟動的 worker 數
+    """
+    return {'jobs': get_queue().stats(), 'workers': sum(process.is_alive() for process in _workers)}
+
+
+@router.get("/jobs/{job_id}")
+def job_status(job_id: str, offset: int = 0, limit: int = 1000):
+    """
+    job 狀態與進度；results 為 offset 起最多 limit 筆 {record_id, report, degraded} 或 {record_id, error}
+    """
+    job = get_queue().get(job_id, offset, limit)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job 不存在")
+    return job
+
+
+@router.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    status = get_queue().cancel(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="job 不存在")
+    return {'job_id': job_id, 'status': status}
+
+
+@router.post("/jobs/{job_id}/retry")
+def retry_job(job_id: str):
+    status = get_queue().retry(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="job 不存在")
+    return {'job_id': job_id, 'status': status}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='job worker')
+    sub = parser.add_subparsers(dest='command', required=True)
+    worker = sub.add_parser('worker', help='執行 job worker（與 API 共用 JOB_QUEUE_PATH）')
+    worker.add_argument('--workers', type=int, default=int(os.getenv('JOB_WORKERS', '1')) or 1)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    start_workers(args.workers)
+    try:
+        for process in _workers:
+            process.join()
+    except KeyboardInterrupt:
+        stop_workers()
+
+
+if __name__ == '__main__':
+    main()
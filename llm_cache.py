@@ -0,0 +1,161 @@
+"""
+LLM 改寫結果的持久化快取（SQLite）：
+- key = sha256(語系, 部署/模型, prompt hash, 原文)，temperature=0 下同一 key 的輸出可重用
+- prompt 內容變更後 hash 不同，舊資料不會再命中，並於啟動時清除
+- 超過容量時依最後使用時間淘汰；可設定 TTL
+- 僅由呼叫端寫入成功的改寫結果（失敗/回退原文者不寫入）
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def text_hash(*parts: str) -> str:
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+class RewriteCache:
+
+    # 每寫入幾筆檢查一次容量
+    EVICT_EVERY = 256
+
+    def __init__(self, path: str, max_entries: int = 200000, ttl_seconds: float = 0):
+        """
+        : param path: SQLite 檔案路徑
+        : param max_entries: 保留筆數上限，超過時淘汰最久未使用者
+        : param ttl_seconds: 資料存活秒數，0 表示不過期
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS rewrites ('
+            ' key TEXT PRIMARY KEY, langu_no TEXT, model TEXT, prompt_hash TEXT,'
+            ' rewritten TEXT, created_at REAL, last_used REAL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_rewrites_last_used ON rewrites(last_used)')
+
+    @staticmethod
+    def make_key(langu_no: str, model: str, prompt_hash: str, text: str) -> str:
+        return text_hash(langu_no, model, prompt_hash, text)
+
+    def get_many(self, langu_no: str, model: str, prompt_hash: str, texts: List[str]) -> Dict[str, str]:
+        """
+        批次查詢
+        : returns: key -> 原文，value -> 快取的改寫後文本（僅含命中者）
+        """
+        keys = {self.make_key(langu_no, model, prompt_hash, t): t for t in texts}
+        if not keys:
+            return {}
+
+        now = time.time()
+        found = {}
+        hit_keys = []
+        with self._lock:
+            key_list = list(keys)
+            for i in range(0, len(key_list), 500):
+                chunk = key_list[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, rewritten, created_at FROM rewrites WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                for key, rewritten, created_at in rows:
+                    if self.ttl_seconds and created_at + self.ttl_seconds < now:
+                        continue
+                    found[keys[key]] = rewritten
+                    hit_keys.append(key)
+            if hit_keys:
+                self._conn.executemany('UPDATE rewrites SET last_used = ? WHERE key = ?', [(now, k) for k in hit_keys])
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put(self, langu_no: str, model: str, prompt_hash: str, text: str, rewritten: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO rewrites (key, langu_no, model, prompt_hash, rewritten, created_at, last_used)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (self.make_key(langu_no, model, prompt_hash, text), langu_no, model, prompt_hash, rewritten, now, now)
+            )
+            self._puts += 1
+            if self._puts % self.EVICT_EVERY == 0:
+                self._evict()
+
+    def _evict(self):
+        if self.ttl_seconds:
+            self._conn.execute('DELETE FROM rewrites WHERE created_at < ?', (time.time() - self.ttl_seconds,))
+        count = self._conn.execute('SELECT COUNT(*) FROM rewrites').fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                'DELETE FROM rewrites WHERE key IN (SELECT key FROM rewrites ORDER BY last_used LIMIT ?)',
+                (count - self.max_entries,)
+            )
+
+    def purge_stale_prompts(self, prompt_hashes: Dict[str, str]) -> int:
+        """
+        清除 prompt 已變更（hash 與目前不同）的資料
+        : param prompt_hashes: key -> 語系，value -> 目前 prompt hash
+        : returns: 刪除筆數
+        """
+        deleted = 0
+        with self._lock:
+            for langu_no, prompt_hash in prompt_hashes.items():
+                cur = self._conn.execute(
+                    'DELETE FROM rewrites WHERE langu_no = ? AND prompt_hash != ?', (langu_no, prompt_hash)
+                )
+                deleted += cur.rowcount
+        if deleted:
+            logger.info(f"已清除 {deleted} 筆舊 prompt 的改寫快取")
+        return deleted
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM rewrites')
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM rewrites').fetchone()[0]
+            return {'entries': entries, 'hits': self.hits, 'misses': self.misses}
+
+
+_rewrite_cache: Optional[RewriteCache] = None
+_rewrite_cache_lock = threading.Lock()
+
+
+def get_rewrite_cache(prompt_hashes: Dict[str, str]) -> Optional[RewriteCache]:
+    """
+    取得共用的改寫快取（LLM_CACHE_ENABLED=0 時回傳 None）；第一次開啟時清除舊 prompt 資料
+    : param prompt_hashes: key -> 語系，value -> 目前 prompt hash
+    """
+    global _rewrite_cache
+    if os.getenv('LLM_CACHE_ENABLED', '1') == '0':
+        return None
+
+    if _rewrite_cache is None:
+        with _rewrite_cache_lock:
+            if _rewrite_cache is None:
+                cache = RewriteCache(
+                    path=os.getenv('LLM_CACHE_PATH', './cache/llm_rewrite_cache.sqlite3'),
+                    max_entries=int(os.getenv('LLM_CACHE_MAX_ENTRIES', '200000')),
+                    ttl_seconds=float(os.getenv('LLM_CACHE_TTL_SEC', '0')),
+                )
+                cache.purge_stale_prompts(prompt_hashes)
+                _rewrite_cache = cache
+    return _rewrite_cache
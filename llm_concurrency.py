@@ -0,0 +1,155 @@
+"""
+LLM 呼叫的自適應並行控制（AIMD，依部署區分、所有 /process 共用）：
+- 延遲正常時每完成一個 window 的呼叫，上限 +1（加法增加）
+- 收到 429、逾時、5xx 或延遲超過目標時，上限乘以 backoff（乘法減少），並有冷卻時間避免連續砍半
+- 上限介於 floor / ceiling 之間，可依部署個別設定
+"""
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import deque
+from typing import Any, Dict, Optional
+
+
+class AdaptiveConcurrency:
+
+    def __init__(self, floor: int = 1, ceiling: int = 16, initial: Optional[int] = None,
+                 target_latency: float = 10.0, backoff: float = 0.5, cooldown: float = 2.0):
+        """
+        : param floor: 並行上限的下限
+        : param ceiling: 並行上限的上限
+        : param initial: 起始上限，預設為 3（原固定 max_workers）並限制於 floor / ceiling 間
+        : param target_latency: 單次呼叫延遲（秒）超過此值視為壅塞
+        : param backoff: 壅塞時上限乘上的比例
+        : param cooldown: 兩次減少之間的最短間隔（秒）
+        """
+        self.floor = floor
+        self.ceiling = ceiling
+        self.limit = float(min(ceiling, max(floor, initial if initial is not None else 3)))
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.successes = 0
+        self.congestions = 0
+        self.decisions: deque = deque(maxlen=50)
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self):
+        """
+        同步等待直到有空位（thread 使用）
+        """
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    async def acquire_async(self):
+        """
+        非同步等待直到有空位（coroutine 使用；以短間隔輪詢，避免在 event loop 中阻塞）
+        """
+        delay = 0.005
+        while not self.try_acquire():
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self, latency: float):
+        """
+        回報一次成功呼叫與其延遲
+        """
+        with self._cond:
+            self.successes += 1
+            if latency > self.target_latency:
+                self._decrease(f'latency {latency:.2f}s')
+                return
+
+            before = int(self.limit)
+            self.limit = min(float(self.ceiling), self.limit + 1 / self.limit)
+            if int(self.limit) > before:
+                self._record('increase', f'latency {latency:.2f}s')
+                self._cond.notify_all()
+
+    def on_congestion(self, reason: str):
+        """
+        回報 429 / 逾時 / 5xx 等壅塞訊號
+        """
+        with self._cond:
+            self.congestions += 1
+            self._decrease(reason)
+
+    def _decrease(self, reason: str):
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.floor), self.limit * self.backoff)
+        self._record('decrease', reason)
+
+    def _record(self, action: str, reason: str):
+        self.decisions.append({'time': time.time(), 'action': action, 'limit': int(self.limit), 'reason': reason})
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'limit': int(self.limit),
+                'floor': self.floor,
+                'ceiling': self.ceiling,
+                'in_flight': self.in_flight,
+                'successes': self.successes,
+                'congestions': self.congestions,
+                'recent_decisions': list(self.decisions),
+            }
+
+
+_controllers: Dict[str, AdaptiveConcurrency] = {}
+_controllers_lock = threading.Lock()
+
+
+def _bounds(deployment: str) -> Dict[str, Any]:
+    """
+    部署的 floor / ceiling：LLM_CONCURRENCY_BOUNDS（JSON，例：{"gpt-4o": {"floor": 2, "ceiling": 32}}）優先，
+    其次為 LLM_CONCURRENCY_MIN / LLM_CONCURRENCY_MAX
+    """
+    bounds = {
+        'floor': int(os.getenv('LLM_CONCURRENCY_MIN', '1')),
+        'ceiling': int(os.getenv('LLM_CONCURRENCY_MAX', '16')),
+    }
+    bounds.update(json.loads(os.getenv('LLM_CONCURRENCY_BOUNDS', '{}')).get(deployment, {}))
+    return bounds
+
+
+def get_concurrency_controller(deployment: str) -> AdaptiveConcurrency:
+    """
+    取得部署對應的共用並行控制器
+    """
+    with _controllers_lock:
+        if deployment not in _controllers:
+            _controllers[deployment] = AdaptiveConcurrency(
+                target_latency=float(os.getenv('LLM_TARGET_LATENCY_SEC', '10')),
+                **_bounds(deployment),
+            )
+        return _controllers[deployment]
+
+
+def concurrency_snapshot() -> Dict[str, Dict[str, Any]]:
+    """
+    所有部署的目前上限與近期調整紀錄
+    """
+    with _controllers_lock:
+        controllers = dict(_controllers)
+    return {deployment: controller.snapshot() for deployment, controller in controllers.items()}
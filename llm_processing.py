@@ -1,11 +1,20 @@
 import os
-import time
 import re
+import json
+import time
+import asyncio
 import logging
+import threading
+import contextvars
 from dotenv import load_dotenv
-from openai import OpenAI
-from typing import List, Dict
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from openai import OpenAI, AsyncOpenAI, APIConnectionError, InternalServerError
+from typing import Any, List, Dict, Optional, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait
+from llm_cache import get_rewrite_cache, text_hash
+from llm_rate_limit import get_rate_limiter, estimate_tokens
+from llm_concurrency import get_concurrency_controller
+from metrics import span, record_llm_call, LLM_RATE_LIMITED, LLM_RETRIES
+from single_flight import get_single_flight
 
 LANGU_DEFAULT_TEXT = ['本項無補充說明', 'No additional information for this item.', 'この項目に関する追加情報はありません。', '本项无补充说明。']
 
@@ -15,6 +24,26 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 logger = logging.getLogger(__name__)
 
 
+# 共用的 OpenAI client（依 endpoint / 部署區分），避免每次建立 translator 都重建連線
+_clients: Dict[tuple, OpenAI] = {}
+_clients_lock = threading.Lock()
+
+
+def get_azure_client(endpoint: str, api_key: str, deployment_name: str) -> OpenAI:
+    api_version = os.getenv('AZURE_OPENAI_API_VERSION', '2024-08-01-preview')
+    key = (endpoint, api_key, deployment_name, api_version)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = OpenAI(
+                api_key=api_key,
+                base_url=f"{endpoint}/openai/deployments/{deployment_name}",
+                default_query={'api-version': api_version},
+                default_headers={'api-key': api_key},
+                max_retries=0,
+            )
+        return _clients[key]
+
+
 class SuggestionTranslator:
 
     SYSTEM_PROMPT = {
@@ -77,17 +106,39 @@ class SuggestionTranslator:
         "请将以下内容改写为专业、易读且容易理解的文字，并保持与原文相近的结构和语气："}
     }
 
-    def __init__(self, langu_no: str, mode: str = 'azure', model: str = 'gpt-4o', max_workers: int = 3):
+    # pack 模式附加於 system prompt 的輸出格式說明
+    PACK_PROMPT = {
+        '1': ("\n輸入為 JSON 字串陣列，請依上述原則逐一獨立改寫每個元素。"
+              "僅輸出 JSON 字串陣列，元素數量與順序需與輸入完全相同，不要輸出其他文字。"),
+        '2': ("\nThe input is a JSON array of strings. Rewrite each element independently following the principles above. "
+              "Output only a JSON array of strings with exactly the same number and order of elements as the input, and nothing else."),
+        '3': ("\n入力は JSON の文字列配列です。上記の原則に従い、各要素をそれぞれ独立して書き換えてください。"
+              "出力は入力と要素数・順序が完全に同じ JSON 文字列配列のみとし、それ以外は出力しないこと。"),
+        '4': ("\n输入为 JSON 字符串数组，请依上述原则逐一独立改写每个元素。"
+              "仅输出 JSON 字符串数组，元素数量与顺序需与输入完全相同，不要输出其他文字。"),
+    }
+
+    def __init__(self, langu_no: str, mode: str = 'azure', model: str = 'gpt-4o', max_workers: Optional[int] = None,
+                 use_async: bool = False, pack: bool = False):
         """
         : param mode: 'azure'（此 demo 僅保留 azure 模式介面）
         : param model: Azure 部署名稱（由環境變數決定實際連線）
-        : param max_workers: 並行處理數量
+        : param max_workers: 並行處理數量上限；None 時依部署的自適應並行控制器 ceiling，實際並行數由控制器調整
+        : param use_async: True 時以 AsyncOpenAI + asyncio 並行（translate_batch 內部以 asyncio.run 執行）
+        : param pack: True 時將多筆文本以 JSON 陣列合併為一次呼叫（每次上限依 LLM_PACK_TOKEN_BUDGET / LLM_PACK_MAX_ITEMS）
         """
         self.langu_no = langu_no
         self.mode = mode.lower()
+        self.use_async = use_async
         self.max_workers = max_workers
         self.max_retries = 3
         self.base_delay = 1
+        self.max_tokens = 300
+        self.pack = pack
+        self.pack_token_budget = int(os.getenv('LLM_PACK_TOKEN_BUDGET', '1500'))
+        self.pack_max_items = int(os.getenv('LLM_PACK_MAX_ITEMS', '30'))
+        self.pack_max_completion_tokens = int(os.getenv('LLM_PACK_MAX_COMPLETION_TOKENS', '4000'))
+        self.flights = get_single_flight('llm_rewrite')
 
         if self.mode == 'azure':
             self._init_azure(model)
@@ -98,6 +149,9 @@ class SuggestionTranslator:
     def _init_azure(self, deployment_name: str):
         endpoint = os.getenv('AZURE_OPENAI_ENDPOINT')
         api_key = os.getenv('AZURE_OPENAI_API_KEY')
+        self.limiter = get_rate_limiter(deployment_name)
+        self.concurrency = get_concurrency_controller(deployment_name)
+        self.max_workers = self.max_workers or self.concurrency.ceiling
 
         # 若未提供金鑰，改用 mock client（可離線跑 demo）
         if not endpoint or not api_key:
@@ -106,50 +160,329 @@ class SuggestionTranslator:
             logger.info("未設定 AZURE_OPENAI_ENDPOINT / AZURE_OPENAI_API_KEY，改用 mock 介面")
             return
 
-        self.client = OpenAI(
-            api_key=api_key,
-            base_url=f"{endpoint}/openai/deployments/{deployment_name}",
-            default_query={'api-version': os.getenv('AZURE_OPENAI_API_VERSION', '2024-08-01-preview')},
-            default_headers={'api-key': api_key},
-        )
+        self.endpoint = endpoint
+        self.api_key = api_key
+        self.client = get_azure_client(endpoint, api_key, deployment_name)
         self.model = deployment_name
         logger.info(f"使用 Azure OpenAI - 部署: {deployment_name}")
 
-    def translate_batch(self, suggestions: List[str]) -> Dict[str, str]:
+    # AsyncOpenAI 綁定建立時的 event loop，因此每次 translate_batch_async 各自建立並關閉
+    def _new_async_client(self) -> AsyncOpenAI:
+        return AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=f"{self.endpoint}/openai/deployments/{self.model}",
+            default_query={'api-version': os.getenv('AZURE_OPENAI_API_VERSION', '2024-08-01-preview')},
+            default_headers={'api-key': self.api_key},
+            max_retries=0,
+        )
+
+    @classmethod
+    def prompt_hash(cls, langu_no: str) -> str:
+        """
+        SYSTEM_PROMPT / PACK_PROMPT 指定語系內容的 hash（prompt 修改後改寫快取自動失效）
+        """
+        prompt = cls.SYSTEM_PROMPT[langu_no]
+        return text_hash(prompt['system_prompt'], prompt['user_prompt'], cls.PACK_PROMPT[langu_no])[:16]
+
+    def _get_cache(self):
+        # mock 模式不使用快取
+        if self.client is None:
+            return None
+        return get_rewrite_cache({k: self.prompt_hash(k) for k in self.SYSTEM_PROMPT})
+
+    def _lookup_cached(self, suggestions: List[str]) -> Tuple[Dict[str, str], List[str]]:
+        """
+        預設文字與快取命中者直接填入結果
+        : returns: (已有結果, 仍需呼叫 API 的文本)
+        """
+        results = {}
+
+        # 先查改寫快取，命中者不呼叫 API
+        cache = self._get_cache()
+        if cache is not None:
+            results.update(cache.get_many(self.langu_no, self.model, self.prompt_hash(self.langu_no),
+                                          [s for s in suggestions if s not in LANGU_DEFAULT_TEXT]))
+
+        pending = []
+        for suggestion in suggestions:
+            if suggestion in results:
+                continue
+            if suggestion in LANGU_DEFAULT_TEXT:
+                results[suggestion] = suggestion
+                continue
+            if suggestion not in pending:
+                pending.append(suggestion)
+
+        return results, pending
+
+    def _store_result(self, suggestion: str, translated: str, results: Dict[str, str]):
+        results[suggestion] = translated
+
+        # 失敗時回傳原文，不寫入快取
+        cache = self._get_cache()
+        if cache is not None and translated != suggestion:
+            cache.put(self.langu_no, self.model, self.prompt_hash(self.langu_no), suggestion, translated)
+
+    def _claim_pending(self, pending: List[str]) -> Tuple[List[str], Dict[str, Future]]:
+        """
+        其他 request 正在改寫的相同文本（同語系、部署與 prompt）不重複送出，改為等待其結果
+        : returns: (由本次改寫的文本, key -> 原文，value -> 其他 request 執行中的 Future)
+        """
+        if self.client is None:
+            return pending, {}
+        keys = {self._flight_key(suggestion): suggestion for suggestion in pending}
+        owned, waiting = self.flights.claim(keys)
+        return [keys[key] for key in owned], {keys[key]: future for key, future in waiting.items()}
+
+    def _flight_key(self, suggestion: str) -> tuple:
+        return (self.langu_no, self.model, self.prompt_hash(self.langu_no), suggestion)
+
+    def _resolve_flights(self, suggestions: List[str], results: Dict[str, str], owned: set):
+        """
+        通知等待相同文本的其他 request（未取得結果者以原文回傳）
+        """
+        for suggestion in suggestions:
+            if suggestion in owned:
+                owned.discard(suggestion)
+                self.flights.resolve(self._flight_key(suggestion), results.get(suggestion, suggestion))
+
+    def _make_units(self, pending: List[str]) -> List[List[str]]:
+        """
+        將待改寫文本切成呼叫單位：一般模式每筆一個；pack 模式依 token 預算與筆數上限合併
+        """
+        if not self.pack:
+            return [[suggestion] for suggestion in pending]
+
+        units, unit, unit_tokens = [], [], 0
+        for suggestion in pending:
+            tokens = estimate_tokens(suggestion)
+            if unit and (unit_tokens + tokens > self.pack_token_budget or len(unit) >= self.pack_max_items):
+                units.append(unit)
+                unit, unit_tokens = [], 0
+            unit.append(suggestion)
+            unit_tokens += tokens
+        if unit:
+            units.append(unit)
+        return units
+
+    def translate_batch(self, suggestions: List[str], timeout: Optional[float] = None) -> Dict[str, str]:
         """
         批次改寫多筆文本
         : param suggestions: texts
+        : param timeout: 最多等待秒數；逾時未完成者以原文回傳並記錄於 self.degraded，
+                         未完成的改寫於背景繼續執行並寫入快取
         : returns: key -> 原文，value -> 改寫後文本
         """
+        self.degraded = []
         if not suggestions:
             logger.warning("清單為空")
             return {}
 
-        logger.info(f"開始處理 {len(suggestions)} 筆文本")
+        if timeout is None:
+            results = {}
+            self._run_batch(suggestions, results)
+            return results
+
+        # 於背景 thread 執行，結果逐筆寫入共用 dict；逾時則取當下已完成的部分
         results = {}
+        done = threading.Event()
 
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            futures = {}
+        def run():
+            try:
+                self._run_batch(suggestions, results)
+            except Exception as e:
+                logger.error(f"背景改寫失敗: {e}")
+            finally:
+                done.set()
+
+        # 背景 thread 沿用目前的 context，span 仍記錄於呼叫端的 span 之下
+        threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True).start()
+        if not done.wait(max(timeout, 0)):
+            logger.warning(f"改寫逾時（{timeout:.2f}秒），未完成者以原文回傳並於背景繼續")
+
+        snapshot = dict(results)
+        self.degraded = [s for s in dict.fromkeys(suggestions) if s not in snapshot]
+        snapshot.update({s: s for s in self.degraded})
+        return snapshot
+
+    def _run_batch(self, suggestions: List[str], results: Dict[str, str]):
+        if self.use_async:
+            asyncio.run(self.translate_batch_async(suggestions, results))
+            return
 
-            for suggestion in suggestions:
-                if suggestion in LANGU_DEFAULT_TEXT:
-                    results[suggestion] = suggestion
-                    continue
+        logger.info(f"開始處理 {len(suggestions)} 筆文本")
+        cached, pending = self._lookup_cached(suggestions)
+        results.update(cached)
+        pending, waiting = self._claim_pending(pending)
+        owned = set(pending)
+        for suggestion, flight in waiting.items():
+            flight.add_done_callback(lambda f, s=suggestion: results.__setitem__(s, f.result()))
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                # 每個呼叫單位各自複製 context（同一個 Context 不能同時於多個 thread 執行）
+                futures = {executor.submit(contextvars.copy_context().run, self._run_unit, unit): unit
+                           for unit in self._make_units(pending)}
+
+                for future in as_completed(futures):
+                    unit = futures[future]
+                    try:
+                        for suggestion, translated in future.result().items():
+                            self._store_result(suggestion, translated, results)
+                    except Exception as e:
+                        logger.error(f"處理失敗 - {unit[0][:50]}...: {e}")
+                        results.update({suggestion: suggestion for suggestion in unit})
+                    self._resolve_flights(unit, results, owned)
+        finally:
+            self._resolve_flights(pending, results, owned)
+
+        wait(list(waiting.values()))
+        logger.info(f"完成 {len(results)} 筆")
 
-                future = executor.submit(self._translate_single, suggestion)
-                futures[future] = suggestion
+    async def translate_batch_async(self, suggestions: List[str], results: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """
+        批次改寫多筆文本（asyncio 版）
+        : param suggestions: texts
+        : param results: 結果寫入的 dict（每完成一個呼叫單位即寫入）；None 時新建
+        : returns: key -> 原文，value -> 改寫後文本
+        """
+        results = {} if results is None else results
+        if not suggestions:
+            logger.warning("清單為空")
+            return results
 
-            for future in as_completed(futures):
-                suggestion = futures[future]
-                try:
-                    results[suggestion] = future.result()
-                except Exception as e:
-                    logger.error(f"處理失敗 - {suggestion[:50]}...: {e}")
-                    results[suggestion] = suggestion
+        logger.info(f"開始處理 {len(suggestions)} 筆文本（async）")
+        cached, pending = self._lookup_cached(suggestions)
+        results.update(cached)
+        pending, waiting = self._claim_pending(pending)
+        owned = set(pending)
+        units = self._make_units(pending)
+
+        semaphore = asyncio.Semaphore(self.max_workers)
+        async_client = self._new_async_client() if self.client is not None and units else None
+
+        async def run(unit: List[str]):
+            try:
+                async with semaphore:
+                    with span('llm_unit', langu_no=self.langu_no, items=len(unit)):
+                        output = await self._translate_unit_async(unit, async_client)
+            except Exception as e:
+                logger.error(f"處理失敗 - {unit[0][:50]}...: {e}")
+                results.update({suggestion: suggestion for suggestion in unit})
+            else:
+                for suggestion, translated in output.items():
+                    self._store_result(suggestion, translated, results)
+            self._resolve_flights(unit, results, owned)
+
+        async def join(suggestion: str, flight: Future):
+            results[suggestion] = await asyncio.wrap_future(flight)
+
+        try:
+            await asyncio.gather(*(run(unit) for unit in units), *(join(s, f) for s, f in waiting.items()))
+        finally:
+            self._resolve_flights(pending, results, owned)
+            if async_client is not None:
+                await async_client.close()
 
         logger.info(f"完成 {len(results)} 筆")
         return results
 
+    def _request_kwargs(self, suggestion: str) -> Dict[str, Any]:
+        return dict(
+            model=self.model,
+            messages=[
+                {'role': 'system', 'content': self.SYSTEM_PROMPT[self.langu_no]['system_prompt']},
+                {'role': 'user', 'content': f"{self.SYSTEM_PROMPT[self.langu_no]['user_prompt']}{suggestion}"}
+            ],
+            max_tokens=self.max_tokens,
+            temperature=0,
+            frequency_penalty=0,
+            presence_penalty=0,
+            top_p=1,
+        )
+
+    def _packed_request_kwargs(self, unit: List[str]) -> Dict[str, Any]:
+        request_kwargs = self._request_kwargs(json.dumps(unit, ensure_ascii=False))
+        request_kwargs['messages'][0]['content'] += self.PACK_PROMPT[self.langu_no]
+        request_kwargs['max_tokens'] = min(self.max_tokens * len(unit), self.pack_max_completion_tokens)
+        return request_kwargs
+
+    @staticmethod
+    def _parse_packed(content: Optional[str], expected: int) -> Optional[List[str]]:
+        """
+        解析 pack 模式輸出的 JSON 陣列；格式錯誤或筆數不符回傳 None
+        """
+        if not content:
+            return None
+        content = re.sub(r'^```(?:json)?\s*|\s*```$', '', content.strip())
+        try:
+            parsed = json.loads(content)
+        except ValueError:
+            return None
+        if not isinstance(parsed, list) or len(parsed) != expected:
+            return None
+        if not all(isinstance(item, str) and item.strip() for item in parsed):
+            return None
+        return [item.strip() for item in parsed]
+
+    def _estimate_tokens(self, request_kwargs: Dict[str, Any]) -> int:
+        return estimate_tokens(''.join(m['content'] for m in request_kwargs['messages']), request_kwargs['max_tokens'])
+
+    def _record_usage(self, response, estimated: int):
+        usage = getattr(response, 'usage', None)
+        if usage is not None and getattr(usage, 'total_tokens', None):
+            self.limiter.record_usage(estimated, usage.total_tokens)
+
+    def _run_unit(self, unit: List[str]) -> Dict[str, str]:
+        with span('llm_unit', langu_no=self.langu_no, items=len(unit)):
+            return self._translate_unit(unit)
+
+    def _translate_unit(self, unit: List[str]) -> Dict[str, str]:
+        """
+        改寫一個呼叫單位；pack 輸出無法解析時對半切開遞迴處理，單筆時改用 _translate_single
+        呼叫本身失敗時不拆分，整個單位以原文回傳（與 _translate_single 失敗時相同）
+        """
+        if len(unit) == 1:
+            return {unit[0]: self._translate_single(unit[0])}
+
+        if self.client is None:
+            return {suggestion: f"[LLM_OUTPUT]{suggestion}" for suggestion in unit}
+
+        content = self._complete(self._packed_request_kwargs(unit), unit[0])
+        if content is None:
+            # 呼叫失敗（錯誤或重試用盡）時拆分只會增加呼叫次數，整個單位以原文回傳
+            return {suggestion: suggestion for suggestion in unit}
+        translated = self._parse_packed(content, len(unit))
+        if translated is not None:
+            return dict(zip(unit, translated))
+
+        logger.warning(f"pack 輸出格式不符，拆分 {len(unit)} 筆重試")
+        half = len(unit) // 2
+        return {**self._translate_unit(unit[:half]), **self._translate_unit(unit[half:])}
+
+    async def _translate_unit_async(self, unit: List[str], async_client: Optional[AsyncOpenAI]) -> Dict[str, str]:
+        """
+        改寫一個呼叫單位（asyncio 版）
+        """
+        if len(unit) == 1:
+            return {unit[0]: await self._translate_single_async(unit[0], async_client)}
+
+        if async_client is None:
+            return {suggestion: f"[LLM_OUTPUT]{suggestion}" for suggestion in unit}
+
+        content = await self._complete_async(async_client, self._packed_request_kwargs(unit), unit[0])
+        if content is None:
+            return {suggestion: suggestion for suggestion in unit}
+        translated = self._parse_packed(content, len(unit))
+        if translated is not None:
+            return dict(zip(unit, translated))
+
+        logger.warning(f"pack 輸出格式不符，拆分 {len(unit)} 筆重試")
+        half = len(unit) // 2
+        first, second = await asyncio.gather(self._translate_unit_async(unit[:half], async_client),
+                                             self._translate_unit_async(unit[half:], async_client))
+        return {**first, **second}
+
     def _translate_single(self, suggestion: str) -> str:
         """
         逐一改寫
@@ -158,39 +491,121 @@ class SuggestionTranslator:
         if self.client is None:
             return f"[LLM_OUTPUT]{suggestion}"
 
+        translated = self._complete(self._request_kwargs(suggestion), suggestion)
+        return translated.strip() if translated else suggestion
+
+    async def _translate_single_async(self, suggestion: str, async_client: Optional[AsyncOpenAI]) -> str:
+        """
+        逐一改寫（asyncio 版）
+        """
+        if async_client is None:
+            return f"[LLM_OUTPUT]{suggestion}"
+
+        translated = await self._complete_async(async_client, self._request_kwargs(suggestion), suggestion)
+        return translated.strip() if translated else suggestion
+
+    def _complete(self, request_kwargs: Dict[str, Any], label: str) -> Optional[str]:
+        """
+        呼叫 chat completion（含速率限制、並行控制與重試）
+        : param label: 記錄 log 用的文本
+        : returns: 模型輸出；失敗時回傳 None
+        """
+        estimated = self._estimate_tokens(request_kwargs)
+
         for attempt in range(self.max_retries):
+            # 先取得並行名額再等待速率額度：等待名額期間若有其他呼叫收到 429，取得名額後仍會一起暫停
+            self.concurrency.acquire()
+            start_time = time.monotonic()
             try:
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {'role': 'system', 'content': self.SYSTEM_PROMPT[self.langu_no]['system_prompt']},
-                        {'role': 'user', 'content': f"{self.SYSTEM_PROMPT[self.langu_no]['user_prompt']}{suggestion}"}
-                    ],
-                    max_tokens=300,
-                    temperature=0,
-                    frequency_penalty=0,
-                    presence_penalty=0,
-                    top_p=1,
-                )
-
-                translated = response.choices[0].message.content.strip()
-                logger.info(f"成功: {suggestion[:30]}...")
-                return translated
+                self.limiter.acquire(estimated)
+                start_time = time.monotonic()
+                response = self.client.chat.completions.create(**request_kwargs)
+                elapsed = time.monotonic() - start_time
+                self.concurrency.on_success(elapsed)
+                self._record_usage(response, estimated)
+                record_llm_call(self.model, elapsed, 'success', getattr(response, 'usage', None))
+
+                logger.debug(f"成功: {label[:30]}...")
+                return response.choices[0].message.content
 
             except Exception as e:
-                if self._is_rate_limit_error(e):
-                    wait_time = self._get_retry_wait_time(str(e), attempt)
-                    logger.warning(f"達到速率限制，等待 {wait_time:.1f}秒 (第{attempt+1}/{self.max_retries}次)")
-                    time.sleep(wait_time)
+                record_llm_call(self.model, time.monotonic() - start_time, 'rate_limit' if self._is_rate_limit_error(e) else 'error')
+                delay = self._retry_delay(e, label, attempt)
+            finally:
+                self.concurrency.release()
+
+            if delay is None:
+                return None
+            time.sleep(delay)
 
-                    if attempt == self.max_retries - 1:
-                        logger.error(f"達到最大重試次數 - {suggestion[:50]}...")
-                        return suggestion
-                else:
-                    logger.error(f"處理錯誤 - {suggestion[:50]}...: {e}")
-                    return suggestion
+        return None
+
+    async def _complete_async(self, async_client: AsyncOpenAI, request_kwargs: Dict[str, Any], label: str) -> Optional[str]:
+        """
+        呼叫 chat completion（asyncio 版）
+        """
+        estimated = self._estimate_tokens(request_kwargs)
+
+        for attempt in range(self.max_retries):
+            await self.concurrency.acquire_async()
+            start_time = time.monotonic()
+            try:
+                # 等待速率額度期間被取消時，由 finally 釋放並行名額
+                await self.limiter.acquire_async(estimated)
+                start_time = time.monotonic()
+                response = await async_client.chat.completions.create(**request_kwargs)
+                elapsed = time.monotonic() - start_time
+                self.concurrency.on_success(elapsed)
+                self._record_usage(response, estimated)
+                record_llm_call(self.model, elapsed, 'success', getattr(response, 'usage', None))
+
+                logger.debug(f"成功: {label[:30]}...")
+                return response.choices[0].message.content
+
+            except Exception as e:
+                record_llm_call(self.model, time.monotonic() - start_time, 'rate_limit' if self._is_rate_limit_error(e) else 'error')
+                delay = self._retry_delay(e, label, attempt)
+            finally:
+                self.concurrency.release()
+
+            if delay is None:
+                return None
+            await asyncio.sleep(delay)
+
+        return None
+
+    def _retry_delay(self, error: Exception, suggestion: str, attempt: int) -> Optional[float]:
+        """
+        判斷是否重試（SDK 自身重試已關閉，統一由此處理）
+        - 速率限制：暫停共用 limiter，所有呼叫端一起等待（回傳 0，由下次 acquire 等待）
+        - 連線/逾時/5xx：本呼叫端指數退避
+        以上兩者皆回報並行控制器降低上限
+        : returns: 重試前需額外等待的秒數；None 表示不重試
+        """
+        last_attempt = attempt == self.max_retries - 1
+
+        if self._is_rate_limit_error(error):
+            LLM_RATE_LIMITED.inc(self.model)
+            reason = 'rate_limit'
+            wait_time = self._get_retry_wait_time(str(error), attempt)
+            logger.warning(f"達到速率限制，全部暫停 {wait_time:.1f}秒 (第{attempt+1}/{self.max_retries}次)")
+            self.limiter.pause(wait_time)
+            self.concurrency.on_congestion('rate_limit')
+            delay = 0.0
+        elif isinstance(error, (APIConnectionError, InternalServerError)):
+            reason = type(error).__name__
+            self.concurrency.on_congestion(reason)
+            delay = self.base_delay * (2 ** attempt)
+            logger.warning(f"暫時性錯誤，{delay:.1f}秒後重試 (第{attempt+1}/{self.max_retries}次): {error}")
+        else:
+            logger.error(f"處理錯誤 - {suggestion[:50]}...: {error}")
+            return None
 
-        return suggestion
+        if last_attempt:
+            logger.error(f"達到最大重試次數 - {suggestion[:50]}...")
+            return None
+        LLM_RETRIES.inc(self.model, reason)
+        return delay
 
     @staticmethod
     def _is_rate_limit_error(error: Exception) -> bool:
@@ -205,12 +620,25 @@ class SuggestionTranslator:
         return self.base_delay * (2 ** attempt)
 
 
-def process_suggestion(langu_no:str, suggestion_list: List[str], mode: str = 'azure', model: str = 'gpt-4o') -> Dict[str, str]:
+def process_suggestion(langu_no:str, suggestion_list: List[str], mode: str = 'azure', model: str = 'gpt-4o',
+                       use_async: Optional[bool] = None, pack: Optional[bool] = None,
+                       timeout: Optional[float] = None, degraded: Optional[List[str]] = None) -> Dict[str, str]:
     """
     : param suggestion_list: 文本列表
     : param mode: 'azure'
     : param model: 部署名稱
+    : param use_async: 是否使用 asyncio 版；None 時依 LLM_ASYNC_MODE 環境變數
+    : param pack: 是否多筆合併為一次呼叫；None 時依 LLM_PACK_MODE 環境變數
+    : param timeout: 最多等待秒數；None 表示等待全部完成
+    : param degraded: 若提供，逾時而以原文回傳的文本會附加於此 list
     : return: key -> 原文，value -> 改寫後文本
     """
-    translator = SuggestionTranslator(langu_no=langu_no, mode=mode, model=model)
-    return translator.translate_batch(suggestion_list)
+    if use_async is None:
+        use_async = os.getenv('LLM_ASYNC_MODE', '0') == '1'
+    if pack is None:
+        pack = os.getenv('LLM_PACK_MODE', '0') == '1'
+    translator = SuggestionTranslator(langu_no=langu_no, mode=mode, model=model, use_async=use_async, pack=pack)
+    results = translator.translate_batch(suggestion_list, timeout=timeout)
+    if degraded is not None:
+        degraded.extend(translator.degraded)
+    return results
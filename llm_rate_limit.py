@@ -0,0 +1,122 @@
+"""
+LLM 呼叫的全域速率限制（依部署區分）：
+- requests-per-minute 與 tokens-per-minute 兩個 token bucket，同時滿足才放行
+- 收到 429 時呼叫 pause()，所有等待中的 thread / coroutine 一起暫停到指定時間
+- 同一 process 內所有 translator（同步 thread 或 asyncio）共用同一個 limiter
+"""
+import os
+import time
+import asyncio
+import threading
+from typing import Dict, Optional
+
+
+class RateLimiter:
+
+    def __init__(self, rpm: float = 0, tpm: float = 0):
+        """
+        : param rpm: 每分鐘請求數上限，0 表示不限制
+        : param tpm: 每分鐘 token 數上限，0 表示不限制
+        """
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def _reserve(self, tokens: int) -> float:
+        """
+        嘗試取得額度；成功回傳 0，否則回傳建議等待秒數（不扣額度）
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+
+            self._refill(now)
+            tokens = min(tokens, self.tpm) if self.tpm else tokens
+            wait = 0.0
+            if self.rpm and self._requests < 1:
+                wait = max(wait, (1 - self._requests) * 60 / self.rpm)
+            if self.tpm and self._tokens < tokens:
+                wait = max(wait, (tokens - self._tokens) * 60 / self.tpm)
+            if wait > 0:
+                return wait
+
+            if self.rpm:
+                self._requests -= 1
+            if self.tpm:
+                self._tokens -= tokens
+            return 0.0
+
+    def acquire(self, tokens: int = 0):
+        """
+        同步等待直到取得額度（thread 使用）
+        """
+        while True:
+            wait = self._reserve(tokens)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: int = 0):
+        """
+        非同步等待直到取得額度（coroutine 使用）
+        """
+        while True:
+            wait = self._reserve(tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float):
+        """
+        收到 429 時呼叫：所有呼叫端暫停 seconds 秒
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self.throttled += 1
+
+    def record_usage(self, estimated: int, actual: int):
+        """
+        以實際 token 用量修正預估值（多退少補）
+        """
+        if not self.tpm:
+            return
+        with self._lock:
+            self._tokens = min(self.tpm, self._tokens + estimated - actual)
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(deployment: str) -> RateLimiter:
+    """
+    取得部署對應的共用 limiter（上限由 LLM_RPM_LIMIT / LLM_TPM_LIMIT 提供）
+    """
+    with _limiters_lock:
+        if deployment not in _limiters:
+            _limiters[deployment] = RateLimiter(
+                rpm=float(os.getenv('LLM_RPM_LIMIT', '0')),
+                tpm=float(os.getenv('LLM_TPM_LIMIT', '0')),
+            )
+        return _limiters[deployment]
+
+
+def estimate_tokens(text: str, max_tokens: Optional[int] = 0) -> int:
+    """
+    粗估 prompt + completion token 數（以 UTF-8 位元組 / 3 近似）
+    """
+    return len(text.encode('utf-8')) // 3 + (max_tokens or 0)
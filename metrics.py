@@ -0,0 +1,211 @@
+"""
+Pipeline 觀測指標（Prometheus text format，由 app 的 /metrics 輸出）：
+- span()：計時區段，記錄 pipeline_stage_seconds / pipeline_stage_rows；巢狀 span 以 contextvar 記錄上層，
+  完成時輸出 DEBUG log（name、parent、秒數、筆數）；於其他 thread 執行的工作需以 contextvars.copy_context().run
+  提交，才會記錄於呼叫端的 span 之下
+- timed_query()：MongoDB 查詢的耗時與回傳筆數
+- LLM 呼叫的延遲、重試、429 與 prompt / completion token 數由 llm_processing 記錄
+- METRICS_ENABLED=0 時所有記錄函式直接返回（span 回傳共用的空物件）
+- 指標為各 process 獨立；多 worker 部署時由 Prometheus 依 instance 彙總
+"""
+import os
+import time
+import bisect
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv('METRICS_ENABLED', '1') != '0'
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+ROW_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: LabelValues, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1):
+        if not ENABLED:
+            return
+        key = tuple(str(v) for v in label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += [f'{self.name}{_label_text(self.labels, key)} {value:g}' for key, value in items]
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # key -> label 值，value -> [各 bucket 計數（不累計）..., +Inf 計數, 總和]
+        self._values: Dict[LabelValues, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        if not ENABLED:
+            return
+        key = tuple(str(v) for v in label_values)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((key, list(counts)) for key, counts in self._values.items())
+        for key, counts in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound:g}"'
+                lines.append(f'{self.name}_bucket{_label_text(self.labels, key, le)} {cumulative:g}')
+            lines.append(f'{self.name}_sum{_label_text(self.labels, key)} {counts[-1]:g}')
+            lines.append(f'{self.name}_count{_label_text(self.labels, key)} {cumulative:g}')
+        return lines
+
+
+STAGE_SECONDS = Histogram('pipeline_stage_seconds', 'Pipeline stage duration in seconds', ['stage'])
+STAGE_ROWS = Histogram('pipeline_stage_rows', 'Rows produced by a pipeline stage', ['stage'], ROW_BUCKETS)
+STAGE_ERRORS = Counter('pipeline_stage_errors_total', 'Pipeline stages that raised an exception', ['stage'])
+
+MONGO_SECONDS = Histogram('mongo_query_seconds', 'MongoDB query duration in seconds', ['collection', 'operation'])
+MONGO_ROWS = Histogram('mongo_query_rows', 'Documents returned by a MongoDB query', ['collection', 'operation'], ROW_BUCKETS)
+
+LLM_SECONDS = Histogram('llm_request_seconds', 'LLM chat completion latency in seconds', ['deployment', 'outcome'])
+LLM_RETRIES = Counter('llm_retries_total', 'LLM calls retried, by reason', ['deployment', 'reason'])
+LLM_RATE_LIMITED = Counter('llm_rate_limited_total', 'LLM calls rejected with 429 / rate limit', ['deployment'])
+LLM_TOKENS = Counter('llm_tokens_total', 'Tokens reported by the LLM API', ['deployment', 'kind'])
+LLM_TOKENS_PER_CALL = Histogram('llm_tokens_per_call', 'Total tokens per LLM call', ['deployment'], TOKEN_BUCKETS)
+
+SINGLE_FLIGHT = Counter('single_flight_total', 'Single-flight keys executed (leader) or joined in flight (coalesced)', ['group', 'role'])
+
+REGISTRY = [
+    STAGE_SECONDS, STAGE_ROWS, STAGE_ERRORS, MONGO_SECONDS, MONGO_ROWS,
+    LLM_SECONDS, LLM_RETRIES, LLM_RATE_LIMITED, LLM_TOKENS, LLM_TOKENS_PER_CALL, SINGLE_FLIGHT,
+]
+
+
+class Span:
+
+    __slots__ = ('name', 'parent', 'rows', 'attributes')
+
+    def __init__(self, name: str, parent: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.parent = parent
+        self.rows: Optional[int] = None
+        self.attributes = attributes
+
+
+class _NoopSpan:
+
+    __slots__ = ()
+    name = parent = rows = None
+
+    def __setattr__(self, key, value):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+_current_span: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('current_span', default=None)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """
+    計時區段；於區段內設定 s.rows 以記錄輸出筆數
+    : param attributes: 附加於 DEBUG log 的欄位
+    """
+    if not ENABLED:
+        yield _NOOP_SPAN
+        return
+
+    current = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(name)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException:
+        STAGE_ERRORS.inc(name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        _current_span.reset(token)
+        STAGE_SECONDS.observe(elapsed, name)
+        if current.rows is not None:
+            STAGE_ROWS.observe(current.rows, name)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"span name={name} parent={current.parent} seconds={elapsed:.6f} rows={current.rows} {attributes}")
+
+
+def timed_query(collection: str, operation: str, run: Callable[[], List[Any]]) -> List[Any]:
+    """
+    執行 MongoDB 查詢並記錄耗時與回傳筆數
+    : param run: 回傳 list 的查詢函式
+    """
+    if not ENABLED:
+        return run()
+    start = time.perf_counter()
+    rows = run()
+    MONGO_SECONDS.observe(time.perf_counter() - start, collection, operation)
+    MONGO_ROWS.observe(len(rows), collection, operation)
+    return rows
+
+
+def record_llm_call(deployment: str, seconds: float, outcome: str, usage: Any = None):
+    """
+    : param outcome: success / rate_limit / error 等
+    : param usage: API 回傳的 usage（含 prompt_tokens / completion_tokens）
+    """
+    if not ENABLED:
+        return
+    LLM_SECONDS.observe(seconds, deployment, outcome)
+    if usage is not None:
+        prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+        completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+        LLM_TOKENS.inc(deployment, 'prompt', amount=prompt_tokens)
+        LLM_TOKENS.inc(deployment, 'completion', amount=completion_tokens)
+        LLM_TOKENS_PER_CALL.observe(prompt_tokens + completion_tokens, deployment)
+
+
+def render() -> str:
+    """
+    所有指標的 Prometheus text 格式
+    """
+    return '\n'.join(line for metric in REGISTRY for line in metric.render()) + '\n'
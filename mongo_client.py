@@ -0,0 +1,74 @@
+"""
+共用的 MongoDB client：
+- 整個 process 僅建立一個 MongoClient（內含連線池），避免每次請求重新握手
+- 連線池大小、逾時與 read preference 由環境變數提供
+- 由 app 啟動 / 關閉時呼叫 get_client() / close_client()
+"""
+import os
+import time
+import threading
+import logging
+import pymongo
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+_client: Optional[pymongo.MongoClient] = None
+_lock = threading.Lock()
+
+
+def client_options() -> Dict[str, Any]:
+    """
+    由環境變數組出 MongoClient 參數
+    """
+    return {
+        'maxPoolSize': int(os.getenv('MONGODB_MAX_POOL_SIZE', '50')),
+        'minPoolSize': int(os.getenv('MONGODB_MIN_POOL_SIZE', '0')),
+        'serverSelectionTimeoutMS': int(os.getenv('MONGODB_SERVER_SELECTION_TIMEOUT_MS', '5000')),
+        'connectTimeoutMS': int(os.getenv('MONGODB_CONNECT_TIMEOUT_MS', '5000')),
+        'socketTimeoutMS': int(os.getenv('MONGODB_SOCKET_TIMEOUT_MS', '30000')),
+        'readPreference': os.getenv('MONGODB_READ_PREFERENCE', 'primary'),
+    }
+
+
+def get_client() -> pymongo.MongoClient:
+    """
+    取得共用 client；第一次呼叫時建立
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                mongo_uri = os.getenv('MONGODB_URI', '')
+                if not mongo_uri:
+                    raise RuntimeError("未設定 MONGODB_URI")
+                _client = pymongo.MongoClient(mongo_uri, **client_options())
+                logger.info("已建立 MongoDB 連線池")
+    return _client
+
+
+def close_client():
+    """
+    關閉共用 client（app shutdown 時呼叫）
+    """
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+            logger.info("已關閉 MongoDB 連線池")
+
+
+def ping() -> Dict[str, Any]:
+    """
+    健康檢查：對 admin 執行 ping，回傳狀態與往返時間
+    """
+    if not os.getenv('MONGODB_URI', ''):
+        return {'status': 'disabled'}
+
+    start_time = time.perf_counter()
+    try:
+        get_client().admin.command('ping')
+    except Exception as e:
+        return {'status': 'error', 'detail': str(e)}
+    return {'status': 'ok', 'latency_ms': round((time.perf_counter() - start_time) * 1000, 3)}
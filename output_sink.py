@@ -0,0 +1,195 @@
+"""
+/process 中間與最終結果的輸出（OUTPUT_SINK=csv / parquet / none）：
+- 由背景 thread 寫檔，request 只負責放入有界 queue；queue 滿時捨棄該次輸出並記錄警告，不阻塞回應
+- 依日期與 ORG_ID 分區：{目錄}/date=YYYY-MM-DD/org_id=XXX/{前綴}_{run_id}.{csv|parquet}
+- run_id 含秒數與隨機碼，同時間的 request 不會互相覆寫；檔案先寫入暫存檔再 rename
+- OUTPUT_INTERMEDIATE=0 時不輸出 preprocessed_df（正式環境建議關閉）
+- parquet 需要 pyarrow，未安裝時改用 csv
+"""
+import os
+import re
+import uuid
+import queue
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+SINK_FORMATS = ('csv', 'parquet', 'none')
+
+# key -> 輸出種類，value -> (目錄, 檔名前綴)
+OUTPUT_KINDS = {
+    'preprocessed': ('./output_01_preprocessed', 'data_processed'),
+    'text_processed': ('./output_02_text_processed', 'text_processed'),
+}
+
+PARTITION_COLUMN = 'ORG_ID'
+
+
+def new_run_id() -> str:
+    return f"{datetime.now().strftime('%y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+
+
+def partition_name(value: Any) -> str:
+    """
+    ORG_ID 轉為可作為目錄名稱的字串（僅保留英數與 ._-）
+    """
+    value = re.sub(r'[^0-9A-Za-z._-]', '_', str(value).strip()) if pd.notna(value) else ''
+    return value.strip('.') or '__none__'
+
+
+class OutputSink:
+
+    def __init__(self, fmt: str = 'csv', intermediate: bool = True, max_queue: int = 32):
+        """
+        : param fmt: csv / parquet / none
+        : param intermediate: 是否輸出 preprocessed（中間結果）
+        : param max_queue: 等待寫出的輸出數上限，超過時捨棄
+        """
+        if fmt == 'parquet' and pa is None:
+            logger.warning("OUTPUT_SINK=parquet 但未安裝 pyarrow，改用 csv")
+            fmt = 'csv'
+        self.format = fmt
+        self.intermediate = intermediate
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue: 'queue.Queue[Optional[Tuple[str, pd.DataFrame, str, datetime]]]' = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def enabled(self, kind: str) -> bool:
+        return self.format != 'none' and (kind != 'preprocessed' or self.intermediate)
+
+    def submit(self, kind: str, df: pd.DataFrame, run_id: str) -> bool:
+        """
+        放入寫出 queue（不等待寫檔）；df 放入後呼叫端不可再修改
+        : param kind: OUTPUT_KINDS 的 key
+        : returns: 是否已排入（關閉輸出或 queue 已滿時為 False）
+        """
+        if not self.enabled(kind):
+            return False
+        self._start()
+        try:
+            self._queue.put_nowait((kind, df, run_id, datetime.now()))
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            logger.warning(f"輸出 queue 已滿，捨棄 {kind} {run_id}")
+            return False
+
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='output-sink', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._write(*item)
+            except Exception as e:
+                with self._lock:
+                    self.failed += 1
+                logger.error(f"輸出 {item[0]} {item[2]} 失敗: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, kind: str, df: pd.DataFrame, run_id: str, created_at: datetime):
+        base_dir, prefix = OUTPUT_KINDS[kind]
+        date_dir = os.path.join(base_dir, f"date={created_at.strftime('%Y-%m-%d')}")
+
+        if PARTITION_COLUMN in df.columns:
+            keys = df[PARTITION_COLUMN].astype(object).map(partition_name)
+            parts = df.groupby(keys.to_numpy(), sort=False)
+        else:
+            parts = [('__none__', df)]
+
+        for org_id, part in parts:
+            part_dir = os.path.join(date_dir, f'org_id={org_id}')
+            os.makedirs(part_dir, exist_ok=True)
+            path = os.path.join(part_dir, f'{prefix}_{run_id}.{self.format}')
+            tmp_path = os.path.join(part_dir, f'.{prefix}_{run_id}.{self.format}.tmp')
+            if self.format == 'parquet':
+                pq.write_table(pa.Table.from_pandas(part, preserve_index=False), tmp_path)
+            else:
+                part.to_csv(tmp_path, index=False)
+            os.replace(tmp_path, path)
+
+        with self._lock:
+            self.written += 1
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待 queue 中的輸出全部寫完
+        : returns: 是否於 timeout 內完成
+        """
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        threading.Thread(target=lambda: (self._queue.join(), done.set()), daemon=True).start()
+        return done.wait(timeout)
+
+    def close(self, timeout: Optional[float] = 30):
+        """
+        寫完剩餘輸出後停止背景 thread
+        """
+        if self._thread is None:
+            return
+        if not self.flush(timeout):
+            logger.warning(f"輸出 queue 尚有 {self._queue.qsize()} 筆未寫出")
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'format': self.format, 'intermediate': self.intermediate, 'queued': self._queue.qsize(),
+            'written': self.written, 'dropped': self.dropped, 'failed': self.failed,
+        }
+
+
+_sink: Optional[OutputSink] = None
+_sink_lock = threading.Lock()
+
+
+def get_sink() -> OutputSink:
+    """
+    取得共用的 OutputSink（依 OUTPUT_SINK / OUTPUT_INTERMEDIATE / OUTPUT_SINK_QUEUE 建立）
+    """
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                fmt = os.getenv('OUTPUT_SINK', 'csv').strip().lower()
+                if fmt not in SINK_FORMATS:
+                    logger.warning(f"OUTPUT_SINK={fmt} 無效，改用 csv")
+                    fmt = 'csv'
+                _sink = OutputSink(
+                    fmt=fmt,
+                    intermediate=os.getenv('OUTPUT_INTERMEDIATE', '1') != '0',
+                    max_queue=int(os.getenv('OUTPUT_SINK_QUEUE', '32')),
+                )
+    return _sink
+
+
+def close_sink():
+    global _sink
+    with _sink_lock:
+        if _sink is not None:
+            _sink.close()
+            _sink = None
@@ -0,0 +1,141 @@
+"""
+參考資料快取（item meta / item group map / diag / summary）：
+- 以 (table, code) 為 key，TTL 到期或超過容量時以 LRU 淘汰
+- 查無資料的 code 也會快取（空列表），避免重複查詢 MongoDB
+- invalidate() 會遞增 version，供下游判斷參考資料是否變動
+- 未命中的 code 經 single-flight 合併：多個 request 同時查同一 (table, code) 時只查詢一次
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+from single_flight import get_single_flight
+
+Row = Dict[str, Any]
+
+
+class ReferenceCache:
+
+    def __init__(self, ttl_seconds: float = 3600, max_entries: int = 100000, enabled: bool = True):
+        """
+        : param ttl_seconds: 每筆快取存活秒數
+        : param max_entries: 快取 key 數上限，超過時淘汰最久未使用者
+        : param enabled: False 時每次皆直接呼叫 loader
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.version = 1
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: 'OrderedDict[Tuple[str, str], Tuple[float, List[Row]]]' = OrderedDict()
+        self._lock = threading.RLock()
+        self._flights = get_single_flight('reference')
+
+    def get_rows(self, table: str, key_field: str, codes: Iterable[str],
+                 loader: Callable[[List[str]], List[Row]]) -> List[Row]:
+        """
+        取得 codes 對應的所有 row；未命中的 code 以 loader 一次補查
+        : param table: 參考表名稱（快取命名空間）
+        : param key_field: row 中作為 code 的欄位
+        : param codes: 欲查詢的 code
+        : param loader: 傳入未命中的 codes，回傳查得的 rows
+        : returns: 依 codes 順序串接的 rows
+        """
+        def fetch(missing: List[str]) -> Dict[str, List[Row]]:
+            loaded: Dict[str, List[Row]] = {code: [] for code in missing}
+            for row in loader(missing):
+                loaded.setdefault(str(row.get(key_field, '')).strip(), []).append(row)
+            return loaded
+
+        codes = list(dict.fromkeys(str(c).strip() for c in codes))
+        found = self._lookup(table, codes, fetch)
+        return [row for code in codes for row in found.get(code, [])]
+
+    def _lookup(self, table: str, codes: List[str],
+                fetch: Callable[[List[str]], Dict[str, List[Row]]]) -> Dict[str, List[Row]]:
+        found: Dict[str, List[Row]] = {}
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            for code in codes:
+                entry = self._entries.get((table, code)) if self.enabled else None
+                if entry is not None and entry[0] > now:
+                    self._entries.move_to_end((table, code))
+                    found[code] = entry[1]
+                    self.hits += 1
+                else:
+                    missing.append(code)
+                    self.misses += 1
+            version = self.version
+            # 與快取檢查在同一個 lock 內 claim，避免 leader 剛寫回快取時又重複查詢
+            owned, waiting = self._flights.claim((table, code) for code in missing)
+
+        if owned:
+            owned_codes = [code for _, code in owned]
+            try:
+                loaded = fetch(owned_codes)
+            except BaseException as e:
+                for key in owned:
+                    self._flights.fail(key, e)
+                raise
+            found.update(loaded)
+
+            with self._lock:
+                # 查詢期間若已 invalidate，不寫回舊版本資料
+                if self.enabled and version == self.version:
+                    expires_at = time.monotonic() + self.ttl_seconds
+                    for code in owned_codes:
+                        self._put((table, code), (expires_at, loaded.get(code, [])))
+            for key in owned:
+                self._flights.resolve(key, loaded.get(key[1], []))
+
+        # 其他 request 查詢中的 code 等待其結果
+        for (_, code), future in waiting.items():
+            found[code] = future.result()
+
+        return found
+
+    def _put(self, key: Tuple[str, str], value: Tuple[float, List[Row]]):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, table: str = None):
+        """
+        清除快取並遞增 version
+        : param table: 僅清除指定表（含其依語系區分的命名空間，如 item_meta:12）；None 表示全部
+        """
+        with self._lock:
+            if table is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[0] == table or k[0].startswith(f'{table}:')]:
+                    del self._entries[key]
+            self.version += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'version': self.version,
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'ttl_seconds': self.ttl_seconds,
+                'max_entries': self.max_entries,
+                'enabled': self.enabled,
+                'single_flight': self._flights.stats(),
+            }
+
+
+# process 內共用的快取實例（設定由環境變數提供）
+reference_cache = ReferenceCache(
+    ttl_seconds=float(os.getenv('REF_CACHE_TTL_SEC', '3600')),
+    max_entries=int(os.getenv('REF_CACHE_MAX_ENTRIES', '100000')),
+    enabled=os.getenv('REF_CACHE_ENABLED', '1') != '0',
+)
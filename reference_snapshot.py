@@ -0,0 +1,195 @@
+"""
+參考資料快照（Arrow IPC，多個 uvicorn worker 共用）：
+- write_snapshot() 將參考表整表寫成 Arrow IPC 檔，先寫入暫存目錄再 rename 為版本目錄，
+  最後以 os.replace 原子更新 CURRENT 指標；讀取中的 worker 不受影響，舊版本保留 keep 份
+- worker 以 memory map 開啟（zero-copy），所有 worker 共用同一份 page cache，
+  啟動即有完整參考資料、不需連 MongoDB；CURRENT 變更後於下次檢查時切換到新版本
+- 每張表的 schema metadata 記錄快照版本、建立時間與查詢 key 欄位
+
+匯出指令：python reference_snapshot.py export [--dir DIR] [--keep N]
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import logging
+import argparse
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.ipc as ipc
+except ImportError:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+Row = Dict[str, Any]
+
+CURRENT_FILE = 'CURRENT'
+
+
+def write_snapshot(root: str, tables: Dict[str, Tuple[str, List[Row]]], keep: int = 2) -> str:
+    """
+    寫入新版本快照並原子切換 CURRENT
+    : param root: 快照根目錄
+    : param tables: key -> 表名稱，value -> (查詢 key 欄位, 整表 rows)
+    : param keep: 保留的版本數（含新版本）
+    : returns: 新版本名稱
+    """
+    os.makedirs(root, exist_ok=True)
+    # 版本名稱依時間排序（清除舊版本時以名稱判斷先後）
+    version = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{uuid.uuid4().hex[:6]}"
+    created_at = time.time()
+    tmp_dir = os.path.join(root, f'.{version}.tmp')
+    os.makedirs(tmp_dir)
+
+    manifest = {'version': version, 'created_at': created_at, 'tables': {}}
+    for name, (key_field, rows) in tables.items():
+        # 與 MongoDB 路徑相同，經 pd.DataFrame(rows) 推斷欄位型別
+        df = pd.DataFrame(rows)
+        if key_field not in df.columns:
+            df[key_field] = pd.Series(dtype=str)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({
+            'version': version, 'created_at': str(created_at), 'table': name, 'key_field': key_field,
+        })
+        with ipc.new_file(os.path.join(tmp_dir, f'{name}.arrow'), table.schema) as writer:
+            writer.write_table(table)
+        manifest['tables'][name] = {'key_field': key_field, 'rows': table.num_rows}
+
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    os.rename(tmp_dir, os.path.join(root, version))
+    tmp_current = os.path.join(root, f'.{CURRENT_FILE}.{version}')
+    with open(tmp_current, 'w') as f:
+        f.write(version)
+    os.replace(tmp_current, os.path.join(root, CURRENT_FILE))
+
+    # 已被 worker memory map 的舊檔刪除後仍可讀到關閉為止
+    versions = sorted(d for d in os.listdir(root) if not d.startswith('.') and os.path.isdir(os.path.join(root, d)))
+    for old in versions[:-keep] if keep > 0 else []:
+        if old != version:
+            shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+
+    logger.info(f"參考資料快照 {version} 已寫入 {root}")
+    return version
+
+
+class ReferenceSnapshot:
+
+    def __init__(self, root: str, version: str):
+        """
+        以 memory map 開啟指定版本的所有表
+        : param root: 快照根目錄
+        : param version: 版本目錄名稱
+        """
+        self.root = root
+        self.version = version
+        path = os.path.join(root, version)
+        with open(os.path.join(path, 'manifest.json'), encoding='utf-8') as f:
+            self.manifest = json.load(f)
+
+        self._tables: Dict[str, 'pa.Table'] = {}
+        self._index: Dict[str, Tuple[np.ndarray, Dict[str, Tuple[int, int]]]] = {}
+        for name, meta in self.manifest['tables'].items():
+            source = pa.memory_map(os.path.join(path, f'{name}.arrow'), 'r')
+            self._tables[name] = ipc.open_file(source).read_all()
+            self._index[name] = self._build_index(self._tables[name].column(meta['key_field']))
+
+    @staticmethod
+    def _build_index(keys: 'pa.ChunkedArray') -> Tuple[np.ndarray, Dict[str, Tuple[int, int]]]:
+        """
+        開啟時建立 key -> row 的索引（每個版本只建立一次）
+        : returns: (依 key 排序的 row 位置（同 key 保持原順序）, key -> 該 key 於前者的 (起點, 筆數))
+        """
+        if not pa.types.is_string(keys.type):
+            keys = pc.cast(keys, pa.string())
+        rows = np.flatnonzero(keys.is_valid().to_numpy(zero_copy_only=False))
+        values = keys.drop_null().to_numpy(zero_copy_only=False).astype(object)
+        order = np.argsort(values, kind='stable')
+        codes, starts, counts = np.unique(values[order], return_index=True, return_counts=True)
+        return rows[order], dict(zip(codes.tolist(), zip(starts.tolist(), counts.tolist())))
+
+    def columns(self, table: str) -> List[str]:
+        return self._tables[table].column_names
+
+    def lookup(self, table: str, codes: List[str], columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        取得 codes 對應的 row（等同 MongoDB $in 查詢並依 codes 順序串接）
+        : param columns: 欲取回的欄位（快照中不存在者略過）；None 表示全部
+        """
+        tbl = self._tables[table]
+        rows, positions = self._index[table]
+        codes = list(dict.fromkeys(str(c).strip() for c in codes))
+
+        ranges = [positions[code] for code in codes if code in positions]
+        order = np.concatenate([rows[start:start + count] for start, count in ranges]) if ranges else np.empty(0, np.int64)
+        if columns is not None:
+            tbl = tbl.select([col for col in columns if col in tbl.column_names])
+        return tbl.take(pa.array(order, pa.int64())).to_pandas()
+
+    def info(self) -> Dict[str, Any]:
+        return {'root': self.root, **self.manifest}
+
+
+_snapshot: Optional[ReferenceSnapshot] = None
+_snapshot_root = ''
+_snapshot_checked_at = 0.0
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot() -> Optional[ReferenceSnapshot]:
+    """
+    取得目前的快照（REF_SNAPSHOT_DIR 未設定、pyarrow 未安裝或尚無快照時回傳 None）；
+    每 REF_SNAPSHOT_CHECK_SEC 秒檢查一次 CURRENT，版本變更時重新開啟（尚無快照的結果同樣保留到下次檢查）
+    """
+    global _snapshot, _snapshot_root, _snapshot_checked_at
+    root = os.getenv('REF_SNAPSHOT_DIR', '')
+    if not root or pa is None:
+        return None
+
+    now = time.monotonic()
+    if _snapshot_root == root and now - _snapshot_checked_at < float(os.getenv('REF_SNAPSHOT_CHECK_SEC', '5')):
+        return _snapshot
+
+    with _snapshot_lock:
+        try:
+            with open(os.path.join(root, CURRENT_FILE)) as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            # 只在由有快照（或其他目錄）變為無快照時記錄 warning
+            if _snapshot is not None or _snapshot_root != root:
+                logger.warning(f"{root} 尚無參考資料快照，改用 MongoDB / fallback")
+            _snapshot, _snapshot_root, _snapshot_checked_at = None, root, now
+            return None
+
+        if _snapshot is None or _snapshot.root != root or _snapshot.version != version:
+            _snapshot = ReferenceSnapshot(root, version)
+            logger.info(f"已載入參考資料快照 {version}")
+        _snapshot_root, _snapshot_checked_at = root, now
+        return _snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description='參考資料快照')
+    sub = parser.add_subparsers(dest='command', required=True)
+    export = sub.add_parser('export', help='由 MongoDB 匯出參考表並切換為最新快照')
+    export.add_argument('--dir', default=os.getenv('REF_SNAPSHOT_DIR', './cache/reference_snapshot'))
+    export.add_argument('--keep', type=int, default=2, help='保留的版本數')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    from db_to_dataframe import export_reference_snapshot
+    print(export_reference_snapshot(args.dir, keep=args.keep))
+
+
+if __name__ == '__main__':
+    main()
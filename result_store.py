@@ -0,0 +1,145 @@
+"""
+報告結果的持久化儲存（SQLite），供重送的 record 直接取回：
+- key = record 指紋：sha256(record JSON（key 排序）, 參考資料版本, prompt / 部署版本, 報告格式版本)，
+  任何一項變更都會得到不同指紋，舊資料不再命中
+- 僅由呼叫端寫入完整的結果（逾時或 LLM 失敗而以原文輸出 SUMMARY 的 record 不寫入）
+- 超過容量時依最後使用時間淘汰；可設定 TTL
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def record_fingerprint(record: Dict[str, Any], *versions: str) -> str:
+    """
+    : param versions: 影響輸出的版本字串（參考資料、prompt、報告格式等）
+    """
+    payload = json.dumps(record, ensure_ascii=False, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256('\x1f'.join((payload, *versions)).encode('utf-8')).hexdigest()
+
+
+class ResultStore:
+
+    # 每寫入幾筆檢查一次容量
+    EVICT_EVERY = 256
+
+    def __init__(self, path: str, max_entries: int = 500000, ttl_seconds: float = 0):
+        """
+        : param path: SQLite 檔案路徑
+        : param max_entries: 保留筆數上限，超過時淘汰最久未使用者
+        : param ttl_seconds: 資料存活秒數，0 表示不過期
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            ' fingerprint TEXT PRIMARY KEY, record_id TEXT, report TEXT, created_at REAL, last_used REAL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_results_last_used ON results(last_used)')
+
+    def get_many(self, fingerprints: Iterable[str]) -> Dict[str, str]:
+        """
+        批次查詢
+        : returns: key -> 指紋，value -> 報告（僅含命中者）
+        """
+        fingerprints = list(dict.fromkeys(fingerprints))
+        if not fingerprints:
+            return {}
+
+        now = time.time()
+        found = {}
+        with self._lock:
+            for i in range(0, len(fingerprints), 500):
+                chunk = fingerprints[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT fingerprint, report, created_at FROM results WHERE fingerprint IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                for fingerprint, report, created_at in rows:
+                    if self.ttl_seconds and created_at + self.ttl_seconds < now:
+                        continue
+                    found[fingerprint] = report
+            if found:
+                self._conn.executemany('UPDATE results SET last_used = ? WHERE fingerprint = ?', [(now, f) for f in found])
+            self.hits += len(found)
+            self.misses += len(fingerprints) - len(found)
+        return found
+
+    def put_many(self, rows: List[Tuple[str, str, str]]):
+        """
+        : param rows: (指紋, record_id, 報告)
+        """
+        if not rows:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO results (fingerprint, record_id, report, created_at, last_used) VALUES (?, ?, ?, ?, ?)',
+                [(fingerprint, record_id, report, now, now) for fingerprint, record_id, report in rows]
+            )
+            self._conn.execute('COMMIT')
+            before = self._puts
+            self._puts += len(rows)
+            if self._puts // self.EVICT_EVERY != before // self.EVICT_EVERY:
+                self._evict()
+
+    def _evict(self):
+        if self.ttl_seconds:
+            self._conn.execute('DELETE FROM results WHERE created_at < ?', (time.time() - self.ttl_seconds,))
+        count = self._conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                'DELETE FROM results WHERE fingerprint IN (SELECT fingerprint FROM results ORDER BY last_used LIMIT ?)',
+                (count - self.max_entries,)
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM results')
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+            return {'entries': entries, 'hits': self.hits, 'misses': self.misses}
+
+
+_result_store: Optional[ResultStore] = None
+_result_store_lock = threading.Lock()
+
+
+def get_result_store() -> Optional[ResultStore]:
+    """
+    取得共用的 result store（RESULT_STORE_ENABLED=0 時回傳 None）
+    """
+    global _result_store
+    if os.getenv('RESULT_STORE_ENABLED', '1') == '0':
+        return None
+
+    if _result_store is None:
+        with _result_store_lock:
+            if _result_store is None:
+                _result_store = ResultStore(
+                    path=os.getenv('RESULT_STORE_PATH', './cache/result_store.sqlite3'),
+                    max_entries=int(os.getenv('RESULT_STORE_MAX_ENTRIES', '500000')),
+                    ttl_seconds=float(os.getenv('RESULT_STORE_TTL_SEC', '0')),
+                )
+    return _result_store
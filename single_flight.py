@@ -0,0 +1,86 @@
+"""
+跨 request 的 single-flight：相同 key 的工作同一時間只執行一次
+- claim() 將 key 分為「由呼叫端執行」與「已有其他呼叫端執行中」兩組；後者取得對方的 Future 等待結果
+- 執行端完成後以 resolve() / fail() 通知所有等待者並移除 in-flight 紀錄（之後的呼叫改由快取命中）
+- 用於參考資料查詢（reference_cache）與 LLM 改寫（llm_processing）；SINGLE_FLIGHT_ENABLED=0 時不合併
+- 各 group 的執行（leader）與合併（coalesced）次數見 stats() 與 /metrics 的 single_flight_total
+"""
+import os
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, Hashable, Iterable, List, Tuple
+from metrics import SINGLE_FLIGHT
+
+
+class SingleFlight:
+
+    def __init__(self, name: str, enabled: bool = True):
+        """
+        : param name: group 名稱（統計用）
+        : param enabled: False 時 claim() 一律由呼叫端執行
+        """
+        self.name = name
+        self.enabled = enabled
+        self.leaders = 0
+        self.coalesced = 0
+        self._inflight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def claim(self, keys: Iterable[Hashable]) -> Tuple[List[Hashable], Dict[Hashable, Future]]:
+        """
+        : returns: (需由呼叫端執行並 resolve/fail 的 key, key -> 其他呼叫端執行中的 Future)
+        """
+        keys = list(dict.fromkeys(keys))
+        if not self.enabled:
+            return keys, {}
+
+        owned, waiting = [], {}
+        with self._lock:
+            for key in keys:
+                future = self._inflight.get(key)
+                if future is None:
+                    self._inflight[key] = Future()
+                    owned.append(key)
+                else:
+                    waiting[key] = future
+            self.leaders += len(owned)
+            self.coalesced += len(waiting)
+        SINGLE_FLIGHT.inc(self.name, 'leader', amount=len(owned))
+        SINGLE_FLIGHT.inc(self.name, 'coalesced', amount=len(waiting))
+        return owned, waiting
+
+    def resolve(self, key: Hashable, value: Any):
+        with self._lock:
+            future = self._inflight.pop(key, None)
+        if future is not None:
+            future.set_result(value)
+
+    def fail(self, key: Hashable, error: BaseException):
+        with self._lock:
+            future = self._inflight.pop(key, None)
+        if future is not None:
+            future.set_exception(error)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'enabled': self.enabled, 'inflight': len(self._inflight), 'leaders': self.leaders, 'coalesced': self.coalesced}
+
+
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+
+def get_single_flight(name: str) -> SingleFlight:
+    """
+    取得指定名稱的共用 group；第一次呼叫時建立
+    """
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name, enabled=os.getenv('SINGLE_FLIGHT_ENABLED', '1') != '0')
+        return _groups[name]
+
+
+def single_flight_stats() -> Dict[str, Dict[str, Any]]:
+    with _groups_lock:
+        groups = list(_groups.values())
+    return {group.name: group.stats() for group in groups}
@@ -0,0 +1,50 @@
+"""
+測試共用設定：
+- pipeline 模組以 *_251029 名稱互相 import，找不到時以本 repo 的同名模組代替
+- mongo_requests：以 mongomock 建立參考表（benchmark.seed_mongomock），並將部分 DIAG_CODE 改為查無對應的值
+"""
+import os
+import sys
+import copy
+import importlib
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+for name in ['data_preprocessing', 'db_to_dataframe', 'llm_processing', 'text_processing']:
+    try:
+        importlib.import_module(f'{name}_251029')
+    except ImportError:
+        sys.modules[f'{name}_251029'] = importlib.import_module(name)
+
+import benchmark
+import mongo_client
+from reference_cache import reference_cache
+
+UNMATCHED_DIAG = 'D_UNMATCHED'
+
+
+@pytest.fixture
+def mongo_requests(monkeypatch):
+    """
+    : returns: 已寫入 mongomock 參考表的 request；前兩筆各有一個 DIAG_CODE（及其 SUMMARY）在參考表中查無資料
+    """
+    pytest.importorskip('mongomock')
+    for key, value in benchmark.MOCK_MONGO_ENV.items():
+        monkeypatch.setenv(key, value)
+    monkeypatch.delenv('REF_SNAPSHOT_DIR', raising=False)
+
+    template = benchmark.load_template(os.path.join(ROOT, 'sample_request.json'))
+    requests = benchmark.make_requests(template, 12, 3, 2, {'1': 1, '2': 1, '3': 1, '4': 1}, 0.5, orgs=2)
+    benchmark.seed_mongomock(requests)
+    reference_cache.invalidate()
+
+    requests = copy.deepcopy(requests)
+    requests[0]['ITEMS'][0]['FINDINGS'][0]['DIAG_CODE'] = UNMATCHED_DIAG
+    requests[1]['ITEMS'][1]['FINDINGS'][1]['DIAG_CODE'] = UNMATCHED_DIAG
+    yield requests
+
+    reference_cache.invalidate()
+    mongo_client.close_client()
@@ -0,0 +1,90 @@
+import os
+import sys
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import batch_runner
+from batch_runner import run_batch, chunk_path, failed_path
+
+RECORDS = [{'RECORD_ID': f'R{i}', 'LANG_NO': '1'} for i in range(10)]
+
+
+class Crash(Exception):
+    pass
+
+
+class FakeWindow:
+    """
+    process_window 替身：bad 中的 record 回傳 error；處理 crash_after 筆 record 後丟出 Crash（模擬中斷）
+    """
+
+    def __init__(self, bad=(), crash_after=None):
+        self.bad, self.crash_after = set(bad), crash_after
+        self.processed = []
+
+    def __call__(self, records, deadline=None):
+        if self.crash_after is not None and len(self.processed) + len(records) > self.crash_after:
+            raise Crash()
+        self.processed.extend(r['RECORD_ID'] for r in records)
+        return [json.dumps({'record_id': r['RECORD_ID'], 'error': 'timeout'} if r['RECORD_ID'] in self.bad else
+                           {'record_id': r['RECORD_ID'], 'report': 'ok', 'degraded': False}) + '\n'
+                for r in records]
+
+
+@pytest.fixture
+def batch(tmp_path, monkeypatch):
+    # 以 thread 執行 chunk，才能替換 worker 中的 process_window
+    monkeypatch.setattr(batch_runner, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    input_path = tmp_path / 'input.jsonl'
+    input_path.write_text(''.join(json.dumps(r) + '\n' for r in RECORDS), encoding='utf-8')
+
+    def run(window):
+        monkeypatch.setattr(sys.modules['text_processing_251029'], 'process_window', window)
+        return run_batch(str(input_path), str(tmp_path / 'out'), chunk_size=3, workers=1)
+    return run, tmp_path / 'out'
+
+
+def read_output(output_dir):
+    lines = []
+    for index in range(4):
+        with open(chunk_path(str(output_dir), index), encoding='utf-8') as f:
+            lines.extend(json.loads(line) for line in f)
+    return lines
+
+
+def test_resume_skips_finished_chunks_and_retries_failed_records(batch):
+    run, output_dir = batch
+
+    # 第一次執行：R4 失敗，處理到第 3 個 chunk 時中斷
+    first = FakeWindow(bad={'R4'}, crash_after=9)
+    with pytest.raises(Crash):
+        run(first)
+    assert first.processed == ['R0', 'R1', 'R2', 'R3', 'R4', 'R5', 'R3', 'R4', 'R5']
+    assert [os.path.exists(chunk_path(str(output_dir), i)) for i in range(4)] == [True, True, False, False]
+    assert [os.path.exists(failed_path(str(output_dir), i)) for i in range(4)] == [False, True, False, False]
+
+    # 重跑：已完成的 chunk 不重做，只重試 R4 與未完成的 chunk
+    second = FakeWindow()
+    stats = run(second)
+    assert second.processed == ['R4', 'R6', 'R7', 'R8', 'R9']
+    assert (stats['skipped_chunks'], stats['retried_chunks'], stats['errors']) == (1, 1, 0)
+    assert [row['record_id'] for row in read_output(output_dir)] == [r['RECORD_ID'] for r in RECORDS]
+    assert not any('error' in row for row in read_output(output_dir))
+    assert not any(os.path.exists(failed_path(str(output_dir), i)) for i in range(4))
+
+    # 全部完成後重跑不再處理任何 record
+    third = FakeWindow()
+    assert run(third)['skipped_chunks'] == 4 and third.processed == []
+
+
+def test_record_failing_again_stays_queued_for_retry(batch):
+    run, output_dir = batch
+    run(FakeWindow(bad={'R4'}))
+    stats = run(FakeWindow(bad={'R4'}))
+
+    assert (stats['retried_chunks'], stats['records'], stats['errors']) == (1, 1, 1)
+    assert json.loads((output_dir / 'chunk_000001.failed.jsonl').read_text(encoding='utf-8')) == \
+        {'seq': 1, 'record': RECORDS[4]}
+    assert [('error' in row) for row in read_output(output_dir)].count(True) == 1
@@ -0,0 +1,38 @@
+import pandas as pd
+import pytest
+
+from conftest import UNMATCHED_DIAG
+from db_to_dataframe import db_to_dataframe
+from data_preprocessing import get_unique_rows, postprocess_multilang
+from reference_cache import reference_cache
+
+
+def run_pipeline(requests, monkeypatch, compact: str) -> pd.DataFrame:
+    monkeypatch.setenv('COMPACT_DTYPES', compact)
+    reference_cache.invalidate()
+    df = postprocess_multilang(get_unique_rows(db_to_dataframe(requests)))
+    return df.astype(str).reset_index(drop=True)
+
+
+@pytest.mark.parametrize('engine', ['pandas', 'polars'])
+def test_compact_mode_with_unmatched_codes(mongo_requests, monkeypatch, engine):
+    if engine == 'polars':
+        pytest.importorskip('polars')
+    monkeypatch.setenv('DATAFRAME_ENGINE', engine)
+
+    expected = run_pipeline(mongo_requests, monkeypatch, '0')
+    actual = run_pipeline(mongo_requests, monkeypatch, '1')
+
+    assert (expected['DIAG_CODE'] == UNMATCHED_DIAG).any()
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_compact_dtypes_fills_missing_categories():
+    from db_to_dataframe import compact_dtypes
+
+    df = pd.DataFrame({'ORG_ID': ['A', None, 'B'], 'TCNAME_SUMMARY': pd.Categorical(['x', None, 'x'])})
+    compact_dtypes(df)
+
+    assert list(df['ORG_ID']) == ['A', '', 'B']
+    assert list(df['TCNAME_SUMMARY']) == ['x', '', 'x']
+    assert df.fillna('').equals(df)
@@ -0,0 +1,97 @@
+import time
+import zlib
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import llm_cache
+import llm_processing
+from llm_cache import RewriteCache
+from llm_processing import SuggestionTranslator
+from text_processing import process_records
+
+SLOW_SECONDS = 1.5
+DEADLINE = 0.3
+MODEL = 'test-deadline'
+
+
+def is_slow(text):
+    return zlib.crc32(text.encode('utf-8')) % 3 == 0
+
+
+class SlowCompletions:
+    """
+    部分文本（is_slow）延遲 SLOW_SECONDS 秒才回傳，其餘立即回傳
+    """
+
+    def __init__(self):
+        self.requested = {}
+        self._lock = threading.Lock()
+
+    def create(self, **request_kwargs):
+        content = request_kwargs['messages'][1]['content']
+        langu_no, prompt = next((langu_no, prompts['user_prompt'])
+                                for langu_no, prompts in SuggestionTranslator.SYSTEM_PROMPT.items()
+                                if content.startswith(prompts['user_prompt']))
+        text = content[len(prompt):]
+        with self._lock:
+            self.requested[text] = langu_no
+        if is_slow(text):
+            time.sleep(SLOW_SECONDS)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=f'改寫：{text}'))], usage=None)
+
+
+@pytest.fixture
+def slow_llm(tmp_path, monkeypatch):
+    completions = SlowCompletions()
+    monkeypatch.setenv('AZURE_OPENAI_ENDPOINT', 'http://llm.invalid')
+    monkeypatch.setenv('AZURE_OPENAI_API_KEY', 'test')
+    monkeypatch.setenv('AZURE_OPENAI_DEPLOYMENT', MODEL)
+    monkeypatch.setenv('RESULT_STORE_ENABLED', '0')
+    # 所有文本同時送出：逾時的只有較慢的改寫
+    monkeypatch.setenv('LLM_CONCURRENCY_MIN', '128')
+    monkeypatch.setenv('LLM_CONCURRENCY_MAX', '128')
+    monkeypatch.setenv('LLM_CACHE_PATH', str(tmp_path / 'rewrites.sqlite3'))
+    monkeypatch.delenv('LLM_CACHE_ENABLED', raising=False)
+    monkeypatch.setattr(llm_cache, '_rewrite_cache', None)
+    monkeypatch.setattr(llm_processing, 'get_azure_client',
+                        lambda *args: SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+    return completions
+
+
+def cached(cache, requested, texts):
+    found = {}
+    for text in texts:
+        langu_no = requested[text]
+        found.update(cache.get_many(langu_no, MODEL, SuggestionTranslator.prompt_hash(langu_no), [text]))
+    return found
+
+
+def test_deadline_degrades_unfinished_rewrites(mongo_requests, slow_llm):
+    started = time.monotonic()
+    df_out, _ = process_records(mongo_requests, started + DEADLINE)
+    elapsed = time.monotonic() - started
+
+    # 於截止時間返回，不等待較慢的改寫
+    assert elapsed < DEADLINE + 0.5 < SLOW_SECONDS
+
+    slow = {text for text in slow_llm.requested if is_slow(text)}
+    fast = set(slow_llm.requested) - slow
+    assert slow and fast
+    degraded = {summary for summaries in df_out['degraded'] for summary in summaries}
+    assert degraded == slow
+    reports = '\n'.join(df_out['report'])
+    assert not [text for text in slow if f'改寫：{text}' in reports]
+    assert all(f'改寫：{text}' in reports for text in fast)
+    for report, summaries in zip(df_out['report'], df_out['degraded']):
+        assert all(summary in report for summary in summaries)
+
+    # 未完成的改寫於背景繼續執行，完成後寫入改寫快取
+    cache = llm_cache._rewrite_cache
+    assert isinstance(cache, RewriteCache)
+    assert cached(cache, slow_llm.requested, slow) == {}
+    wait_until = time.monotonic() + SLOW_SECONDS * 4
+    while len(cached(cache, slow_llm.requested, slow)) < len(slow) and time.monotonic() < wait_until:
+        time.sleep(0.05)
+    assert cached(cache, slow_llm.requested, slow) == {text: f'改寫：{text}' for text in slow}
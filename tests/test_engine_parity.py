@@ -0,0 +1,97 @@
+"""
+pandas / Polars 引擎輸出一致性（DATAFRAME_ENGINE）
+"""
+import copy
+
+import pandas as pd
+import pytest
+
+pl = pytest.importorskip('polars')
+
+from conftest import UNMATCHED_DIAG
+from dataframe_engine import merge_left, to_polars
+from db_to_dataframe import db_to_dataframe
+from data_preprocessing import get_unique_rows, postprocess_multilang
+from reference_cache import reference_cache
+from text_processing import process_records
+
+
+def run_engine(monkeypatch, engine, func, *args):
+    monkeypatch.setenv('DATAFRAME_ENGINE', engine)
+    reference_cache.invalidate()
+    return func(*copy.deepcopy(args))
+
+
+def test_db_to_dataframe_parity(mongo_requests, monkeypatch):
+    expected = run_engine(monkeypatch, 'pandas', db_to_dataframe, mongo_requests)
+    actual = run_engine(monkeypatch, 'polars', db_to_dataframe, mongo_requests)
+
+    assert (expected['DIAG_CODE'] == UNMATCHED_DIAG).any()
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_db_to_dataframe_org_id_suffix(mongo_requests, monkeypatch):
+    # diag / summary 皆含 ORG_ID：diag merge 後主表與 diag 的 ORG_ID 加上 _x / _y，
+    # 輸出的 ORG_ID 為 summary 表的值（未對應的 DIAG_CODE 為缺值），兩引擎須一致
+    for engine in ('pandas', 'polars'):
+        df = run_engine(monkeypatch, engine, db_to_dataframe, mongo_requests)
+        unmatched = df['DIAG_CODE'] == UNMATCHED_DIAG
+        assert df.loc[unmatched, 'ORG_ID'].isna().all(), engine
+        assert df.loc[~unmatched, 'ORG_ID'].notna().all(), engine
+        assert not any(col.startswith('ORG_ID_') for col in df.columns), engine
+
+
+def test_db_to_dataframe_fallback_parity(mongo_requests, monkeypatch):
+    monkeypatch.delenv('MONGODB_URI')
+    expected = run_engine(monkeypatch, 'pandas', db_to_dataframe, mongo_requests)
+    actual = run_engine(monkeypatch, 'polars', db_to_dataframe, mongo_requests)
+
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_postprocess_multilang_parity(mongo_requests, monkeypatch):
+    final_df = get_unique_rows(run_engine(monkeypatch, 'pandas', db_to_dataframe, mongo_requests))
+
+    expected = run_engine(monkeypatch, 'pandas', postprocess_multilang, final_df)
+    actual = run_engine(monkeypatch, 'polars', postprocess_multilang, final_df)
+
+    pd.testing.assert_frame_equal(actual.reset_index(drop=True), expected.reset_index(drop=True))
+
+
+def test_postprocess_multilang_mixed_type_key(mongo_requests, monkeypatch):
+    # 同一 record 的 LANG_NO 為 1 與 '1'：pandas 去重視為不同的值，兩引擎須一致
+    final_df = get_unique_rows(run_engine(monkeypatch, 'pandas', db_to_dataframe, mongo_requests))
+    duplicate = final_df.iloc[[0]].assign(LANG_NO=int(final_df['LANG_NO'].iloc[0]))
+    final_df = pd.concat([final_df, duplicate], ignore_index=True)
+
+    expected = run_engine(monkeypatch, 'pandas', postprocess_multilang, final_df)
+    actual = run_engine(monkeypatch, 'polars', postprocess_multilang, final_df)
+
+    assert len(expected) == len(get_unique_rows(final_df))
+    pd.testing.assert_frame_equal(actual.reset_index(drop=True), expected.reset_index(drop=True))
+
+
+@pytest.mark.parametrize('mixed_langu', [False, True])
+def test_report_parity(mongo_requests, monkeypatch, mixed_langu):
+    monkeypatch.setenv('RESULT_STORE_ENABLED', '0')
+    requests = copy.deepcopy(mongo_requests)
+    if mixed_langu:
+        for request in requests[::2]:
+            request['LANG_NO'] = int(request['LANG_NO'])
+
+    expected, expected_df = run_engine(monkeypatch, 'pandas', process_records, requests)
+    actual, actual_df = run_engine(monkeypatch, 'polars', process_records, requests)
+
+    assert actual.to_dict(orient='records') == expected.to_dict(orient='records')
+    pd.testing.assert_frame_equal(actual_df.reset_index(drop=True), expected_df.reset_index(drop=True))
+
+
+def test_merge_left_matches_pandas_merge():
+    left = pd.DataFrame({'CODE': ['a', 'b', 'c', 'a'], 'ORG_ID': ['o1', 'o1', 'o2', 'o2'], 'N': [1, 2, 3, 4]})
+    right = pd.DataFrame({'CODE': ['a', 'a', 'b'], 'ORG_ID': ['r1', 'r2', 'r3'], 'NAME': ['x', 'y', 'z']})
+
+    expected = left.merge(right, on=['CODE'], how='left', suffixes=('_ITEM', '_GROUP'))
+    actual = merge_left(to_polars(left), to_polars(right), ['CODE'], suffixes=('_ITEM', '_GROUP')).collect().to_pandas()
+
+    assert list(actual.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
@@ -0,0 +1,147 @@
+import sys
+import json
+import time
+import threading
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import job_queue
+from job_queue import JobQueue, run_job, SUCCEEDED, FAILED, QUEUED
+
+RECORDS = [{'RECORD_ID': f'R{i}'} for i in range(4)]
+
+
+def ok_lines(records):
+    return [json.dumps({'record_id': r['RECORD_ID'], 'report': 'ok', 'degraded': False}) + '\n' for r in records]
+
+
+def error_lines(records):
+    return [json.dumps({'record_id': r['RECORD_ID'], 'error': 'timeout'}) + '\n' for r in records]
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / 'jobs.sqlite3'), max_attempts=2, stale_seconds=0.3)
+
+
+def skip_backoff(queue):
+    with queue._connect() as conn:
+        conn.execute('UPDATE jobs SET available_at = 0')
+
+
+def patch_window(monkeypatch, func):
+    monkeypatch.setattr(sys.modules['text_processing_251029'], 'process_window', func)
+
+
+def test_window_errors_are_retried(queue, monkeypatch):
+    calls = []
+
+    def flaky(records):
+        calls.append([r['RECORD_ID'] for r in records])
+        # R2 於第一次執行時（window 與逐筆）皆失敗
+        return error_lines(records) if 'R2' in calls[-1] and len(calls) <= 3 else ok_lines(records)
+
+    patch_window(monkeypatch, flaky)
+    job_id = queue.submit(RECORDS)['job_id']
+
+    run_job(queue, queue.claim(), 2)
+    job = queue.get(job_id, limit=10)
+    assert (job['status'], job['done'], len(job['results'])) == (QUEUED, 2, 2)
+
+    skip_backoff(queue)
+    run_job(queue, queue.claim(), 2)
+    job = queue.get(job_id, limit=10)
+    assert (job['status'], job['done'], job['errors']) == (SUCCEEDED, 4, 0)
+    assert calls == [['R0', 'R1'], ['R2', 'R3'], ['R2'], ['R3'], ['R2', 'R3']]
+
+
+def test_window_falls_back_to_single_records(queue, monkeypatch):
+    calls = []
+
+    def whole_window_fails(records):
+        calls.append(len(records))
+        return error_lines(records) if len(records) > 1 else ok_lines(records)
+
+    patch_window(monkeypatch, whole_window_fails)
+    job_id = queue.submit(RECORDS)['job_id']
+    run_job(queue, queue.claim(), 4)
+
+    job = queue.get(job_id, limit=10)
+    assert (job['status'], job['done'], job['errors'], job['attempts']) == (SUCCEEDED, 4, 0, 1)
+    assert calls == [4, 1, 1, 1, 1]
+
+
+def test_permanently_bad_record_is_stored_as_error(queue, monkeypatch):
+    def one_bad(records):
+        return [error_lines([r])[0] if r['RECORD_ID'] == 'R1' else ok_lines([r])[0] for r in records]
+
+    patch_window(monkeypatch, one_bad)
+    job_id = queue.submit(RECORDS)['job_id']
+    for _ in range(queue.max_attempts):
+        skip_backoff(queue)
+        run_job(queue, queue.claim(), 2)
+
+    job = queue.get(job_id, limit=10)
+    assert (job['status'], job['done'], job['errors']) == (SUCCEEDED, 4, 1)
+    assert [('error' in row, row['record_id']) for row in job['results']] == \
+        [(False, 'R0'), (True, 'R1'), (False, 'R2'), (False, 'R3')]
+    # 有 error 的 job 不作為相同 payload 的既有結果
+    assert not queue.submit(RECORDS)['deduplicated']
+
+
+def test_failed_job_is_not_deduplicated(queue, monkeypatch):
+    def broken(records):
+        raise RuntimeError('queue unavailable')
+
+    patch_window(monkeypatch, broken)
+    job_id = queue.submit(RECORDS)['job_id']
+    for _ in range(queue.max_attempts):
+        skip_backoff(queue)
+        run_job(queue, queue.claim(), 2)
+
+    assert queue.get(job_id)['status'] == FAILED
+    resubmitted = queue.submit(RECORDS)
+    assert not resubmitted['deduplicated'] and resubmitted['job_id'] != job_id
+
+
+def test_heartbeat_refreshed_during_slow_window(queue, monkeypatch):
+    def slow(records):
+        time.sleep(queue.stale_seconds * 2)
+        return ok_lines(records)
+
+    patch_window(monkeypatch, slow)
+    job_id = queue.submit(RECORDS[:1])['job_id']
+    job = queue.claim()
+
+    reclaimed = []
+    worker = threading.Thread(target=run_job, args=(queue, job, 1))
+    worker.start()
+    while worker.is_alive():
+        reclaimed.append(queue.claim())
+        time.sleep(0.05)
+    worker.join()
+
+    assert not any(reclaimed)
+    assert queue.get(job_id)['status'] == SUCCEEDED
+
+
+def test_submit_rejects_invalid_records(queue, monkeypatch):
+    monkeypatch.setattr(job_queue, '_queue', queue)
+    app = FastAPI()
+    app.include_router(job_queue.router)
+    client = TestClient(app)
+
+    records = [{'RECORD_ID': 'R0', 'LANG_NO': '1'}, 'R1', {'RECORD_ID': 'R2'}, {'LANG_NO': '1'}]
+    response = client.post('/jobs', json=records)
+    assert response.status_code == 422
+    assert response.json()['detail'] == [
+        {'index': 1, 'error': '不是 JSON object'},
+        {'index': 2, 'error': '缺少 LANG_NO'},
+        {'index': 3, 'error': '缺少 RECORD_ID'},
+    ]
+    assert queue.stats() == {}
+
+    response = client.post('/jobs', json=records[0])
+    assert response.status_code == 202 and queue.stats() == {QUEUED: 1}
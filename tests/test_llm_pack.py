@@ -0,0 +1,79 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from llm_processing import SuggestionTranslator
+
+SUGGESTIONS = [f'建議 {i}' for i in range(16)]
+
+
+class FakeCompletions:
+    """
+    : param reply: 傳入該次請求的文本 list，回傳模型輸出；raise 代表 API 錯誤
+    """
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.calls = 0
+
+    def create(self, **request_kwargs):
+        self.calls += 1
+        content = request_kwargs['messages'][1]['content'][len(SuggestionTranslator.SYSTEM_PROMPT['1']['user_prompt']):]
+        packed = request_kwargs['messages'][0]['content'].endswith(SuggestionTranslator.PACK_PROMPT['1'])
+        unit = json.loads(content) if packed else [content]
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.reply(unit)))], usage=None)
+
+
+class FakeAsyncCompletions(FakeCompletions):
+
+    async def create(self, **request_kwargs):
+        return FakeCompletions.create(self, **request_kwargs)
+
+
+def make_translator(monkeypatch, completions):
+    monkeypatch.delenv('AZURE_OPENAI_ENDPOINT', raising=False)
+    translator = SuggestionTranslator('1', model='test-pack', pack=True)
+    translator.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    translator.base_delay = 0
+    return translator
+
+
+def bad_request(unit):
+    raise ValueError('Error code: 400 - bad request')
+
+
+def wrong_count(unit):
+    return json.dumps(unit[:-1], ensure_ascii=False) if len(unit) > 1 else f'改寫 {unit[0]}'
+
+
+def test_failed_pack_call_is_not_split(monkeypatch):
+    completions = FakeCompletions(bad_request)
+    translator = make_translator(monkeypatch, completions)
+
+    assert translator._translate_unit(SUGGESTIONS) == {s: s for s in SUGGESTIONS}
+    assert completions.calls == 1
+
+
+def test_failed_pack_call_is_not_split_async(monkeypatch):
+    completions = FakeAsyncCompletions(bad_request)
+    translator = make_translator(monkeypatch, completions)
+    async_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+    assert asyncio.run(translator._translate_unit_async(SUGGESTIONS, async_client)) == {s: s for s in SUGGESTIONS}
+    assert completions.calls == 1
+
+
+@pytest.mark.parametrize('use_async', [False, True])
+def test_malformed_pack_output_is_split(monkeypatch, use_async):
+    completions = (FakeAsyncCompletions if use_async else FakeCompletions)(wrong_count)
+    translator = make_translator(monkeypatch, completions)
+    if use_async:
+        async_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        results = asyncio.run(translator._translate_unit_async(SUGGESTIONS[:4], async_client))
+    else:
+        results = translator._translate_unit(SUGGESTIONS[:4])
+
+    assert results == {s: f'改寫 {s}' for s in SUGGESTIONS[:4]}
+    assert completions.calls == 7
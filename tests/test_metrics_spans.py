@@ -0,0 +1,31 @@
+import re
+import logging
+
+import pandas as pd
+import pytest
+
+from text_processing import translate_summaries
+
+
+def span_parents(caplog):
+    return {name: parent for name, parent in re.findall(r'span name=(\S+) parent=(\S+)', caplog.text)}
+
+
+@pytest.mark.parametrize('use_async', ['0', '1'])
+def test_spans_nest_across_worker_threads(monkeypatch, caplog, use_async):
+    monkeypatch.delenv('AZURE_OPENAI_ENDPOINT', raising=False)
+    monkeypatch.setenv('LLM_CACHE_ENABLED', '0')
+    monkeypatch.setenv('LLM_ASYNC_MODE', use_async)
+    df = pd.DataFrame({
+        'LANG_NO': ['1', '1', '2'],
+        'TCNAME_SUMMARY': ['建議追蹤', '建議複查', ''],
+        'ENNAME_SUMMARY': ['', '', 'Follow up'],
+    })
+
+    with caplog.at_level(logging.DEBUG, logger='metrics'):
+        translate_summaries(df)
+
+    parents = span_parents(caplog)
+    assert parents['translate_summaries'] == 'None'
+    assert parents['translate_langu'] == 'translate_summaries'
+    assert parents['llm_unit'] == 'translate_langu'
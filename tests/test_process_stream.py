@@ -0,0 +1,73 @@
+import json
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import text_processing
+from text_processing import InvalidRecord, iter_records, router
+
+RECORDS = [{'RECORD_ID': f'R{i}', 'COMMENT': f'說明 {i}（追蹤）'} for i in range(5)]
+
+
+async def chunked(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def parse(data: bytes, content_type: str = '', size: int = 7):
+    async def collect():
+        return [record async for record in iter_records(chunked(data, size), content_type)]
+    return asyncio.run(collect())
+
+
+@pytest.mark.parametrize('size', [1, 7, 4096])
+def test_array_parsed_incrementally(size):
+    assert parse(json.dumps(RECORDS, ensure_ascii=False, indent=2).encode(), size=size) == RECORDS
+
+
+@pytest.mark.parametrize('content_type', ['', 'application/x-ndjson'])
+def test_ndjson_lines(content_type):
+    data = '\n'.join(json.dumps(r, ensure_ascii=False) for r in RECORDS).encode()
+    assert parse(data, content_type) == RECORDS
+
+
+def test_pretty_printed_single_record():
+    assert parse(json.dumps(RECORDS[0], ensure_ascii=False, indent=2).encode()) == [RECORDS[0]]
+
+
+def test_malformed_ndjson_line_does_not_stop_stream():
+    lines = [json.dumps(RECORDS[0]), '{"RECORD_ID": ', json.dumps(RECORDS[1]), '3']
+    parsed = parse('\n'.join(lines).encode(), 'application/x-ndjson')
+
+    assert parsed[0] == RECORDS[0] and parsed[2] == RECORDS[1]
+    assert isinstance(parsed[1], InvalidRecord) and '第 2 行' in parsed[1].error
+    assert isinstance(parsed[3], InvalidRecord)
+
+
+def test_truncated_array():
+    data = json.dumps(RECORDS).encode()[:-20]
+    parsed = parse(data)
+
+    assert parsed[:-1] == RECORDS[:len(parsed) - 1]
+    assert isinstance(parsed[-1], InvalidRecord)
+
+
+def test_stream_endpoint_emits_error_lines_in_order(monkeypatch):
+    def fake_window(records, deadline=None):
+        return [json.dumps({'record_id': r['RECORD_ID'], 'report': 'ok', 'degraded': []}) + '\n' for r in records]
+
+    monkeypatch.setattr(text_processing, 'process_window', fake_window)
+    app = FastAPI()
+    app.include_router(router)
+    body = '\n'.join([json.dumps(RECORDS[0]), 'not json', json.dumps(RECORDS[1]), json.dumps(RECORDS[2])])
+
+    with TestClient(app) as client:
+        response = client.post('/process/stream', params={'window': 2}, content=body.encode(),
+                               headers={'content-type': 'application/x-ndjson'})
+
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert response.status_code == 200
+    assert [row['record_id'] for row in rows] == ['R0', None, 'R1', 'R2']
+    assert 'error' in rows[1]
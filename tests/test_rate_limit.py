@@ -0,0 +1,84 @@
+import time
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import llm_rate_limit
+from benchmark import MockLLMServer
+from llm_processing import SuggestionTranslator
+
+SUGGESTIONS = [f'建議 {i}' for i in range(24)]
+
+RETRY_AFTER = 0.3
+
+
+@pytest.fixture
+def llm_server(monkeypatch):
+    """
+    : returns: 回傳 429（含 try again 秒數）的本機模擬端點
+    """
+    server = MockLLMServer(latency=0.02, rate_429=0.2, retry_after=RETRY_AFTER, seed=1)
+    monkeypatch.setenv('AZURE_OPENAI_ENDPOINT', server.start())
+    monkeypatch.setenv('AZURE_OPENAI_API_KEY', 'test')
+    monkeypatch.setenv('LLM_CACHE_ENABLED', '0')
+    monkeypatch.setattr(llm_rate_limit, '_limiters', {})
+    yield server
+    server.stop()
+
+
+def make_translator(deployment, calls):
+    """
+    : param calls: 寫入每次呼叫的 (開始時間, 是否為 429 回應, 回應時間)
+    """
+    translator = SuggestionTranslator('1', model=deployment, max_workers=8)
+    create = translator.client.chat.completions.create
+    lock = threading.Lock()
+
+    def timed_create(**request_kwargs):
+        start = time.monotonic()
+        try:
+            response = create(**request_kwargs)
+        except Exception as e:
+            with lock:
+                calls.append((start, '429' in str(e), time.monotonic()))
+            raise
+        with lock:
+            calls.append((start, False, time.monotonic()))
+        return response
+
+    translator.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=timed_create)))
+    return translator
+
+
+def test_rate_limit_pauses_all_callers(llm_server):
+    calls = []
+    translator = make_translator('test-429', calls)
+    results = translator.translate_batch(SUGGESTIONS)
+
+    throttled = [end for _, is_429, end in calls if is_429]
+    assert throttled and len(throttled) == llm_server.throttled == translator.limiter.throttled
+    assert len(calls) == llm_server.calls
+    assert all(results[s] in (s, f'改寫：{s}') for s in SUGGESTIONS)
+    # 任一呼叫收到 429 後，所有 thread 在 try again 秒數內都不再送出請求（已在進行中的除外）
+    for received in throttled:
+        assert not [start for start, _, _ in calls if received + 0.05 < start < received + RETRY_AFTER]
+
+
+def test_requests_stay_within_rpm(llm_server, monkeypatch):
+    rpm = 600
+    monkeypatch.setenv('LLM_RPM_LIMIT', str(rpm))
+    calls = []
+    translator = make_translator('test-rpm', calls)
+    # 先用完 bucket 的初始額度，之後的請求數只受補充速率限制
+    for _ in range(rpm):
+        translator.limiter.acquire()
+
+    started = time.monotonic()
+    translator.translate_batch(SUGGESTIONS[:16])
+
+    # 包含 429 後的重試，第 k 個請求不早於 bucket 補充 k 個額度的時間
+    starts = sorted(start - started for start, _, _ in calls)
+    assert len(starts) >= 16
+    for k, start in enumerate(starts, 1):
+        assert start >= k * 60 / rpm - 0.02
@@ -0,0 +1,119 @@
+from types import SimpleNamespace
+
+import pytest
+
+import reference_cache
+import db_to_dataframe as db_module
+from reference_cache import ReferenceCache
+from conftest import UNMATCHED_DIAG
+
+
+class Loader:
+    """
+    依 codes 回傳 rows（每個 code 一筆，unknown 中的 code 查無資料），並記錄每次查詢的 codes
+    """
+
+    def __init__(self, unknown=()):
+        self.unknown = set(unknown)
+        self.calls = []
+
+    def __call__(self, codes):
+        self.calls.append(list(codes))
+        return [{'CODE': code, 'NAME': f'name-{code}'} for code in codes if code not in self.unknown]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(reference_cache, 'time', SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = ReferenceCache(ttl_seconds=10)
+    loader = Loader()
+    cache.get_rows('item_meta', 'CODE', ['A'], loader)
+
+    clock[0] += 9.9
+    cache.get_rows('item_meta', 'CODE', ['A'], loader)
+    assert loader.calls == [['A']]
+
+    clock[0] += 0.1
+    cache.get_rows('item_meta', 'CODE', ['A', 'B'], loader)
+    assert loader.calls == [['A'], ['A', 'B']]
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 3
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = ReferenceCache(max_entries=2)
+    loader = Loader()
+    cache.get_rows('item_meta', 'CODE', ['A', 'B'], loader)
+    # 讀取 A 使其成為最近使用，加入 C 時淘汰 B
+    cache.get_rows('item_meta', 'CODE', ['A'], loader)
+    cache.get_rows('item_meta', 'CODE', ['C'], loader)
+    assert cache.stats()['evictions'] == 1 and cache.stats()['entries'] == 2
+
+    loader.calls.clear()
+    assert cache.get_rows('item_meta', 'CODE', ['A', 'B', 'C'], loader) == \
+        [{'CODE': code, 'NAME': f'name-{code}'} for code in 'ABC']
+    assert loader.calls == [['B']]
+
+
+def test_unknown_codes_are_cached(clock):
+    cache = ReferenceCache()
+    loader = Loader(unknown={'X'})
+    assert cache.get_rows('diag:1', 'CODE', ['X', ' A'], loader) == [{'CODE': 'A', 'NAME': 'name-A'}]
+    assert cache.get_rows('diag:1', 'CODE', ['A ', 'X'], loader) == [{'CODE': 'A', 'NAME': 'name-A'}]
+    assert loader.calls == [['X', 'A']]
+    assert cache.stats()['entries'] == 2
+
+
+def test_invalidate_during_load_discards_loaded_rows(clock):
+    cache = ReferenceCache()
+    version = cache.version
+
+    def load_and_invalidate(codes):
+        # 查詢 MongoDB 期間參考資料被更新
+        cache.invalidate()
+        return [{'CODE': code, 'NAME': 'old'} for code in codes]
+
+    assert cache.get_rows('item_meta', 'CODE', ['A'], load_and_invalidate) == [{'CODE': 'A', 'NAME': 'old'}]
+    assert cache.version == version + 1
+    assert cache.stats()['entries'] == 0
+
+    loader = Loader()
+    assert cache.get_rows('item_meta', 'CODE', ['A'], loader) == [{'CODE': 'A', 'NAME': 'name-A'}]
+    assert loader.calls == [['A']]
+
+
+def test_invalidate_table_keeps_other_tables(clock):
+    cache = ReferenceCache()
+    loader = Loader()
+    for table in ['diag:1', 'diag:12', 'diagnosis', 'summary']:
+        cache.get_rows(table, 'CODE', ['A'], loader)
+
+    cache.invalidate('diag')
+    loader.calls.clear()
+    for table in ['diag:1', 'diag:12', 'diagnosis', 'summary']:
+        cache.get_rows(table, 'CODE', ['A'], loader)
+    assert loader.calls == [['A'], ['A']]
+
+
+def test_warm_db_to_dataframe_skips_mongo(mongo_requests, monkeypatch):
+    queries = []
+    timed_query = db_module.timed_query
+
+    def counting_query(collection, operation, func):
+        queries.append(collection)
+        return timed_query(collection, operation, func)
+
+    monkeypatch.setattr(db_module, 'timed_query', counting_query)
+    cold = db_module.db_to_dataframe(mongo_requests)
+    assert queries
+
+    # 查無對應的 DIAG_CODE 同樣由快取回答
+    queries.clear()
+    warm = db_module.db_to_dataframe(mongo_requests)
+    assert queries == []
+    assert warm.equals(cold)
+    assert UNMATCHED_DIAG in {code for table, code in reference_cache.reference_cache._entries if table.startswith('diag:')}
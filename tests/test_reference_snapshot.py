@@ -0,0 +1,103 @@
+import logging
+
+import pytest
+
+pytest.importorskip('pyarrow')
+
+import reference_snapshot
+from reference_snapshot import get_snapshot, write_snapshot
+
+TABLES = {'item_meta': ('ITEM_CODE', [{'ITEM_CODE': 'A1', 'TCNAME_ITEM': '血壓'}])}
+
+
+@pytest.fixture
+def snapshot_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('REF_SNAPSHOT_DIR', str(tmp_path))
+    monkeypatch.setattr(reference_snapshot, '_snapshot', None)
+    monkeypatch.setattr(reference_snapshot, '_snapshot_root', '')
+    monkeypatch.setattr(reference_snapshot, '_snapshot_checked_at', 0.0)
+    return tmp_path
+
+
+def test_missing_snapshot_is_cached_until_next_check(snapshot_dir, monkeypatch, caplog):
+    monkeypatch.setenv('REF_SNAPSHOT_CHECK_SEC', '60')
+    opened = []
+    real_open = open
+
+    def counting_open(path, *args, **kwargs):
+        opened.append(path)
+        return real_open(path, *args, **kwargs)
+
+    monkeypatch.setattr('builtins.open', counting_open)
+    with caplog.at_level(logging.WARNING, logger='reference_snapshot'):
+        assert [get_snapshot() for _ in range(5)] == [None] * 5
+    monkeypatch.setattr('builtins.open', real_open)
+
+    assert len(opened) == 1
+    assert len(caplog.records) == 1
+
+    # 檢查間隔內寫入的快照於下次檢查時才載入
+    version = write_snapshot(str(snapshot_dir), TABLES)
+    assert get_snapshot() is None
+    monkeypatch.setenv('REF_SNAPSHOT_CHECK_SEC', '0')
+    assert get_snapshot().version == version
+
+
+def test_missing_snapshot_warns_once(snapshot_dir, monkeypatch, caplog):
+    monkeypatch.setenv('REF_SNAPSHOT_CHECK_SEC', '0')
+    with caplog.at_level(logging.WARNING, logger='reference_snapshot'):
+        for _ in range(3):
+            assert get_snapshot() is None
+    assert len(caplog.records) == 1
+
+
+def test_write_snapshot_swaps_current_and_prunes(snapshot_dir, monkeypatch):
+    first = write_snapshot(str(snapshot_dir), TABLES, keep=2)
+    opened = get_snapshot()
+
+    # CURRENT 切換前中斷：CURRENT 仍指向原版本，不留下暫存檔
+    def crash(src, dst):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(reference_snapshot.os, 'replace', crash)
+    with pytest.raises(OSError):
+        write_snapshot(str(snapshot_dir), TABLES, keep=2)
+    monkeypatch.undo()
+    assert (snapshot_dir / 'CURRENT').read_text() == first
+
+    second = write_snapshot(str(snapshot_dir), TABLES, keep=2)
+    third = write_snapshot(str(snapshot_dir), TABLES, keep=2)
+    assert (snapshot_dir / 'CURRENT').read_text() == third
+    versions = sorted(p.name for p in snapshot_dir.iterdir() if p.is_dir() and not p.name.startswith('.'))
+    assert versions == sorted([second, third]) and first not in versions
+    assert not [p.name for p in snapshot_dir.iterdir() if p.name.endswith('.tmp')]
+
+    # 已開啟的舊版本於目錄刪除後仍可讀取
+    assert opened.version == first
+    assert opened.lookup('item_meta', ['A1'])['TCNAME_ITEM'].tolist() == ['血壓']
+
+
+def test_lookup_follows_code_order(snapshot_dir):
+    rows = [
+        {'DIAG_CODE': 'D2', 'ORG_ID': 'o1', 'SUMMARY_CODE': 'S2'},
+        {'DIAG_CODE': 'D1', 'ORG_ID': 'o1', 'SUMMARY_CODE': 'S1'},
+        {'DIAG_CODE': None, 'ORG_ID': 'o1', 'SUMMARY_CODE': 'S0'},
+        {'DIAG_CODE': 'D2', 'ORG_ID': 'o2', 'SUMMARY_CODE': 'S3'},
+    ]
+    write_snapshot(str(snapshot_dir), {
+        'diag': ('DIAG_CODE', rows),
+        'numeric': ('CODE', [{'CODE': 10, 'NAME': 'ten'}, {'CODE': 2, 'NAME': 'two'}]),
+        'empty': ('CODE', []),
+    })
+    snapshot = get_snapshot()
+
+    # 依 codes 順序（去重、去除前後空白），同一 code 的多筆依表中順序；查無資料的 code 略過
+    found = snapshot.lookup('diag', [' D2', 'MISSING', 'D1', 'D2'])
+    assert found[['DIAG_CODE', 'ORG_ID']].values.tolist() == [['D2', 'o1'], ['D2', 'o2'], ['D1', 'o1']]
+    assert snapshot.lookup('diag', ['D1'], columns=['SUMMARY_CODE', 'NOT_IN_SNAPSHOT']).columns.tolist() == ['SUMMARY_CODE']
+    assert snapshot.lookup('diag', ['MISSING']).empty
+    assert snapshot.lookup('diag', []).columns.tolist() == ['DIAG_CODE', 'ORG_ID', 'SUMMARY_CODE']
+
+    # 非字串的 key 以字串比對
+    assert snapshot.lookup('numeric', ['2', 10])['NAME'].tolist() == ['two', 'ten']
+    assert snapshot.lookup('empty', ['A']).empty
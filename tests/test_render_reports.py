@@ -0,0 +1,55 @@
+import os
+import json
+
+import pandas as pd
+import pytest
+
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+from text_processing import SUBSET, REPORT_COLUMNS, process_1_record, render_reports, report_rows
+
+# 60 筆 record（四種語系、前後空白、預設 SUMMARY、空 SUMMARY / COMMENT、數字與字串混合的 ITEM_CODE、列順序打亂），
+# expected 為向量化改寫前逐筆 process_1_record 的輸出（固定，不隨目前程式重新產生）
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'data', 'render_reports_baseline.json')
+
+
+@pytest.fixture(scope='module')
+def baseline():
+    with open(BASELINE_PATH, encoding='utf-8') as f:
+        data = json.load(f)
+    rows = pd.DataFrame(data['rows'], columns=data['columns'])
+    return rows, data['summary_translated'], data['expected']
+
+
+def preprocessed(rows):
+    """
+    將通用欄位名稱改回各 record 語系的欄位（同 data_preprocessing 的輸出），其他語系的欄位留空
+    """
+    records = []
+    for row in rows.to_dict('records'):
+        columns = SUBSET[row['LANG_NO'].strip()]
+        record = {column: '' for langu_columns in SUBSET.values() for column in langu_columns}
+        record.update(zip(columns, (row[column] for column in REPORT_COLUMNS)))
+        records.append(record)
+    return pd.DataFrame(records)
+
+
+@pytest.mark.parametrize('engine', ['pandas', pytest.param('polars', marks=pytest.mark.skipif(
+    pl is None, reason='polars 未安裝'))])
+def test_render_reports_matches_baseline(baseline, monkeypatch, engine):
+    monkeypatch.setenv('DATAFRAME_ENGINE', engine)
+    rows, summary_translated, expected = baseline
+    reports = render_reports(report_rows(preprocessed(rows)), summary_translated)
+    assert list(reports) == list(expected)
+    for record_id, report in expected.items():
+        assert reports[record_id] == report, record_id
+
+
+def test_process_1_record_matches_baseline(baseline):
+    rows, summary_translated, expected = baseline
+    for record_id, df_record in rows.groupby('RECORD_ID', sort=False):
+        langu_no = df_record['LANG_NO'].iloc[0].strip()
+        assert process_1_record(langu_no, df_record, summary_translated[langu_no]) == expected[record_id], record_id
@@ -0,0 +1,68 @@
+import copy
+import json
+import zlib
+
+import pytest
+
+import result_store
+import text_processing
+from result_store import ResultStore
+from text_processing import process_records
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.delenv('RESULT_STORE_ENABLED', raising=False)
+    monkeypatch.delenv('AZURE_OPENAI_ENDPOINT', raising=False)
+    monkeypatch.setenv('REFERENCE_DATA_VERSION', 'test-1')
+    store = ResultStore(str(tmp_path / 'results.sqlite3'))
+    monkeypatch.setattr(result_store, '_result_store', store)
+    return store
+
+
+def test_stored_rows_match_fresh_rows(mongo_requests, store):
+    requests = [{**request, 'RECORD_ID': i} for i, request in enumerate(mongo_requests)]
+
+    fresh, preprocessed = process_records(requests)
+    assert preprocessed is not None and store.stats()['entries'] == len(requests)
+
+    stored, preprocessed = process_records(requests)
+    assert preprocessed is None
+    assert fresh.to_dict(orient='records') == stored.to_dict(orient='records')
+    assert list(fresh['request']) == [json.dumps(request, ensure_ascii=False) for request in requests]
+
+
+def test_mongo_without_reference_version_is_not_stored(mongo_requests, store, monkeypatch):
+    monkeypatch.delenv('REFERENCE_DATA_VERSION')
+    requests = [{**request, 'RECORD_ID': i} for i, request in enumerate(mongo_requests)]
+
+    for _ in range(2):
+        _, preprocessed = process_records(requests)
+        assert preprocessed is not None
+    assert store.stats() == {'entries': 0, 'hits': 0, 'misses': 0}
+
+
+def test_partial_hits_merge_in_request_order(mongo_requests, store, monkeypatch):
+    def fake_suggestion(langu_no, summaries, mode, model, timeout=None, degraded=None):
+        # 部分 SUMMARY 視為逾時（以原文輸出且列於 degraded），其餘加上前綴
+        late = [s for s in summaries if zlib.crc32(s.encode('utf-8')) % 4 == 0]
+        degraded.extend(late)
+        return {s: s if s in late else f'改寫：{s}' for s in summaries}
+
+    monkeypatch.setattr(text_processing, 'process_suggestion', fake_suggestion)
+    requests = [{**request, 'RECORD_ID': i} for i, request in enumerate(mongo_requests)]
+    process_records(requests)
+
+    # 批次中段的 record 變更（其餘由 result store 取回）
+    changed = copy.deepcopy(requests)
+    for request in changed[4:7]:
+        request['ITEMS'][0]['FINDINGS'].reverse()
+        request['NOTE'] = 'changed'
+    merged, preprocessed = process_records(changed)
+    assert preprocessed is not None and preprocessed['RECORD_ID'].nunique() < len(changed)
+
+    monkeypatch.setenv('RESULT_STORE_ENABLED', '0')
+    fresh, _ = process_records(changed)
+    assert any(fresh['degraded']) and not all(fresh['degraded'])
+    assert merged.to_dict(orient='records') == fresh.to_dict(orient='records')
+    assert list(merged['record_id']) == [str(request['RECORD_ID']) for request in changed]
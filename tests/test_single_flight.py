@@ -0,0 +1,132 @@
+import time
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from llm_processing import SuggestionTranslator
+from reference_cache import ReferenceCache
+from single_flight import get_single_flight
+
+TIMEOUT = 5
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + TIMEOUT
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def run_concurrently(leader, follower, group, started):
+    """
+    leader 開始執行（started 已設定）後再啟動 follower，待 follower 合併到 leader 的 in-flight 工作後回傳
+    : returns: (各 thread 的結果或例外, threads)
+    """
+    outcomes = {}
+
+    def run(name, func):
+        try:
+            outcomes[name] = func()
+        except Exception as e:
+            outcomes[name] = e
+
+    coalesced = group.stats()['coalesced']
+    threads = [threading.Thread(target=run, args=('leader', leader), daemon=True)]
+    threads[0].start()
+    assert started.wait(TIMEOUT)
+    threads.append(threading.Thread(target=run, args=('follower', follower), daemon=True))
+    threads[1].start()
+    wait_for(lambda: group.stats()['coalesced'] > coalesced)
+    return outcomes, threads
+
+
+def finish(release, threads):
+    release.set()
+    for thread in threads:
+        thread.join(TIMEOUT)
+    assert not any(thread.is_alive() for thread in threads)
+
+
+class BlockingLoader:
+
+    def __init__(self, rows=None, error=None):
+        self.rows, self.error = rows or [], error
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, codes):
+        self.calls.append(codes)
+        self.started.set()
+        assert self.release.wait(TIMEOUT)
+        if self.error is not None:
+            raise self.error
+        return self.rows
+
+
+@pytest.mark.parametrize('error', [None, ConnectionError('mongo down')])
+def test_reference_lookup_is_loaded_once(error):
+    cache = ReferenceCache()
+    rows = [{'ITEM_CODE': 'A1', 'NAME': '血壓'}]
+    loader = BlockingLoader(rows, error)
+
+    def lookup():
+        return cache.get_rows('sf_item_meta', 'ITEM_CODE', ['A1'], loader)
+
+    outcomes, threads = run_concurrently(lookup, lookup, get_single_flight('reference'), loader.started)
+    finish(loader.release, threads)
+
+    assert loader.calls == [['A1']]
+    if error is None:
+        assert outcomes == {'leader': rows, 'follower': rows}
+    else:
+        # leader 的例外同樣傳給等待中的 follower，且不寫入快取
+        assert outcomes['leader'] is error and outcomes['follower'] is error
+        assert cache.stats()['entries'] == 0
+
+
+class BlockingCompletions:
+
+    def __init__(self):
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def create(self, **request_kwargs):
+        self.calls += 1
+        self.started.set()
+        assert self.release.wait(TIMEOUT)
+        raise ValueError('Error code: 400 - bad request')
+
+
+@pytest.mark.parametrize('failure', ['api_error', 'unit_crash'])
+def test_failed_llm_leader_returns_original_to_waiters(monkeypatch, failure):
+    monkeypatch.delenv('AZURE_OPENAI_ENDPOINT', raising=False)
+    monkeypatch.setenv('LLM_CACHE_ENABLED', '0')
+    completions = BlockingCompletions()
+    suggestion = f'建議追蹤（{failure}）'
+
+    def make_translator():
+        translator = SuggestionTranslator('1', model='test-single-flight')
+        translator.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        if failure == 'unit_crash':
+            # 呼叫單位本身丟出非預期例外（非 API 錯誤）
+            translate_unit = translator._translate_unit
+
+            def crash(unit):
+                translate_unit(unit)
+                raise RuntimeError('unexpected')
+            translator._translate_unit = crash
+        return translator
+
+    leader, follower = make_translator(), make_translator()
+    outcomes, threads = run_concurrently(
+        lambda: leader.translate_batch([suggestion]), lambda: follower.translate_batch([suggestion]),
+        get_single_flight('llm_rewrite'), completions.started
+    )
+    finish(completions.release, threads)
+
+    assert completions.calls == 1
+    assert outcomes == {'leader': {suggestion: suggestion}, 'follower': {suggestion: suggestion}}
+    assert get_single_flight('llm_rewrite').stats()['inflight'] == 0
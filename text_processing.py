@@ -1,13 +1,29 @@
 import os
-from datetime import datetime
-import pandas as pd
+import time
 import json
-from typing import List, Dict, Any, Optional
+import codecs
+import asyncio
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from collections import Counter
+from typing import List, Dict, Any, Optional, AsyncIterator, NamedTuple, Tuple
 from utils import log_execution_time
+from metrics import span
+from dataframe_engine import get_engine, first_seen_ids
+from output_sink import get_sink, new_run_id
+from result_store import get_result_store, record_fingerprint
 from data_preprocessing_251029 import postprocess_multilang
-from db_to_dataframe_251029 import db_to_dataframe
-from llm_processing_251029 import process_suggestion
-from fastapi import APIRouter, HTTPException
+from db_to_dataframe_251029 import db_to_dataframe, reference_data_version
+from llm_processing_251029 import process_suggestion, SuggestionTranslator
+from fastapi import APIRouter, Body, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -19,6 +35,12 @@ SUBSET = {
     '4':['RECORD_ID', 'LANG_NO', 'GROUPNO', 'SCNAME_GROUP', 'ITEM_CODE', 'SCNAME_ITEM', 'SCNAME_COMMENT', 'SCNAME_SUMMARY']
 }
 
+# report_rows 輸出的通用欄位名稱（依 SUBSET 欄位順序）
+REPORT_COLUMNS = ['RECORD_ID', 'LANG_NO', 'GROUPNO', 'GROUP', 'ITEM_CODE', 'ITEM_NAME', 'COMMENT', 'SUMMARY']
+
+# 報告格式版本（輸出格式變更時遞增，使 result store 中的舊報告失效）
+REPORT_VERSION = '1'
+
 # 各語系預設文字對照表
 LANGU_MAP = {
     '1': '本項無補充說明',
@@ -30,31 +52,44 @@ LANGU_MAP = {
 
 # 依序將 RECORD_ID_LST 中的 record_id，從 preprocessed_df 擷取，整併為可讀文本
 @ log_execution_time
-def text_processing(preprocessed_df: pd.DataFrame, processed_report_csv_path: Optional[str], api_requests: List[Dict[str, Any]]) -> pd.DataFrame:
+def text_processing(preprocessed_df: pd.DataFrame, processed_report_csv_path: Optional[str], api_requests: List[Dict[str, Any]],
+                    deadline: Optional[float] = None, unrewritten: Optional[Dict[Any, List[str]]] = None) -> pd.DataFrame:
+    """
+    : param deadline: LLM 改寫的截止時間（time.monotonic() 值）；逾時未完成的 SUMMARY 以原文輸出，並記錄於 degraded 欄位
+    : param unrewritten: 若提供，寫入 key -> RECORD_ID，value -> 以原文輸出的 SUMMARY（逾時或 LLM 失敗）
+    """
     text_processed_rows = []
 
-    record_groups = preprocessed_df.groupby('RECORD_ID', sort=False)
+    # 整個 request 的 SUMMARY 依 LANG_NO 彙整去重後，每個語系只做一次批次改寫
+    degraded = {}
+    summary_translated = translate_summaries(preprocessed_df, deadline, degraded)
+
+    # 所有 record 一次選取語系欄位並組成層次化文字
+    rows = report_rows(preprocessed_df)
+    reports = render_reports(rows, summary_translated)
+    degraded_summaries = get_degraded_summaries(rows, degraded)
+    if unrewritten is not None:
+        # LLM 失敗時改寫結果與原文相同（預設文字本來就不改寫）
+        defaults = set(LANGU_MAP.values())
+        fallback = {langu_no: degraded.get(langu_no, set()) | {s for s, t in translated.items() if s == t and s not in defaults}
+                    for langu_no, translated in summary_translated.items()}
+        unrewritten.update(get_degraded_summaries(rows, fallback))
+
+    # 同一 RECORD_ID 重複出現時以第一筆 request 為準（key 以字串比對，與 result store 取回的 record 輸出一致）
+    request_map = {}
+    for item in api_requests:
+        request_map.setdefault(str(item['RECORD_ID']), item)
+
     for api_request in api_requests:
         record_id = api_request['RECORD_ID']
-        df = record_groups.get_group(record_id)
-        langu_no = str(df['LANG_NO'].iloc[0]).strip()         # 取得該 record 的 LANG_NO -> 1 / 2 / 3 / 4
-        df = df[SUBSET[langu_no]]                             # 依 LANG_NO 選取對應欄位
-
-        # rename col 為通用名稱
-        report_df =  df.rename(columns={
-            f'{SUBSET[langu_no][3]}': 'GROUP',
-            f'{SUBSET[langu_no][5]}': 'ITEM_NAME',
-            f'{SUBSET[langu_no][6]}': 'COMMENT',
-            f'{SUBSET[langu_no][7]}': 'SUMMARY'
-        })
-
-        target_json = next((item for item in api_requests if item["RECORD_ID"] == str(record_id)), None)
+        output = reports[record_id]
+
+        target_json = request_map.get(str(record_id))
         target_json = json.dumps(target_json, ensure_ascii=False) if target_json else ''
 
-        output = process_1_record(langu_no, report_df)
-        text_processed_rows.append([str(record_id), output, target_json])
+        text_processed_rows.append([str(record_id), output, target_json, degraded_summaries.get(record_id, [])])
 
-    df_out = pd.DataFrame(text_processed_rows, columns=['record_id', 'report', 'request'])
+    df_out = pd.DataFrame(text_processed_rows, columns=['record_id', 'report', 'request', 'degraded'])
 
     if processed_report_csv_path:
         df_out.to_csv(processed_report_csv_path, index=False)
@@ -62,8 +97,45 @@ def text_processing(preprocessed_df: pd.DataFrame, processed_report_csv_path: Op
     return df_out
 
 
+# 依 LANG_NO 收集所有 record 的 SUMMARY，各語系一次送出改寫（語系間並行）
+@log_execution_time
+def translate_summaries(preprocessed_df: pd.DataFrame, deadline: Optional[float] = None,
+                        degraded: Optional[Dict[str, set]] = None) -> Dict[str, Dict[str, str]]:
+    """
+    : param deadline: 截止時間（time.monotonic() 值）；None 表示等待全部完成
+    : param degraded: 若提供，寫入 key -> LANG_NO，value -> 逾時而以原文輸出的 SUMMARY
+    : returns: key -> LANG_NO，value -> {原文: 改寫後文本}
+    """
+    langu_series = preprocessed_df['LANG_NO'].astype(str).str.strip()
+    langu_list = langu_series.drop_duplicates().to_list()
+    if not langu_list:
+        return {}
+
+    def translate(langu_no: str) -> Dict[str, str]:
+        with span('translate_langu', langu_no=langu_no):
+            return translate_langu(langu_no)
+
+    def translate_langu(langu_no: str) -> Dict[str, str]:
+        summaries = preprocessed_df.loc[langu_series == langu_no, SUBSET[langu_no][7]]
+        summary_2_llm = list(dict.fromkeys(s.strip() for s in summaries.drop_duplicates().to_list() if s))
+        timeout = None if deadline is None else deadline - time.monotonic()
+        langu_degraded = []
+        translated = process_suggestion(
+            langu_no, summary_2_llm, mode='azure', model=os.getenv('AZURE_OPENAI_DEPLOYMENT', 'gpt-4o'),
+            timeout=timeout, degraded=langu_degraded
+        )
+        if degraded is not None:
+            degraded[langu_no] = set(langu_degraded)
+        return translated
+
+    # 各語系於自己的 context 副本中執行，span 記錄於 translate_summaries 之下
+    with ThreadPoolExecutor(max_workers=len(langu_list)) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, translate, langu_no) for langu_no in langu_list]
+        return dict(zip(langu_list, (future.result() for future in futures)))
+
+
 # 同一 record 的記錄整併為層次化文字輸出
-def process_1_record(langu_no: str, report_df: pd.DataFrame) -> str:
+def process_1_record(langu_no: str, report_df: pd.DataFrame, summary_translated: Optional[Dict[str, str]] = None) -> str:
     """
     層級關係：
     GROUP                      1st
@@ -71,107 +143,452 @@ def process_1_record(langu_no: str, report_df: pd.DataFrame) -> str:
             COMMENT            3rd
                 SUMMARY        2nd 原文
                 SUMMARY        2nd 改寫後
+
+    : param report_df: 已改為通用欄位名稱（GROUP / ITEM_NAME / COMMENT / SUMMARY）的單一 record 資料
+    : param summary_translated: 已改寫的 SUMMARY 對照表；未提供時就本 record 的 SUMMARY 呼叫改寫
     """
-    summary_2_llm = [s.strip() for s in report_df['SUMMARY'].drop_duplicates().to_list() if s]
-    summary_translated = process_suggestion(langu_no, summary_2_llm, mode='azure', model=os.getenv('AZURE_OPENAI_DEPLOYMENT', 'gpt-4o'))
+    if summary_translated is None:
+        summary_2_llm = [s.strip() for s in report_df['SUMMARY'].drop_duplicates().to_list() if s]
+        summary_translated = process_suggestion(langu_no, summary_2_llm, mode='azure', model=os.getenv('AZURE_OPENAI_DEPLOYMENT', 'gpt-4o'))
+
+    rows = report_df.assign(RECORD_ID='', LANG_NO=langu_no)
+    return render_reports(rows, {langu_no: summary_translated}).get('', '')
+
 
-    lines = []
+# 依各 record 第一列的 LANG_NO 選取對應語系欄位，改為通用名稱後合併（保持原本列順序）
+@log_execution_time
+def report_rows(preprocessed_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    : returns: 欄位為 RECORD_ID / LANG_NO / GROUPNO / GROUP / ITEM_CODE / ITEM_NAME / COMMENT / SUMMARY，
+               LANG_NO 為該 record 的語系（已 strip）
+    """
+    first_rows = preprocessed_df.drop_duplicates('RECORD_ID')
+    record_langu = pd.Series(first_rows['LANG_NO'].astype(str).str.strip().to_numpy(), index=first_rows['RECORD_ID'].to_numpy())
+    langu = preprocessed_df['RECORD_ID'].map(record_langu).to_numpy()
 
-    for group, df_group in report_df.groupby('GROUP', sort=False):
-        lines.append(group.strip())
+    parts, positions = [], []
+    for langu_no in pd.unique(langu):
+        pos = np.flatnonzero(langu == langu_no)
+        part = preprocessed_df.iloc[pos][SUBSET[langu_no]]
+        part.columns = REPORT_COLUMNS
+        parts.append(part.assign(LANG_NO=langu_no))
+        positions.append(pos)
 
-        summary_blocks = []
-        for summary, df_summary in df_group.groupby('SUMMARY', sort=False):
+    if not parts:
+        return pd.DataFrame(columns=REPORT_COLUMNS)
 
-            if summary == LANGU_MAP[langu_no]:
-                for comment, df_comment in df_summary.groupby('COMMENT', sort=False):
-                    item = get_unique_item_names(df_comment)
-                    summary_blocks.append({
-                        'items': item,
-                        'comments': [comment.strip()],
-                        'summary': summary.strip()
-                    })
-            else:
-                item = get_unique_item_names(df_summary)
-                comments = df_summary['COMMENT'].str.strip().drop_duplicates().to_list()
-                summary_blocks.append({
-                    'items': item,
-                    'comments': comments,
-                    'summary': summary.strip()
-                })
+    order = np.argsort(np.concatenate(positions), kind='stable')
+    return pd.concat(parts).iloc[order].reset_index(drop=True)
 
-        first_seen = {}
-        for i, b in enumerate(summary_blocks):
-            it_key = tuple(b['items'])
-            if it_key not in first_seen:
-                first_seen[it_key] = i
 
-        indexed_blocks = list(enumerate(summary_blocks))
-        indexed_blocks.sort(key=lambda t: (first_seen[tuple(t[1]['items'])], t[0]))
+# 由 report_rows 的結果一次產生所有 record 的層次化文字
+@log_execution_time
+def render_reports(rows: pd.DataFrame, summary_translated: Dict[str, Dict[str, str]]) -> Dict[Any, str]:
+    """
+    整批排序、分界與首次出現順序皆以向量化計算，逐 block 只做字串組合：
+    - block：同一 record / GROUP / SUMMARY（SUMMARY 為預設文字時再依 COMMENT 拆分）
+    - block 依 GROUP、SUMMARY、COMMENT 首次出現順序排列；同一 GROUP 內相同 ITEM 組合的 block 相鄰輸出
+    - ITEM 依 ITEM_CODE 去重、COMMENT 依 strip 後內容去重，皆保留首次出現順序
 
-        last_it_key = None
-        for _, block in indexed_blocks:
-            it_key = tuple(block['items'])
-            if it_key != last_it_key:
-                lines.append(f"    {'、'.join(block['items'])}")
-                last_it_key = it_key
+    : param summary_translated: key -> LANG_NO，value -> {原文: 改寫後文本}
+    : returns: key -> RECORD_ID，value -> 層次化文字
+    """
+    if rows.empty:
+        return {}
+
+    is_default = (rows['SUMMARY'] == rows['LANG_NO'].map(LANGU_MAP)).to_numpy()
+    frame = rows.assign(COMMENT_KEY=rows['COMMENT'].where(is_default, ''))
+
+    # groupby(sort=False).ngroup() 依首次出現順序編號（polars 引擎下三組 key 於同一 plan 平行計算）
+    key_sets = [['RECORD_ID', 'GROUP'], ['RECORD_ID', 'GROUP', 'SUMMARY'], ['RECORD_ID', 'GROUP', 'SUMMARY', 'COMMENT_KEY']]
+    if get_engine(frame[['RECORD_ID', 'GROUP', 'SUMMARY', 'COMMENT_KEY']]) == 'polars':
+        group_id, summary_id, block_id = first_seen_ids(frame, key_sets)
+    else:
+        group_id, summary_id, block_id = [frame.groupby(keys, sort=False, dropna=False).ngroup().to_numpy() for keys in key_sets]
+    n_blocks = int(block_id.max()) + 1
+    block_first = np.unique(block_id, return_index=True)[1]
+
+    items = _block_values(block_id, rows['ITEM_CODE'].astype(str).str.strip(), rows['ITEM_NAME'].astype(str).str.strip(), n_blocks)
+    comment_stripped = rows['COMMENT'].str.strip()
+    comments = _block_values(block_id, comment_stripped, comment_stripped, n_blocks)
+
+    record_ids = rows['RECORD_ID'].to_numpy()[block_first].tolist()
+    langus = rows['LANG_NO'].to_numpy()[block_first].tolist()
+    groups = rows['GROUP'].to_numpy()[block_first].tolist()
+    summaries = rows['SUMMARY'].to_numpy()[block_first].tolist()
+    block_group = group_id[block_first]
+
+    reports: Dict[Any, List[str]] = {}
+    group_blocks = []
+    last_group = None
+    for b in np.lexsort((np.arange(n_blocks), summary_id[block_first], block_group)).tolist():
+        if block_group[b] != last_group:
+            if group_blocks:
+                _render_group(lines, group_blocks, translated)
+            last_group = block_group[b]
+            lines = reports.setdefault(record_ids[b], [])
+            translated = summary_translated.get(langus[b], {})
+            lines.append(groups[b].strip())
+            group_blocks = []
+        group_blocks.append((items[b], comments[b], summaries[b].strip()))
+    _render_group(lines, group_blocks, translated)
+
+    return {record_id: '\n'.join(lines) for record_id, lines in reports.items()}
+
+
+def _block_values(block_id: np.ndarray, keys: pd.Series, values: pd.Series, n_blocks: int) -> List[tuple]:
+    """
+    每個 block 內依 keys 去重（保留首次出現），回傳各 block 對應 values 的 tuple
+    """
+    unique = ~pd.DataFrame({'block': block_id, 'key': keys.to_numpy()}).duplicated().to_numpy()
+    pos = np.flatnonzero(unique)
+    pos = pos[np.argsort(block_id[pos], kind='stable')]
+    bounds = np.searchsorted(block_id[pos], np.arange(n_blocks + 1)).tolist()
+    values = values.to_numpy()[pos].tolist()
+    return [tuple(values[bounds[i]:bounds[i + 1]]) for i in range(n_blocks)]
 
-            if block['comments']:
-                lines.append(f"        {'、'.join(block['comments'])}")
 
-            summary = block['summary']
-            if summary:
-                lines.append(f"            {summary_translated.get(summary, summary)}\n")
+def _render_group(lines: List[str], blocks: List[tuple], summary_translated: Dict[str, str]):
+    """
+    同一 GROUP 的 block 依 ITEM 組合首次出現順序重排（穩定排序），相同 ITEM 組合只輸出一次 ITEM 行
+    """
+    first_seen = {}
+    for i, (items, _, _) in enumerate(blocks):
+        first_seen.setdefault(items, i)
 
-    return '\n'.join(lines)
+    last_items = None
+    for items, comments, summary in sorted(blocks, key=lambda block: first_seen[block[0]]):
+        if items != last_items:
+            lines.append(f"    {'、'.join(items)}")
+            last_items = items
 
+        if comments:
+            lines.append(f"        {'、'.join(comments)}")
 
-def get_unique_item_names(df_summary: pd.DataFrame) -> list:
-    item_dict = {}
-    result = []
+        if summary:
+            lines.append(f"            {summary_translated.get(summary, summary)}\n")
 
-    for _, row in df_summary.iterrows():
-        item_code = str(row['ITEM_CODE']).strip()
-        item_name = str(row['ITEM_NAME']).strip()
 
-        if item_code not in item_dict:
-            item_dict[item_code] = item_name
-            result.append(item_name)
+# 各 record 中逾時而以原文輸出的 SUMMARY（strip 後去重，保留首次出現順序）
+def get_degraded_summaries(rows: pd.DataFrame, degraded: Dict[str, set]) -> Dict[Any, List[str]]:
+    if not any(degraded.values()):
+        return {}
 
+    summaries = rows[['RECORD_ID', 'LANG_NO']].assign(SUMMARY=rows['SUMMARY'].str.strip()).drop_duplicates(['RECORD_ID', 'SUMMARY'])
+    result: Dict[Any, List[str]] = {}
+    for record_id, langu_no, summary in summaries.itertuples(index=False):
+        if summary in degraded.get(langu_no, ()):
+            result.setdefault(record_id, []).append(summary)
     return result
 
 
+# result store 指紋；同一 RECORD_ID 出現多次（報告會合併）或 LANG_NO 無效的 record 為 None（不使用 result store）；
+# 參考資料版本未知（MongoDB 未設定 REFERENCE_DATA_VERSION）時全部為 None
+def record_fingerprints(api_requests: List[Dict[str, Any]]) -> List[Optional[str]]:
+    reference_version = reference_data_version()
+    if reference_version is None:
+        return [None] * len(api_requests)
+    counts = Counter(str(api_request.get('RECORD_ID')) for api_request in api_requests)
+    llm_mode = 'azure' if os.getenv('AZURE_OPENAI_ENDPOINT') and os.getenv('AZURE_OPENAI_API_KEY') else 'mock'
+    llm_version = f"{llm_mode}:{os.getenv('AZURE_OPENAI_DEPLOYMENT', 'gpt-4o')}"
+
+    fingerprints = []
+    for api_request in api_requests:
+        langu_no = str(api_request.get('LANG_NO', '')).strip()
+        if counts[str(api_request.get('RECORD_ID'))] > 1 or langu_no not in SUBSET:
+            fingerprints.append(None)
+            continue
+        fingerprints.append(record_fingerprint(api_request, REPORT_VERSION, reference_version, llm_version,
+                                               SuggestionTranslator.prompt_hash(langu_no)))
+    return fingerprints
+
+
+# 未變更的 record 由 result store 取回報告，其餘 record 執行 db_to_dataframe -> postprocess_multilang -> text_processing
+def process_records(api_requests: List[Dict[str, Any]], deadline: Optional[float] = None) -> Tuple[pd.DataFrame, Optional[pd.DataFrame]]:
+    """
+    : param deadline: LLM 改寫的截止時間（time.monotonic() 值）
+    : returns: (df_out（與 api_requests 同順序）, 實際處理的 record 之 preprocessed_df；全部由 result store 取回時為 None)
+    """
+    store = get_result_store()
+    fingerprints = record_fingerprints(api_requests) if store is not None else [None] * len(api_requests)
+    stored = store.get_many(f for f in fingerprints if f) if store is not None else {}
+    pending = [(api_request, f) for api_request, f in zip(api_requests, fingerprints) if f not in stored]
+
+    preprocessed_df, df_pending = None, None
+    if pending or not stored:
+        pending_requests = [api_request for api_request, _ in pending]
+        final_df = db_to_dataframe(pending_requests)
+        preprocessed_df = postprocess_multilang(final_df)
+        unrewritten = {}
+        df_pending = text_processing(preprocessed_df, None, pending_requests, deadline, unrewritten=unrewritten)
+
+        # 只保存每個 SUMMARY 都已改寫的報告
+        if store is not None:
+            store.put_many([
+                (f, str(api_request['RECORD_ID']), report)
+                for (api_request, f), report in zip(pending, df_pending['report'])
+                if f and api_request['RECORD_ID'] not in unrewritten
+            ])
+
+    if not stored:
+        return df_pending, preprocessed_df
+
+    pending_rows = df_pending.itertuples(index=False) if df_pending is not None else iter(())
+    rows = [
+        [str(api_request['RECORD_ID']), stored[f], json.dumps(api_request, ensure_ascii=False), []]
+        if f in stored else list(next(pending_rows))
+        for api_request, f in zip(api_requests, fingerprints)
+    ]
+    return pd.DataFrame(rows, columns=['record_id', 'report', 'request', 'degraded']), preprocessed_df
+
+
 @router.post("/process")
-def process_api(api_requests: Any):
+def process_api(api_requests: Any = Body(...), deadline: Optional[float] = None):
     """
     接收 api_request，處理流程如下：
     db_to_dataframe -> postprocess_multilang -> 由 df_unique 取得 record_id -> text_processing
-    並回傳 text_processing 之 df_out(JSON)。
+    並回傳 text_processing 之 df_out(JSON)。未變更（指紋相同）的 record 直接回傳 result store 中的報告。
+
+    deadline: 整個請求的時間預算（秒，query 參數；未提供時依 PROCESS_DEADLINE_SEC，0 表示不限制）。
+    逾時未完成的 LLM 改寫以原文輸出，該 SUMMARY 列於回傳的 degraded 欄位。
     """
+    if deadline is None:
+        deadline = float(os.getenv('PROCESS_DEADLINE_SEC', '0')) or None
+    deadline_at = time.monotonic() + deadline if deadline else None
+
     try:
         api_requests = [api_requests] if isinstance(api_requests, dict) else api_requests
 
-        final_df = db_to_dataframe(api_requests)
-        preprocessed_df = postprocess_multilang(final_df)
+        df_out, preprocessed_df = process_records(api_requests, deadline_at)
 
-        output_dir = './output_02_text_processed'
-        data_dir = './output_01_preprocessed'
-        os.makedirs(output_dir, exist_ok=True)
-        os.makedirs(data_dir, exist_ok=True)
+        # 中間與最終結果交由背景 thread 寫出（依 OUTPUT_SINK 設定），不影響回應時間
+        sink = get_sink()
+        run_id = new_run_id()
+        if preprocessed_df is not None:
+            sink.submit('preprocessed', preprocessed_df, run_id)
 
-        timestamp = datetime.now().strftime('%y%m%d_%H%M')
-        data_path = os.path.join(data_dir, f'data_processed_{timestamp}.csv')
-        csv_path = os.path.join(output_dir, f'text_processed_{timestamp}.csv')
+        if sink.enabled('text_processed'):
+            org_ids = [str(api_request.get('ORG_ID', '')) for api_request in api_requests]
+            sink.submit('text_processed', df_out.assign(ORG_ID=org_ids), run_id)
 
-        preprocessed_df.to_csv(data_path, index=False)
+        return {"run_id": run_id, "rows": df_out[['report', 'degraded']].to_dict(orient="records")}
 
-        df_out = text_processing(
-            preprocessed_df=preprocessed_df,
-            processed_report_csv_path=csv_path,
-            api_requests=api_requests,
-        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        return {"rows": df_out[['report']].to_dict(orient="records")}
 
+# 串流處理一個 window 的 record，回傳 NDJSON 行；失敗時該 window 的每個 record 各回一行 error
+def process_window(api_requests: List[Dict[str, Any]], deadline: Optional[float] = None) -> List[str]:
+    """
+    : param deadline: 本 window 的時間預算（秒）；None 表示不限制
+    """
+    deadline_at = time.monotonic() + deadline if deadline else None
+    try:
+        df_out, _ = process_records(api_requests, deadline_at)
+        rows = df_out[['record_id', 'report', 'degraded']].to_dict(orient='records')
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.error(f"串流 window 處理失敗（{len(api_requests)} 筆）: {e}")
+        rows = [{'record_id': str(api_request.get('RECORD_ID')), 'error': str(e)} for api_request in api_requests]
+    return [json.dumps(row, ensure_ascii=False) + '\n' for row in rows]
+
+
+class InvalidRecord(NamedTuple):
+    """
+    無法解析的輸入（於串流中的位置輸出一行 {record_id: null, error}）
+    """
+    error: str
+
+
+async def _iter_text(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    # 依 UTF-8 逐段解碼（多位元組字元可能被切在兩個 chunk 之間）
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    async for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+
+def _as_records(value: Any, label: str) -> List[Any]:
+    # 一個 JSON 值可為單一 record 或 record list（與 batch_runner 相同）
+    values = value if isinstance(value, list) else [value]
+    return [v if isinstance(v, dict) else InvalidRecord(f"{label}不是 JSON object") for v in values]
+
+
+async def _iter_lines(head: str, texts: AsyncIterator[str]) -> AsyncIterator[str]:
+    buffer = head
+    while True:
+        *lines, buffer = buffer.split('\n')
+        for line in lines:
+            yield line
+        text = await anext(texts, None)
+        if text is None:
+            break
+        buffer += text
+    yield buffer
+
+
+async def _iter_array(head: str, texts: AsyncIterator[str]) -> AsyncIterator[Any]:
+    """
+    逐一解析 JSON array 的元素（head 以 '[' 開頭），只保留尚未解析的部分
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos, index = head, 1, 0
+    expect_value = True
+    while True:
+        while pos < len(buffer) and buffer[pos].isspace():
+            pos += 1
+        if pos < len(buffer):
+            if buffer[pos] == ']' and (expect_value and index == 0 or not expect_value):
+                return
+            if not expect_value:
+                if buffer[pos] != ',':
+                    yield InvalidRecord(f"第 {index} 筆之後 JSON 格式錯誤")
+                    return
+                pos, expect_value = pos + 1, True
+                continue
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                value = end = None
+            if end is not None and end < len(buffer):
+                index += 1
+                for record in _as_records(value, f"第 {index} 筆"):
+                    yield record
+                pos, expect_value = end, False
+                continue
+        # 資料不足（或元素剛好到 buffer 結尾，可能尚未完整）：捨棄已解析的部分並讀取下一段
+        text = await anext(texts, None)
+        if text is None:
+            break
+        buffer, pos = buffer[pos:] + text, 0
+
+    yield InvalidRecord(f"第 {index + 1} 筆 JSON 格式錯誤或不完整")
+
+
+async def iter_records(chunks: AsyncIterator[bytes], content_type: str = '') -> AsyncIterator[Any]:
+    """
+    由 request body 的 chunk 逐筆解析 record（不保留整個 body）；無法解析的部分以 InvalidRecord 回傳：
+    - application/x-ndjson / application/jsonl：每行一個 record，格式錯誤的行各回一個 InvalidRecord 並繼續
+    - 其他：與 /process 相同的 JSON；record list 逐一解析元素，單一 record 或 NDJSON 則逐行解析
+      （第一行無法單獨解析時視為多行的單一 JSON）
+    """
+    ndjson = 'ndjson' in content_type or 'jsonl' in content_type
+    texts = _iter_text(chunks)
+    head = ''
+    async for text in texts:
+        head += text
+        if head.strip():
+            break
+    head = head.lstrip()
+    if not head:
+        return
+
+    if head[0] == '[' and not ndjson:
+        async for record in _iter_array(head, texts):
+            yield record
+        return
+
+    lines = _iter_lines(head, texts)
+    lineno = 0
+    async for line in lines:
+        lineno += 1
+        if not line.strip():
+            continue
+        try:
+            value = json.loads(line)
+        except ValueError as e:
+            if ndjson or lineno > 1:
+                yield InvalidRecord(f"第 {lineno} 行 JSON 格式錯誤: {e}")
+                continue
+            # 多行排版的單一 JSON：讀取其餘內容後一次解析
+            text = '\n'.join([line] + [rest async for rest in lines])
+            try:
+                value = json.loads(text)
+            except ValueError as e:
+                yield InvalidRecord(f"JSON 格式錯誤: {e}")
+                return
+        for record in _as_records(value, f"第 {lineno} 行"):
+            yield record
+
+
+def process_entries(entries: List[Any], deadline: Optional[float] = None) -> List[str]:
+    """
+    處理一個 window：record 交由 process_window，InvalidRecord 於原位置輸出 error 行
+    """
+    records = [entry for entry in entries if not isinstance(entry, InvalidRecord)]
+    lines = iter(process_window(records, deadline) if records else [])
+    return [
+        json.dumps({'record_id': None, 'error': entry.error}, ensure_ascii=False) + '\n'
+        if isinstance(entry, InvalidRecord) else next(lines)
+        for entry in entries
+    ]
+
+
+async def stream_reports(records: AsyncIterator[Any], window: int,
+                         deadline: Optional[float] = None) -> AsyncIterator[str]:
+    """
+    每累積 window 筆 record 即送出處理；下一個 window 處理時同時輸出前一個 window 的結果，
+    記憶體中最多同時保留兩個 window（request body 於需要下一筆 record 時才繼續讀取）
+    """
+    pending: Optional[asyncio.Future] = None
+    batch: List[Any] = []
+
+    async def submit(batch: List[Any]):
+        nonlocal pending
+        task = asyncio.ensure_future(run_in_threadpool(process_entries, batch, deadline))
+        if pending is not None:
+            for line in await pending:
+                yield line
+        pending = task
+
+    async for record in records:
+        batch.append(record)
+        if len(batch) >= window:
+            async for line in submit(batch):
+                yield line
+            batch = []
+
+    if batch:
+        async for line in submit(batch):
+            yield line
+    if pending is not None:
+        for line in await pending:
+            yield line
+
+
+class RequestStreamingResponse(StreamingResponse):
+    """
+    回應串流期間仍逐段讀取 request body 的 StreamingResponse：
+    不另外監聽 http.disconnect（否則會與讀取 body 爭用 receive），用戶端斷線時由讀取 body 或送出回應時結束
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        if self.background is not None:
+            await self.background()
+
+
+@router.post("/process/stream")
+async def process_stream_api(request: Request, deadline: Optional[float] = None, window: Optional[int] = None):
+    """
+    與 /process 相同的處理流程，但以 NDJSON 串流回傳：每個 record 一行 {record_id, report, degraded}，
+    處理失敗的 record 為 {record_id, error}，無法解析的輸入為 {record_id: null, error}。
+    輸入可為 /process 的 JSON，或 NDJSON（每行一個 record）；body 逐段讀取，不需一次載入。
+
+    window: 每批處理的 record 數（未提供時依 PROCESS_STREAM_WINDOW，預設 20）
+    deadline: 每個 window 的 LLM 改寫時間預算（秒；未提供時依 PROCESS_DEADLINE_SEC，0 表示不限制）
+    不寫出中間 CSV。
+    """
+    window = max(1, window or int(os.getenv('PROCESS_STREAM_WINDOW', '20')))
+    if deadline is None:
+        deadline = float(os.getenv('PROCESS_DEADLINE_SEC', '0')) or None
+
+    # request body 於串流回應時逐段讀取並解析，記憶體用量與 window 大小相關而與 body 大小無關
+    records = iter_records(request.stream(), request.headers.get('content-type', ''))
+    return RequestStreamingResponse(stream_reports(records, window, deadline), media_type='application/x-ndjson')
@@ -1,15 +1,15 @@
-import os
-import json
-import time
+import functools
+import pandas as pd
+from metrics import span
 
 
-# 印出執行時間
+# 記錄執行時間（pipeline_stage_seconds）；回傳 DataFrame 時一併記錄筆數（pipeline_stage_rows）
 def log_execution_time(func):
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        start_time = time.time()  # Start time before function call
-        result = func(*args, **kwargs)  # Call the actual function
-        end_time = time.time()  # End time after function call
-        execution_time = end_time - start_time  # Calculate execution time
-        print(f"{func.__name__} executed in {execution_time:.6f} seconds")
+        with span(func.__name__) as current:
+            result = func(*args, **kwargs)
+            if isinstance(result, pd.DataFrame):
+                current.rows = len(result)
         return result
     return wrapper